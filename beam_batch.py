@@ -0,0 +1,131 @@
+#!/usr/bin/env python3
+"""Batch driver: histogram many runs in parallel processes, then overlay them.
+
+The run list is a text file with one run per line, "t0 t1 label" (blank
+lines and # comments are skipped):
+
+    # t0                          t1                          label
+    2025-08-24T08:00:00-05:00     2025-08-24T23:59:00-05:00   2025-08-24
+    2025-08-26T08:00:00-05:00     2025-08-26T23:59:00-05:00   2025-08-26
+
+Every run is fetched, matched and histogrammed (beam_pipeline.load_histograms(),
+which also saves beam_hists_<label>.npz) in a process pool.
+The pool shares --connections concurrent IFBeam requests between its
+processes.  A failed run is retried --retries times (also when its process
+died) without stopping the others, and the runs that are done are drawn with
+the PLOT_PRODUCERS of --module (IFBeam_Analysis or TOF_CKOV):
+
+    python3 beam_batch.py runs.txt
+    python3 beam_batch.py runs.txt --module TOF_CKOV --processes 7 --connections 14
+"""
+import importlib
+import time
+import traceback
+from argparse import ArgumentParser as ap
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from concurrent.futures.process import BrokenProcessPool
+
+import beam_pipeline
+import ifbeam_fetch
+
+
+def read_run_list(path):
+    """[(t0, t1, label)] from a run list file"""
+    runs = []
+    with open(path) as fin:
+        for n, line in enumerate(fin, 1):
+            line = line.split("#", 1)[0].strip()
+            if not line:
+                continue
+            parts = line.replace(",", " ").split()
+            if len(parts) != 3:
+                raise ValueError(f"{path}:{n}: expected 't0 t1 label', got {line!r}")
+            runs.append(tuple(parts))
+    return runs
+
+
+def _init_worker(connections):
+    # each process gets its share of the IFBeam connections
+    ifbeam_fetch.set_max_workers(connections)
+
+
+def process_run(t0, t1, label):
+    """Histograms of one run, in a worker process"""
+    start = time.perf_counter()
+    hists = beam_pipeline.load_histograms(t0, t1, label)
+    return hists, time.perf_counter() - start
+
+
+def run_batch(runs, processes=4, connections=None, retries=2):
+    """{label: HistSet} of the runs that succeeded and {label: error} of those that did not"""
+    connections = connections or ifbeam_fetch.MAX_WORKERS
+    processes = max(1, min(processes, len(runs)))
+    per_process = max(1, connections // processes)
+    attempts = {label: 0 for _, _, label in runs}
+    todo = list(runs)
+    results, errors = {}, {}
+
+    while todo:
+        with ProcessPoolExecutor(processes, initializer=_init_worker, initargs=(per_process,)) as pool:
+            futures = {pool.submit(process_run, *run): run for run in todo}
+            todo = []
+            try:
+                for future in as_completed(futures):
+                    run = futures[future]
+                    label = run[2]
+                    try:
+                        hists, seconds = future.result()
+                    except BrokenProcessPool:
+                        raise
+                    except Exception as e:
+                        del futures[future]
+                        attempts[label] += 1
+                        errors[label] = e
+                        print(f"WARNING: run {label} failed (attempt {attempts[label]}): {e!r}")
+                        if attempts[label] <= retries:
+                            todo.append(run)
+                        else:
+                            traceback.print_exception(type(e), e, e.__traceback__)
+                        continue
+                    del futures[future]
+                    errors.pop(label, None)
+                    results[label] = hists
+                    print(f"run {label}: {hists.meta.get('entries', 0)} TOFs in {seconds:.1f} s")
+            except BrokenProcessPool as e:
+                # a worker died: every run still in flight is charged one attempt
+                for run in futures.values():
+                    label = run[2]
+                    attempts[label] += 1
+                    errors[label] = e
+                    if attempts[label] <= retries:
+                        todo.append(run)
+                print(f"WARNING: worker process died, resubmitting {len(todo)} runs")
+    return results, errors
+
+
+if __name__ == "__main__":
+    parser = ap()
+    parser.add_argument("run_list", type=str, help="file with one 't0 t1 label' per line")
+    parser.add_argument("--module", type=str, default="IFBeam_Analysis",
+                        help="analysis script whose PLOT_PRODUCERS draw the runs")
+    parser.add_argument("--processes", type=int, default=4)
+    parser.add_argument("--connections", type=int, default=ifbeam_fetch.MAX_WORKERS,
+                        help="concurrent IFBeam requests, shared by all processes")
+    parser.add_argument("--retries", type=int, default=2)
+    args = parser.parse_args()
+
+    runs = read_run_list(args.run_list)
+    start = time.perf_counter()
+    results, errors = run_batch(runs, args.processes, args.connections, args.retries)
+    print(f"{len(results)}/{len(runs)} runs done in {time.perf_counter() - start:.1f} s")
+
+    # overlay in the order of the run list
+    module = importlib.import_module(args.module)
+    import matplotlib.pyplot as plt
+    done = [results[label] for _, _, label in runs if label in results]
+    colors = [plt.get_cmap("tab10")(i % 10) for i in range(len(done))]
+    if done:
+        for producer in module.PLOT_PRODUCERS:
+            producer(done, colors)
+    for label, e in errors.items():
+        print(f"ERROR: run {label} not processed: {e!r}")
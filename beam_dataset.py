@@ -0,0 +1,120 @@
+"""Beam info columns of one time range, computed when first used.
+
+BEAMINFO_DTYPE lists the columns of a beam info record (FIELDS, in the order
+of the BeamInfo_from_ifbeam() tuples).  A LazyBeamDataset maps every column
+to the ColumnGroup that computes it and fetches the IFBeam variables of a
+column only when the column is first used, so a TOF-only study does not
+download the Cherenkov and momentum data (beam_pipeline builds the groups):
+
+    ds = beam_pipeline.lazy_beaminfo(t0, t1)
+    tofs = ds["tof"]
+"""
+import contextlib
+
+import numpy as np
+
+# Columns of a beam info record, in the order of the BeamInfo_from_ifbeam() tuples
+BEAMINFO_DTYPE = np.dtype([
+    ("run", np.int64), ("evt", np.int64), ("t", np.int64), ("mom", np.float64),
+    ("tof", np.float64),
+    ("ckov1_trig", np.int64), ("ckov2_trig", np.int64),
+    ("ckov1_press", np.float64), ("ckov2_press", np.float64),
+    ("xcet1_sec", np.int64), ("xcet1_frac", np.int64), ("xcet1_coarse", np.int64),
+    ("xcet2_sec", np.int64), ("xcet2_frac", np.int64), ("xcet2_coarse", np.int64),
+    ("ckov1_status", np.int8), ("ckov1_delta", np.float64),
+    ("ckov2_status", np.int8), ("ckov2_delta", np.float64),
+    ("momentum_ref", np.float64), ("momentum_meas", np.float64), ("momentum_diff", np.float64),
+])
+FIELDS = BEAMINFO_DTYPE.names
+
+
+def new_beaminfo(n):
+    """Zero-filled beam info record with n rows"""
+    return np.zeros(n, dtype=BEAMINFO_DTYPE)
+
+
+def fill_by_index(column, values):
+    """column[i] = values[i] for the entries both have; the rest stays as is"""
+    m = min(len(column), len(values))
+    column[:m] = values[:m]
+
+
+class ColumnGroup:
+    """Columns computed together from the same IFBeam variables.
+
+    compute(ds) returns {column: array} for `columns`; it may read other
+    columns of ds (listed in `needs`, so that their variables are fetched in
+    the same round of requests).
+    """
+
+    def __init__(self, columns, var_names, compute, needs=()):
+        self.columns = list(columns)
+        self.var_names = list(var_names)
+        self.compute = compute
+        self.needs = list(needs)
+
+
+class LazyBeamDataset:
+    """Beam info of one time range whose columns are fetched on first access.
+
+    Each column belongs to a ColumnGroup that declares the IFBeam variables it
+    depends on.  ds["tof"] fetches only the trigger and XBTF counters; a
+    Cherenkov or momentum column adds its own variables.  Computed columns are
+    kept, so every column is fetched and matched at most once.  Columns of
+    FIELDS that no group computes are zero.  prefetch(t0, t1, var_names) is
+    called with all variables a request needs, before any of them is computed,
+    and its result is entered as a context around the computation.
+    """
+
+    def __init__(self, t0, t1, label, groups, prefetch=None, length_column="tof", columns=None):
+        self.t0 = t0
+        self.t1 = t1
+        self.label = label
+        self.groups = {name: g for g in groups for name in g.columns}
+        self.prefetch = prefetch
+        self.length_column = length_column
+        self._columns = {} if columns is None else columns
+
+    def __len__(self):
+        return len(self[self.length_column])
+
+    def __getitem__(self, name):
+        if name not in self._columns:
+            self.load([name])
+        return self._columns[name]
+
+    def _pending(self, names, out):
+        for name in names:
+            g = self.groups.get(name)
+            if g is None or name in self._columns or g in out:
+                continue
+            self._pending(g.needs, out)
+            out.append(g)
+        return out
+
+    def var_names(self, names):
+        """IFBeam variables still to be fetched for the columns in names"""
+        return list(dict.fromkeys(v for g in self._pending(names, []) for v in g.var_names))
+
+    def load(self, names):
+        """Compute the columns in names (and what they need) with one round of fetches"""
+        pending = self._pending(names, [])
+        scope = contextlib.nullcontext()
+        if self.prefetch is not None and pending:
+            scope = self.prefetch(self.t0, self.t1, self.var_names(names))
+        with scope:
+            for g in pending:
+                if g.columns[0] not in self._columns:
+                    self._columns.update(g.compute(self))
+        for name in names:
+            if name not in self._columns and name in FIELDS:
+                self._columns[name] = np.zeros(len(self), dtype=BEAMINFO_DTYPE[name])
+
+    @property
+    def info(self):
+        """All columns as a BEAMINFO_DTYPE structured array (fetches everything)"""
+        self.load(list(FIELDS))
+        info = new_beaminfo(len(self))
+        for name in FIELDS:
+            info[name] = self._columns[name]
+        return info
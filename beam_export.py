@@ -0,0 +1,262 @@
+#!/usr/bin/env python3
+"""Columnar export of the matched beam info, partitioned by run label and day.
+
+One row per TOF match: the GeneralTrigger time of the TOF (trig_ns, ns since
+the epoch, and trig_sub_ns) and the trigger-matched BeamInfo columns (TOF,
+CKOV counts, pressures, status and deltas, momenta).  Rows are
+written under
+
+    <root>/label=<run label>/day=<YYYY-MM-DD>/part-<first trig_ns>-<last trig_ns>.<ext>
+
+where the day is the trigger day in the UTC offset of the run's t0, so the
+tree can also be opened directly with pyarrow.dataset or pandas (hive
+partitioning).  Exporting a label again over an overlapping window replaces
+its rows: once the new parts are written, the rows of the older parts of the
+label that fall in the trigger range of the new export are dropped
+(drop_rows), so no trigger is stored twice.
+
+    arrow    Arrow IPC file, uncompressed: read back memory-mapped, zero copy
+    parquet  compressed, smallest on disk, decompressed when read
+    npy      one .npy file per column in a part-<..> directory, memory-mapped
+             with numpy alone (the default when pyarrow is not installed)
+
+Reading back only touches the requested columns:
+
+    import beam_export
+    cols = beam_export.read_columns("beam_tables", ["trig_ns", "tof"], labels=["2025-08-24"])
+
+Export runs with beam_pipeline.fill_histograms (also saves beam_hists_<label>.npz),
+or export the runs of the analysis scripts while they are histogrammed:
+
+    python3 beam_export.py write 2025-08-24T08:00:00-05:00 2025-08-24T11:08:30-05:00 2025-08-24
+    BEAM_EXPORT_DIR=beam_tables BEAM_EXPORT_FORMAT=parquet python3 TOF_CKOV.py
+    python3 beam_export.py list beam_tables
+"""
+import os
+import sys
+from argparse import ArgumentParser as ap
+from datetime import datetime
+
+import numpy as np
+
+from beam_dataset import BEAMINFO_DTYPE, FIELDS
+
+try:
+    import pyarrow as pa
+    import pyarrow.ipc
+    import pyarrow.parquet as pq
+except ImportError:
+    pa = None
+
+EXPORT_DIR = "beam_tables"
+# run/evt/t/mom are not filled from IFBeam, and the raw xcetN_* hits are paired
+# with the TOFs by index, not by trigger
+BEAMINFO_COLUMNS = tuple(f for f in FIELDS[FIELDS.index("tof"):] if not f.startswith("xcet"))
+COLUMNS = ("trig_ns", "trig_sub_ns") + BEAMINFO_COLUMNS
+DTYPES = dict([("trig_ns", np.dtype(np.int64)), ("trig_sub_ns", np.dtype(np.float32))] +
+              [(name, BEAMINFO_DTYPE[name]) for name in BEAMINFO_COLUMNS])
+EXTENSIONS = {"arrow": ".arrow", "parquet": ".parquet", "npy": ""}
+DEFAULT_FORMAT = "arrow" if pa is not None else "npy"
+
+
+def beam_table(ds):
+    """{column: array} of the export columns of a LazyBeamDataset"""
+    trig = ds["trig_times"]
+    table = {"trig_ns": np.asarray(trig.ns, dtype=np.int64),
+             "trig_sub_ns": np.asarray(trig.sub_ns, dtype=np.float32)}
+    for name in BEAMINFO_COLUMNS:
+        table[name] = np.asarray(ds[name], dtype=DTYPES[name])
+    return table
+
+
+def utc_offset_ns(like):
+    """UTC offset of an ISO 8601 time in ns (0 without one)"""
+    if not isinstance(like, str):
+        return 0
+    try:
+        offset = datetime.fromisoformat(like.replace("Z", "+00:00")).utcoffset()
+    except ValueError:
+        return 0
+    return 0 if offset is None else int(offset.total_seconds())*1000000000
+
+
+def trigger_days(trig_ns, like=None):
+    """YYYY-MM-DD of every trigger time, in the UTC offset of `like`"""
+    local = np.asarray(trig_ns, dtype=np.int64) + utc_offset_ns(like)
+    return local.astype("datetime64[ns]").astype("datetime64[D]").astype(str)
+
+
+def label_name(label):
+    """label as it appears in the label=<..> directory"""
+    return str(label).replace("/", "_").replace(os.sep, "_")
+
+
+def partition_dir(root, label, day):
+    return os.path.join(root, f"label={label_name(label)}", f"day={day}")
+
+
+def check_format(fmt):
+    fmt = fmt or DEFAULT_FORMAT
+    if fmt not in EXTENSIONS:
+        raise ValueError(f"unknown export format {fmt!r}, use one of {list(EXTENSIONS)}")
+    if fmt != "npy" and pa is None:
+        raise ImportError(f"the {fmt} format needs pyarrow (pip install pyarrow), or use fmt='npy'")
+    return fmt
+
+
+def part_name(trig_ns, fmt):
+    """part-<first>-<last trigger time>: only an export of the same triggers has the same name"""
+    return f"part-{trig_ns.min()}-{trig_ns.max()}{EXTENSIONS[fmt]}"
+
+
+def _write_part(table, path, fmt):
+    tmp = f"{path}.{os.getpid()}.tmp"
+    if fmt == "npy":
+        os.makedirs(tmp, exist_ok=True)
+        for name, values in table.items():
+            np.save(os.path.join(tmp, name + ".npy"), values)
+        if os.path.isdir(path):
+            _remove_part(path)
+    else:
+        t = pa.table({name: pa.array(values) for name, values in table.items()})
+        if fmt == "arrow":
+            with pa.OSFile(tmp, "wb") as sink, pa.ipc.new_file(sink, t.schema) as writer:
+                writer.write_table(t)
+        else:
+            pq.write_table(t, tmp)
+    os.replace(tmp, path)
+
+
+def write_table(table, root=EXPORT_DIR, label="", like=None, fmt=None):
+    """Write the rows of table into the day partitions of label; returns the part paths"""
+    fmt = check_format(fmt)
+    if len(table["trig_ns"]) == 0:
+        return []
+    days = trigger_days(table["trig_ns"], like)
+    paths = []
+    for day in np.unique(days):
+        rows = np.flatnonzero(days == day)
+        part = {name: np.ascontiguousarray(table[name][rows]) for name in COLUMNS}
+        directory = partition_dir(root, label, day)
+        os.makedirs(directory, exist_ok=True)
+        path = os.path.join(directory, part_name(part["trig_ns"], fmt))
+        _write_part(part, path, fmt)
+        paths.append(path)
+    return paths
+
+
+def drop_rows(root, label, lo_ns, hi_ns, keep_paths=()):
+    """Remove the rows with lo_ns <= trig_ns <= hi_ns from the parts of label
+    other than keep_paths (the parts of a newer export); returns the number of
+    rows removed.  Parts left empty are deleted, the others rewritten."""
+    keep_paths = set(keep_paths)
+    removed = 0
+    for _, _, path in parts(root, [label_name(label)]):
+        if path in keep_paths:
+            continue
+        trig_ns = read_part(path, ["trig_ns"])["trig_ns"]
+        drop = (trig_ns >= lo_ns) & (trig_ns <= hi_ns)
+        n = int(np.count_nonzero(drop))
+        if n == 0:
+            continue
+        removed += n
+        if n < len(trig_ns):
+            # the kept rows are outside [lo_ns, hi_ns], so their new name is not one of keep_paths
+            table = {name: np.array(values[~drop]) for name, values in read_part(path).items()}
+            fmt = "npy" if os.path.isdir(path) else ("parquet" if path.endswith(".parquet") else "arrow")
+            new_path = os.path.join(os.path.dirname(path), part_name(table["trig_ns"], fmt))
+            _write_part(table, new_path, fmt)
+            if new_path == path:
+                continue
+        _remove_part(path)
+    return removed
+
+
+def _remove_part(path):
+    if os.path.isdir(path):
+        for f in os.listdir(path):
+            os.remove(os.path.join(path, f))
+        os.rmdir(path)
+    else:
+        os.remove(path)
+
+
+def parts(root=EXPORT_DIR, labels=None, days=None):
+    """[(label, day, path)] of the part files under root, in label, day, time order"""
+    out = []
+    if not os.path.isdir(root):
+        return out
+    for label_dir in sorted(os.listdir(root)):
+        label = label_dir.partition("label=")[2]
+        if not label or (labels is not None and label not in labels):
+            continue
+        for day_dir in sorted(os.listdir(os.path.join(root, label_dir))):
+            day = day_dir.partition("day=")[2]
+            if not day or (days is not None and day not in days):
+                continue
+            directory = os.path.join(root, label_dir, day_dir)
+            names = [f for f in os.listdir(directory) if f.startswith("part-") and not f.endswith(".tmp")]
+            names.sort(key=lambda f: int(f[5:].split(".")[0].split("-")[0]))
+            out.extend((label, day, os.path.join(directory, f)) for f in names)
+    return out
+
+
+def read_part(path, columns=None):
+    """{column: array} of one part file; arrow and npy parts are memory-mapped"""
+    columns = list(COLUMNS if columns is None else columns)
+    if os.path.isdir(path):
+        return {name: np.load(os.path.join(path, name + ".npy"), mmap_mode="r") for name in columns}
+    if pa is None:
+        raise ImportError(f"reading {path} needs pyarrow (pip install pyarrow)")
+    if path.endswith(".parquet"):
+        t = pq.read_table(path, columns=columns, memory_map=True)
+    else:
+        t = pa.ipc.open_file(pa.memory_map(path, "r")).read_all().select(columns)
+    out = {}
+    for name in columns:
+        col = t.column(name)
+        out[name] = col.chunk(0).to_numpy() if col.num_chunks == 1 else col.to_numpy()
+    return out
+
+
+def read_columns(root=EXPORT_DIR, columns=None, labels=None, days=None):
+    """{column: array} of the requested columns over every matching part,
+    concatenated in label, day, time order"""
+    columns = list(COLUMNS if columns is None else columns)
+    pieces = {name: [] for name in columns}
+    for _, _, path in parts(root, labels, days):
+        for name, values in read_part(path, columns).items():
+            pieces[name].append(values)
+    return {name: np.concatenate(v) if v else np.zeros(0, dtype=DTYPES[name])
+            for name, v in pieces.items()}
+
+
+if __name__ == "__main__":
+    parser = ap()
+    sub = parser.add_subparsers(dest="command", required=True)
+    w = sub.add_parser("write", help="fetch, match and export one run")
+    w.add_argument("t0", type=str)
+    w.add_argument("t1", type=str)
+    w.add_argument("label", type=str)
+    w.add_argument("--root", type=str, default=EXPORT_DIR)
+    w.add_argument("--format", type=str, default=None, choices=list(EXTENSIONS))
+    ls = sub.add_parser("list", help="partitions and rows under a root")
+    ls.add_argument("root", type=str, nargs="?", default=EXPORT_DIR)
+    args = parser.parse_args()
+
+    if args.command == "write":
+        check_format(args.format)
+        import beam_pipeline          # which imports this module
+        hists = beam_pipeline.fill_histograms(args.t0, args.t1, args.label,
+                                              export_dir=args.root, export_format=args.format)
+        hists.save(f"beam_hists_{args.label}.npz")
+        print(f"{args.label}: {hists.meta.get('entries', 0)} rows exported to {args.root}")
+    else:
+        rows = {}
+        for label, day, path in parts(args.root):
+            rows[(label, day)] = rows.get((label, day), 0) + len(read_part(path, ["trig_ns"])["trig_ns"])
+        for (label, day), n in rows.items():
+            print(f"{label:>20} {day} {n:10d}")
+        if not rows:
+            print(f"no exported tables under {args.root}")
+            sys.exit(1)
@@ -0,0 +1,239 @@
+#!/usr/bin/env python3
+"""Streaming, mergeable histograms of the beam info.
+
+Instead of keeping every TOF, pressure and momentum value until the plots are
+made, the values are histogrammed chunk by chunk and thrown away:
+
+    hists = beam_histograms(label)
+    for chunk in ...:                  # e.g. one BeamInfo per IFBeam shard
+        hists.fill(chunk)
+    hists.save("beam_hists_2025-08-24.npz")
+
+Histograms with the same binning add up, so runs, shards or processes can be
+merged (hists += other, or merge_files()), and the plots are drawn from the
+saved files alone.
+
+    Hist        fixed bin edges, 1D or 2D (np.histogram/np.histogram2d semantics)
+    SparseHist  1D with a fixed bin width and no fixed range, for values with
+                no known range (Cherenkov counts and pressures)
+
+Files are compressed .npz with plain arrays only:
+
+    python3 beam_hist.py merge all.npz beam_hists_2025-08-24.npz beam_hists_2025-08-28.npz
+"""
+import json
+import sys
+
+import numpy as np
+
+TOF_EDGES = np.linspace(60, 90, 61)
+MOMENTUM_EDGES = np.linspace(0.05, 12, 100)
+MOMENTUM_2D_EDGES = np.linspace(0.05, 12, 24)
+TOF_2D_EDGES = np.linspace(60, 90, 301)
+
+
+class Hist:
+    """Histogram with fixed bin edges in one or two dimensions"""
+
+    kind = "hist"
+
+    def __init__(self, *edges, counts=None):
+        self.edges = [np.asarray(e, dtype=np.float64) for e in edges]
+        shape = tuple(len(e) - 1 for e in self.edges)
+        self.counts = np.zeros(shape) if counts is None else np.asarray(counts, dtype=np.float64)
+
+    @property
+    def ndim(self):
+        return len(self.edges)
+
+    @property
+    def total(self):
+        return self.counts.sum()
+
+    def fill(self, *values, weights=None):
+        """Add values (one array per dimension); values outside the edges are dropped"""
+        values = [np.asarray(v, dtype=np.float64) for v in values]
+        if len(values[0]) == 0:
+            return
+        if self.ndim == 1:
+            h, _ = np.histogram(values[0], bins=self.edges[0], weights=weights)
+        else:
+            h, _, _ = np.histogram2d(values[0], values[1], bins=self.edges, weights=weights)
+        self.counts += h
+
+    def __iadd__(self, other):
+        if other.kind != self.kind or len(other.edges) != self.ndim or \
+                not all(np.array_equal(a, b) for a, b in zip(self.edges, other.edges)):
+            raise ValueError("cannot merge histograms with different binning")
+        self.counts += other.counts
+        return self
+
+    def centers(self, axis=0):
+        e = self.edges[axis]
+        return 0.5*(e[:-1] + e[1:])
+
+    def to_arrays(self):
+        arrays = {"counts": self.counts}
+        arrays.update({f"edges{k}": e for k, e in enumerate(self.edges)})
+        return arrays
+
+    @classmethod
+    def from_arrays(cls, arrays):
+        edges = [arrays[f"edges{k}"] for k in range(arrays["counts"].ndim)]
+        return cls(*edges, counts=arrays["counts"])
+
+
+class SparseHist:
+    """1D histogram with bins [k*width, (k+1)*width) for any integer k"""
+
+    kind = "sparse"
+
+    def __init__(self, width, bins=None, counts=None):
+        self.width = float(width)
+        self.bins = np.zeros(0, dtype=np.int64) if bins is None else np.asarray(bins, dtype=np.int64)
+        self.counts = np.zeros(0) if counts is None else np.asarray(counts, dtype=np.float64)
+
+    @property
+    def total(self):
+        return self.counts.sum()
+
+    def _add(self, bins, counts):
+        bins, inverse = np.unique(np.concatenate([self.bins, bins]), return_inverse=True)
+        self.counts = np.bincount(inverse, np.concatenate([self.counts, counts]), len(bins))
+        self.bins = bins
+
+    def fill(self, values):
+        values = np.asarray(values, dtype=np.float64)
+        values = values[np.isfinite(values)]
+        if len(values) == 0:
+            return
+        bins, counts = np.unique(np.floor(values/self.width).astype(np.int64), return_counts=True)
+        self._add(bins, counts)
+
+    def __iadd__(self, other):
+        if other.kind != self.kind or other.width != self.width:
+            raise ValueError("cannot merge histograms with different binning")
+        self._add(other.bins, other.counts)
+        return self
+
+    def to_hist(self, nbins=50):
+        """Hist over the occupied range with at most nbins bins, each a whole
+        number of the fine bins"""
+        if len(self.bins) == 0:
+            return Hist(np.array([0.0, self.width]))
+        lo, hi = self.bins[0], self.bins[-1] + 1
+        group = max(int(np.ceil((hi - lo)/nbins)), 1)
+        n = int(np.ceil((hi - lo)/group))
+        counts = np.bincount((self.bins - lo)//group, self.counts, n)
+        return Hist((lo + group*np.arange(n + 1))*self.width, counts=counts)
+
+    def to_arrays(self):
+        return {"bins": self.bins, "counts": self.counts, "width": np.array(self.width)}
+
+    @classmethod
+    def from_arrays(cls, arrays):
+        return cls(float(arrays["width"]), arrays["bins"], arrays["counts"])
+
+
+HIST_KINDS = {"hist": Hist, "sparse": SparseHist}
+
+
+class HistSet:
+    """Named histograms of one run, with metadata (label, time range, ...)"""
+
+    def __init__(self, hists, **meta):
+        self.hists = hists
+        self.meta = meta
+
+    @property
+    def label(self):
+        return self.meta.get("label", "")
+
+    def __getitem__(self, name):
+        return self.hists[name]
+
+    def fill(self, info):
+        """Fill from a BeamInfo structured array (see beam_dataset.BEAMINFO_DTYPE)"""
+        for name, h in self.hists.items():
+            if name == "tof_vs_momentum":
+                h.fill(info["momentum_meas"], info["tof"])
+            else:
+                h.fill(info[name])
+        self.meta["entries"] = self.meta.get("entries", 0) + len(info)
+
+    def same_binning(self, other):
+        """True if other has the same histograms, binned the same way"""
+        if self.hists.keys() != other.hists.keys():
+            return False
+        for name, h in self.hists.items():
+            o = other.hists[name]
+            if o.kind != h.kind:
+                return False
+            if h.kind == "sparse":
+                if o.width != h.width:
+                    return False
+            elif len(o.edges) != len(h.edges) or \
+                    not all(np.array_equal(a, b) for a, b in zip(h.edges, o.edges)):
+                return False
+        return True
+
+    def __iadd__(self, other):
+        for name, h in other.hists.items():
+            if name in self.hists:
+                self.hists[name] += h
+            else:
+                self.hists[name] = h
+        self.meta["entries"] = self.meta.get("entries", 0) + other.meta.get("entries", 0)
+        return self
+
+    def save(self, path):
+        arrays = {"meta": np.array(json.dumps(self.meta))}
+        for name, h in self.hists.items():
+            arrays[f"{name}/kind"] = np.array(h.kind)
+            arrays.update({f"{name}/{k}": v for k, v in h.to_arrays().items()})
+        np.savez_compressed(path, **arrays)
+
+    @classmethod
+    def load(cls, path):
+        with np.load(path, allow_pickle=False) as f:
+            meta = json.loads(str(f["meta"]))
+            grouped = {}
+            for key in f.files:
+                if "/" in key:
+                    name, field = key.rsplit("/", 1)
+                    grouped.setdefault(name, {})[field] = f[key]
+        hists = {name: HIST_KINDS[str(a.pop("kind"))].from_arrays(a) for name, a in grouped.items()}
+        return cls(hists, **meta)
+
+
+def beam_histograms(label="", **meta):
+    """Empty HistSet with the binning of the IFBeam_Analysis plots"""
+    hists = {"tof": Hist(TOF_EDGES)}
+    for n in (1, 2):
+        hists[f"ckov{n}_trig"] = SparseHist(1.0)
+        hists[f"ckov{n}_press"] = SparseHist(1e-3)
+    for name in ("momentum_ref", "momentum_meas", "momentum_diff"):
+        hists[name] = Hist(MOMENTUM_EDGES)
+    hists["tof_vs_momentum"] = Hist(MOMENTUM_2D_EDGES, TOF_2D_EDGES)
+    return HistSet(hists, label=label, **meta)
+
+
+def merge_files(paths, label=None):
+    """One HistSet with the sum of the histograms in paths"""
+    merged = None
+    for path in paths:
+        hs = HistSet.load(path)
+        if merged is None:
+            merged = hs
+        else:
+            merged += hs
+    if merged is not None and label is not None:
+        merged.meta["label"] = label
+    return merged
+
+
+if __name__ == "__main__":
+    if len(sys.argv) < 4 or sys.argv[1] != "merge":
+        print("usage: beam_hist.py merge OUTPUT.npz INPUT.npz [INPUT.npz ...]")
+        sys.exit(1)
+    merge_files(sys.argv[3:]).save(sys.argv[2])
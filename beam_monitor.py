@@ -0,0 +1,269 @@
+#!/usr/bin/env python3
+"""Live monitor of the beam instrumentation during beam shifts.
+
+Instead of rerunning TOF_CKOV.py with a new t1, the monitor polls IFBeam
+every `interval` seconds and keeps the shift histograms (beam_hist) and the
+TOF_CKOV.py plots up to date:
+
+  * only the rows logged since the last high-water mark are fetched, straight
+    from the server (the cache would serve recent hours up to 5 minutes old);
+    `settle` seconds before the mark are asked again to pick up late rows,
+    and rows already seen are dropped by their logging time
+  * a trigger is matched once it is `settle` seconds older than the fetched
+    data, so all of its hits (logged at the end of the spill) are in
+  * the TOF matching and XCET association run on the new triggers only,
+    against the hits of the last `overlap` seconds, so a refresh costs in
+    proportion to the new data and not to the length of the shift
+
+Hits are decoded with ifbeam_time.decode_times() like in the batch code, so
+the zero padding of the rows is dropped the same way.
+
+    python3 beam_monitor.py                               # from now on, every 30 s
+    python3 beam_monitor.py --start 2025-08-24T08:00:00-05:00 --interval 10 --recent 15
+"""
+import time
+from argparse import ArgumentParser as ap
+from collections import deque
+
+import numpy as np
+
+import beam_hist
+import ifbeam_cache
+import ifbeam_csv
+import ifbeam_fetch
+import ifbeam_time
+import tof_matcher
+import beam_pipeline
+from beam_dataset import new_beaminfo
+import TOF_CKOV
+
+IFBEAM_EVENT = beam_pipeline.IFBEAM_EVENT
+TRIGGER = "dip/acc/NORTH/NP02/BI/TDC/GeneralTrigger"
+TOF_COUNTERS = ["dip/acc/NORTH/NP02/BI/XTOF/" + name
+                for name in ['XBTF022638A', 'XBTF022638B', 'XBTF022670A', 'XBTF022670B']]
+XCET_DEVICES = ["XCET021667", "XCET021669"]
+MOMENTUM_PREFIX = "dip/acc/NORTH/NP02/POW/CALC/MOMENTUM:"
+
+
+def _empty_times():
+    return ifbeam_time.CounterTimes(np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.float32))
+
+
+def _concat_times(a, b):
+    return ifbeam_time.CounterTimes(np.concatenate([a.ns, b.ns]), np.concatenate([a.sub_ns, b.sub_ns]))
+
+
+def _select_rows(rv, keep):
+    """RaggedValues with only the rows where keep is True"""
+    counts = rv.counts[keep]
+    offsets = np.zeros(len(counts) + 1, dtype=np.int64)
+    np.cumsum(counts, out=offsets[1:])
+    return ifbeam_csv.RaggedValues(rv.values[keep[rv.row_of_value()]], offsets, rv.clock_ms[keep])
+
+
+class BeamMonitor:
+    """Incremental BeamInfo histograms of a beam shift"""
+
+    def __init__(self, start, label="shift", delta_trig=60.0, offset=0.0, lag=10.0,
+                 settle=10.0, overlap=1.0, recent=None):
+        self.start = start
+        self.delta_trig = delta_trig
+        self.offset = offset
+        self.lag = lag
+        self.settle = settle
+        self.overlap = overlap
+        self.hwm = ifbeam_cache.to_epoch(start)    # rows logged before this are fetched
+        self.done = self.hwm                       # triggers before this are histogrammed
+
+        self.groups = {}                           # hit stream -> its seconds/coarse/frac variables
+        for prefix in [TRIGGER] + TOF_COUNTERS:
+            self.groups[prefix] = [prefix + ":seconds[]", prefix + ":coarse[]", prefix + ":frac[]"]
+        for dev in XCET_DEVICES:
+            self.groups[dev] = beam_pipeline.xcet_var_names(dev)     # SECONDS, FRAC, COARSE
+        self.slow_vars = {}
+        for n, dev in enumerate(XCET_DEVICES, 1):
+            prefix = f"dip/acc/NORTH/NP02/BI/XCET/{dev}"
+            self.slow_vars[f"ckov{n}_trig"] = prefix + ":countsTrig"
+            self.slow_vars[f"ckov{n}_press"] = prefix + ":pressure"
+        self.slow_vars["momentum_ref"] = MOMENTUM_PREFIX + "momentum_ref"
+        self.slow_vars["momentum_meas"] = MOMENTUM_PREFIX + "momentum_meas"
+        self.var_names = [v for names in self.groups.values() for v in names] + \
+            list(self.slow_vars.values())
+
+        self.seen = {var: set() for var in self.var_names}     # logging times of rows taken
+        self.hits = {name: _empty_times() for name in self.groups}
+        self.slow = {var: (np.zeros(0, dtype=np.int64), np.zeros(0)) for var in self.slow_vars.values()}
+
+        self.hists = beam_hist.beam_histograms(label, t0=start)
+        self.recent = recent
+        self.recent_hists = deque()                # (poll time, HistSet of that poll)
+
+    # ---------------------------------------------------------------
+    # Ingest
+    # ---------------------------------------------------------------
+    def _new_rows(self, lines, var_names):
+        """New rows of var_names, restricted to logging times present in all of them
+        (a row still missing from one variable is taken at a later poll)"""
+        parsed = [ifbeam_csv.parse_csv_ragged(lines[v]) for v in var_names]
+        common = None
+        for var, rv in zip(var_names, parsed):
+            clocks = set(rv.clock_ms.tolist()) - self.seen[var]
+            common = clocks if common is None else common & clocks
+        out = []
+        for var, rv in zip(var_names, parsed):
+            keep = np.isin(rv.clock_ms, list(common))
+            # a row repeated in one response is taken once
+            _, first = np.unique(rv.clock_ms, return_index=True)
+            once = np.zeros(len(rv), dtype=bool)
+            once[first] = True
+            out.append(_select_rows(rv, keep & once))
+            self.seen[var] |= common
+        return out
+
+    def _ingest(self, lines):
+        n_rows = 0
+        for name, var_names in self.groups.items():
+            a, b, c = self._new_rows(lines, var_names)
+            n_rows += len(a)
+            if name in XCET_DEVICES:
+                seconds, frac, coarse = a.as_int(), b.as_int(), c.as_int()
+                new = ifbeam_time.decode_times(seconds, coarse, frac)
+            else:
+                seconds, coarse, frac = a.as_int(), b.as_int(), c.as_int()
+                offset = self.offset if name == TRIGGER else 0.0
+                new = ifbeam_time.decode_times(seconds, coarse, frac, offset=offset, stride=2)
+            self.hits[name] = _concat_times(self.hits[name], new)
+        for var in self.slow_vars.values():
+            (rv,) = self._new_rows(lines, [var])
+            n_rows += len(rv)
+            clock, values = self.slow[var]
+            self.slow[var] = (np.concatenate([clock, rv.clock_ms]),
+                              np.concatenate([values, rv.element(0)]))
+        return n_rows
+
+    def _asof(self, var, times_ms):
+        clock, values = self.slow[var]
+        rv = ifbeam_csv.RaggedValues(values, np.arange(len(values) + 1), clock)
+        return rv.asof(times_ms)
+
+    # ---------------------------------------------------------------
+    # Match, histogram, prune
+    # ---------------------------------------------------------------
+    def _process(self, t_from, t_to):
+        """BeamInfo of the triggers in (t_from, t_to], epoch seconds"""
+        lo = int(round(t_from*1e9))
+        hi = int(round(t_to*1e9))
+        trig = self.hits[TRIGGER]
+        trig = trig.take(np.flatnonzero((trig.ns > lo) & (trig.ns <= hi)))
+        tofs, idx = tof_matcher.match_tof_times(trig, [self.hits[c] for c in TOF_COUNTERS],
+                                                self.delta_trig, return_trigger=True)
+        ref = trig.take(idx)
+
+        info = new_beaminfo(len(tofs))
+        info["tof"] = tofs
+        for n, dev in enumerate(XCET_DEVICES, 1):
+            info[f"ckov{n}_status"], info[f"ckov{n}_delta"] = \
+                tof_matcher.associate_xcet(ref, self.hits[dev])
+        trig_ms = ref.ns // 1000000
+        for column, var in self.slow_vars.items():
+            info[column] = self._asof(var, trig_ms)
+        info["momentum_diff"] = info["momentum_meas"] - info["momentum_ref"]
+        return info, len(trig)
+
+    def _prune(self):
+        done_ns = int(round(self.done*1e9))
+        keep_ns = done_ns - int(self.overlap*1e9)
+        for name, times in self.hits.items():
+            # pending triggers, and the hits a pending trigger can still be matched to
+            limit = done_ns if name == TRIGGER else keep_ns
+            self.hits[name] = times.take(np.flatnonzero(times.ns > limit))
+        done_ms = int(self.done*1000)
+        for var, (clock, values) in self.slow.items():
+            # the value in effect at `done` and everything after it
+            before = np.flatnonzero(clock <= done_ms)
+            keep = clock > done_ms
+            if len(before):
+                keep[before[np.argmax(clock[before])]] = True
+            self.slow[var] = (clock[keep], values[keep])
+        refetch_ms = (self.hwm - self.settle)*1000
+        for var in self.seen:
+            self.seen[var] = {c for c in self.seen[var] if c >= refetch_ms}
+
+    # ---------------------------------------------------------------
+    # Poll
+    # ---------------------------------------------------------------
+    def poll(self, now=None):
+        """Fetch the rows logged up to now - lag and histogram the settled triggers.
+        Returns a dict with the numbers of this refresh, or None if nothing was done"""
+        now = time.time() if now is None else now
+        t1 = now - self.lag
+        if t1 <= self.hwm:
+            return None
+        tic = time.perf_counter()
+        lines = ifbeam_fetch.fetch_many(self.var_names, IFBEAM_EVENT,
+                                        ifbeam_cache.to_iso(self.hwm - self.settle, self.start),
+                                        ifbeam_cache.to_iso(t1, self.start), live=True)
+        failed = [var for var, res in lines.items() if isinstance(res, Exception)]
+        if failed:
+            # keep the high-water mark, the whole window is asked again next time
+            print(f"WARNING: could not fetch {len(failed)} variables ({lines[failed[0]]}), retrying later")
+            return None
+
+        n_rows = self._ingest(lines)
+        self.hwm = t1
+        t_done = t1 - self.settle
+        info, n_trig = self._process(self.done, t_done)
+        self.hists.fill(info)
+        self.hists.meta["t1"] = ifbeam_cache.to_iso(t_done, self.start)
+        if self.recent:
+            poll_hists = beam_hist.beam_histograms()
+            poll_hists.fill(info)
+            self.recent_hists.append((t_done, poll_hists))
+            while self.recent_hists[0][0] <= t_done - self.recent*60:
+                self.recent_hists.popleft()
+        self.done = t_done
+        self._prune()
+        return {"rows": n_rows, "triggers": n_trig, "tofs": len(info),
+                "seconds": time.perf_counter() - tic}
+
+    def recent_histograms(self):
+        """Sum of the histograms of the last `recent` minutes"""
+        hs = beam_hist.beam_histograms(f"last {self.recent:g} min")
+        for _, h in self.recent_hists:
+            hs += h
+        return hs
+
+    def runs(self):
+        return [self.hists, self.recent_histograms()] if self.recent else [self.hists]
+
+
+if __name__ == "__main__":
+    parser = ap()
+    parser.add_argument("--start", type=str, help="start of the shift (ISO 8601, default: now)")
+    parser.add_argument("--label", type=str, default="shift")
+    parser.add_argument("--interval", type=float, default=30.0, help="seconds between refreshes")
+    parser.add_argument("--lag", type=float, default=10.0, help="seconds given to IFBeam to log new data")
+    parser.add_argument("--settle", type=float, default=10.0,
+                        help="seconds a trigger waits for the rows of its spill")
+    parser.add_argument("--recent", type=float, help="also plot the last RECENT minutes")
+    parser.add_argument("--delta-trig", type=float, default=60.0)
+    parser.add_argument("--offset", type=float, default=0.0)
+    parser.add_argument("--no-plots", action="store_true", help="only save the histograms")
+    args = parser.parse_args()
+
+    start = args.start or ifbeam_cache.to_iso(time.time() - args.lag - args.settle)
+    monitor = BeamMonitor(start, args.label, args.delta_trig, args.offset, args.lag,
+                          args.settle, recent=args.recent)
+    path = f"beam_hists_{args.label}.npz"
+    colors = ["blue", "red"]
+    while True:
+        stats = monitor.poll()
+        if stats is not None:
+            monitor.hists.save(path)
+            if not args.no_plots:
+                for producer in TOF_CKOV.PLOT_PRODUCERS:
+                    producer(monitor.runs(), colors)
+            print(f"{monitor.hists.meta['t1']}: {stats['rows']} rows, {stats['triggers']} triggers,"
+                  f" {stats['tofs']} TOFs in {stats['seconds']:.2f} s"
+                  f" ({monitor.hists.meta['entries']} TOFs this shift)")
+        time.sleep(args.interval)
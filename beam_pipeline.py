@@ -0,0 +1,344 @@
+"""IFBeam to beam histograms: the pipeline shared by IFBeam_Analysis.py and TOF_CKOV.py.
+
+BeamInfo columns are built from the IFBeam variables (lazily, per column
+group, see beam_dataset.LazyBeamDataset), TOF matching runs on the decoded
+counters (tof_matcher), and fill_histograms()/load_histograms() turn a run
+into the beam_hist histograms the plot producers of the two scripts draw:
+
+    import beam_pipeline
+    ds = beam_pipeline.lazy_beaminfo("2025-08-25T11:11:11-05:00", "2025-08-25T11:20:00-05:00")
+    hists = beam_pipeline.load_histograms(t0, t1, "2025-08-24")
+"""
+import os
+import time
+
+import numpy as np
+
+import beam_export
+import beam_hist
+import ifbeam_cache
+import ifbeam_csv
+import ifbeam_fetch
+import ifbeam_stats
+from ifbeam_fetch import fetch_ifbeam
+import ifbeam_time
+import tof_matcher
+from beam_dataset import ColumnGroup, LazyBeamDataset, fill_by_index
+
+IFBEAM_EVENT = "z,pdune"
+# rows are logged at most this long after their hits [s]; fill_histograms
+# reads this much around every shard so coincidences at its edges are complete
+SHARD_MARGIN = 60.0
+# TOF matching: downstream hit to GeneralTrigger window [ns] and trigger offset [coarse ticks]
+DELTA_TRIG = 60.0
+TRIG_OFFSET = 0.0
+# bump when a change to the pipeline changes what fill_histograms gives, so
+# that saved beam_hists_<label>.npz files are filled again
+HIST_VERSION = 2
+
+# -------------------------------
+# Beam info fetch function with trigger-matched CKOV/XCET and momentum
+# -------------------------------
+def BeamInfo_from_ifbeam(t0: int, t1: int, fXCETDebug=False):
+    # one 22-element tuple per TOF match, fields as in beam_dataset.FIELDS
+    return BeamInfo_columns_from_ifbeam(t0, t1, fXCETDebug).tolist()
+
+def BeamInfo_columns_from_ifbeam(t0: int, t1: int, fXCETDebug=False):
+    # same content as BeamInfo_from_ifbeam, as a structured array with one
+    # named column per field (info["tof"], info["momentum_meas"], ...);
+    # every variable is fetched concurrently up front
+    return lazy_beaminfo(t0, t1, fXCETDebug=fXCETDebug).info
+
+def lazy_beaminfo(t0: int, t1: int, run_label="", fXCETDebug=False, trig_range=None, previous=None,
+                  delta_trig=DELTA_TRIG, offset=TRIG_OFFSET):
+    # BeamInfo whose columns are fetched on first access: ds["tof"] only needs
+    # the trigger and XBTF counters, ds["ckov1_status"] adds the XCET021667 timestamps, ...
+    # trig_range and previous are for the shards of a longer run (see fill_histograms)
+    groups = beaminfo_groups(fXCETDebug, trig_range, previous, delta_trig, offset)
+    return LazyBeamDataset(t0, t1, run_label, groups, prefetch_var_values)
+
+def beaminfo_groups(fXCETDebug=False, trig_range=None, previous=None,
+                    delta_trig=DELTA_TRIG, offset=TRIG_OFFSET):
+    # BeamInfo columns, with the IFBeam variables each of them is computed from
+    groups = [ColumnGroup(["tof", "trig_times", "trig_ms"], tof_var_names(count=False),
+                          tof_columns(trig_range, delta_trig, offset))]
+    for n, dev in [(1, "XCET021667"), (2, "XCET021669")]:
+        prefix = f"dip/acc/NORTH/NP02/BI/XCET/{dev}"
+        groups.append(ColumnGroup([f"ckov{n}_trig", f"ckov{n}_press"],
+                                  [prefix + ":countsTrig", prefix + ":pressure"],
+                                  ckov_columns(n, dev, trig_range, previous), needs=["trig_ms"]))
+        groups.append(ColumnGroup([f"ckov{n}_status", f"ckov{n}_delta",
+                                   f"xcet{n}_sec", f"xcet{n}_frac", f"xcet{n}_coarse"],
+                                  xcet_var_names(dev), xcet_columns(n, dev, fXCETDebug),
+                                  needs=["trig_times"]))
+    groups.append(ColumnGroup(["momentum_ref", "momentum_meas", "momentum_diff"],
+                              momentum_var_names(), momentum_columns(trig_range, previous),
+                              needs=["trig_ms"]))
+    return groups
+
+def tof_columns(trig_range=None, delta_trig=DELTA_TRIG, offset=TRIG_OFFSET):
+    # --- TOF values, with the time of the trigger each one belongs to; with
+    #     trig_range (lo, hi) in ns, only the TOFs of triggers in [lo, hi) ---
+    def compute(ds):
+        tofs, trig_times = get_tof_matches(ds.t0, ds.t1, delta_trig, offset)
+        if trig_range is not None:
+            lo, hi = trig_range
+            keep = np.ones(len(tofs), dtype=bool)
+            if lo is not None:
+                keep &= trig_times.ns >= lo
+            if hi is not None:
+                keep &= trig_times.ns < hi
+            tofs, trig_times = tofs[keep], trig_times.take(np.flatnonzero(keep))
+        return {"tof": tofs, "trig_times": trig_times, "trig_ms": trig_times.ns // 1000000}
+    return compute
+
+def ckov_columns(n: int, dev: str, trig_range=None, previous=None):
+    # --- Cherenkov trigger counts and pressure in effect at the trigger time of each TOF ---
+    @ifbeam_stats.timed("ckov")
+    def compute(ds):
+        prefix = f"dip/acc/NORTH/NP02/BI/XCET/{dev}"
+        trig  = get_slow_ragged(ds, prefix + ":countsTrig", trig_range, previous)
+        press = get_slow_ragged(ds, prefix + ":pressure", trig_range, previous)
+        return {f"ckov{n}_trig": trig.asof(ds["trig_ms"]), f"ckov{n}_press": press.asof(ds["trig_ms"])}
+    return compute
+
+def xcet_columns(n: int, dev: str, debug=False):
+    # --- Trigger-matched status and timestamp (delta): nearest XCET hit
+    #     within 500 ns of the GeneralTrigger of each TOF, all TOFs at once ---
+    @ifbeam_stats.timed("xcet")
+    def compute(ds):
+        seconds, frac, coarse, fetched = get_xcet_values(ds.t0, ds.t1, dev, debug=debug)
+        times = ifbeam_time.decode_xcet(seconds, frac, coarse)
+        cols = {}
+        cols[f"ckov{n}_status"], cols[f"ckov{n}_delta"] = tof_matcher.associate_xcet(ds["trig_times"], times, fetched)
+        # XCET timestamps, paired with the i-th TOF (0 when missing)
+        for name, values in [("sec", seconds), ("frac", frac), ("coarse", coarse)]:
+            column = np.zeros(len(ds), dtype=np.int64)
+            if fetched:
+                fill_by_index(column, values)
+            cols[f"xcet{n}_{name}"] = column
+        return cols
+    return compute
+
+def momentum_columns(trig_range=None, previous=None):
+    # --- Momentum info (already in GeV/c in DB), also at the trigger time ---
+    @ifbeam_stats.timed("momentum")
+    def compute(ds):
+        ref, meas = (get_slow_ragged(ds, v, trig_range, previous).asof(ds["trig_ms"])
+                     for v in momentum_var_names())
+        return {"momentum_ref": ref, "momentum_meas": meas, "momentum_diff": meas - ref}
+    return compute
+
+# -------------------------------
+# CKOV / XCET / TOF / DB functions
+# -------------------------------
+def beaminfo_var_names():
+    # every variable a full BeamInfo is computed from
+    return list(dict.fromkeys(v for g in beaminfo_groups() for v in g.var_names))
+
+def momentum_var_names():
+    return ["dip/acc/NORTH/NP02/POW/CALC/MOMENTUM:momentum_ref",
+            "dip/acc/NORTH/NP02/POW/CALC/MOMENTUM:momentum_meas"]
+
+def ckov_var_names(dev: str):
+    prefix = f"dip/acc/NORTH/NP02/BI/XCET/{dev}"
+    return [prefix + ":counts", prefix + ":countsTrig", prefix + ":pressure"]
+
+def xcet_var_names(dev: str):
+    prefix = f"dip/acc/NORTH/NP02/BI/{dev}"
+    return [prefix + ":SECONDS", prefix + ":FRAC", prefix + ":COARSE"]
+
+def get_ckov_values(t0: str, t1: str, dev: str):
+    prefix = f"dip/acc/NORTH/NP02/BI/XCET/{dev}"
+    with prefetch_var_values(t0, t1, ckov_var_names(dev)):
+        counts     = get_var_values(t0, t1, prefix + ":counts")
+        countsTrig = get_var_values(t0, t1, prefix + ":countsTrig")
+        pressures  = get_var_values(t0, t1, prefix + ":pressure")
+    return counts, countsTrig, pressures
+
+def get_xcet_values(t0: str, t1: str, dev: str, debug=False):
+    prefix = f"dip/acc/NORTH/NP02/BI/{dev}"
+    try:
+        with prefetch_var_values(t0, t1, xcet_var_names(dev)):
+            seconds = get_var_values(t0, t1, prefix + ":SECONDS")
+            frac    = get_var_values(t0, t1, prefix + ":FRAC")
+            coarse  = get_var_values(t0, t1, prefix + ":COARSE")
+        if debug:
+            for i in range(min(len(seconds), len(frac), len(coarse))):
+                ns_val = 8.0 * coarse[i] + frac[i] / 512.0
+                print(f"{dev} {i} sec={seconds[i]} ns={ns_val}")
+        return seconds, frac, coarse, True
+    except Exception as e:
+        print(f"WARNING: Could not get {dev} info: {e}")
+        return [], [], [], False
+
+def tof_var_names(count=True):
+    # count=False leaves out timestampCount, which the TOF matching does not use
+    names = relevant_var_names("dip/acc/NORTH/NP02/BI/TDC/GeneralTrigger", count)
+    for name in ['XBTF022638A','XBTF022638B','XBTF022670A','XBTF022670B']:
+        names += relevant_var_names("dip/acc/NORTH/NP02/BI/XTOF/"+name, count)
+    return names
+
+def get_tofs(t0: str, t1: str, delta_trig: float, offset: float):
+    tofs, _ = get_tof_matches(t0, t1, delta_trig, offset)
+    return tofs.tolist()
+
+@ifbeam_stats.timed("get_tofs")
+def get_tof_matches(t0: str, t1: str, delta_trig: float, offset: float):
+    # TOF array and the decoded GeneralTrigger time of each TOF
+    # decode every counter once to int64 ns, then match on the decoded arrays
+    with prefetch_var_values(t0, t1, tof_var_names(count=False)):
+        trig_times = get_counter_times(t0, t1, "dip/acc/NORTH/NP02/BI/TDC/GeneralTrigger", offset)
+        tof_name = ['XBTF022638A','XBTF022638B','XBTF022670A','XBTF022670B']
+        tof_times = [get_counter_times(t0, t1, "dip/acc/NORTH/NP02/BI/XTOF/"+name) for name in tof_name]
+    tofs, trig_idx = tof_matcher.match_tof_times(trig_times, tof_times, delta_trig, return_trigger=True)
+    return tofs, trig_times.take(trig_idx)
+
+def get_tof_scan(t0: str, t1: str, delta_trigs, offsets):
+    # TOF counts and histograms for a grid of delta_trig x offset values,
+    # from one fetch and decode of the counters (see tof_matcher.scan_tof_times)
+    with prefetch_var_values(t0, t1, tof_var_names(count=False)):
+        trig_times = get_counter_times(t0, t1, "dip/acc/NORTH/NP02/BI/TDC/GeneralTrigger")
+        tof_name = ['XBTF022638A','XBTF022638B','XBTF022670A','XBTF022670B']
+        tof_times = [get_counter_times(t0, t1, "dip/acc/NORTH/NP02/BI/XTOF/"+name) for name in tof_name]
+    return tof_matcher.scan_tof_times(trig_times, tof_times, delta_trigs, offsets)
+
+def get_counter_times(t0: str, t1: str, prefix: str, offset: float = 0.0):
+    # decoded hit times of a TDC/XTOF counter, without fetching its timestampCount
+    seconds_data = get_var_values(t0, t1, prefix+":seconds[]")
+    coarse_data  = get_var_values(t0, t1, prefix+":coarse[]")
+    frac_data    = get_var_values(t0, t1, prefix+":frac[]")
+    return tof_matcher.decode_counter(seconds_data, coarse_data, frac_data, offset)
+
+def check_valid_tof(tof_ref_sec, tof_ref_ns, tof_s, tof_c, tof_f, tofs: []):
+    ref = ifbeam_time.from_sec_ns(tof_ref_sec, tof_ref_ns)
+    _, _, deltas = tof_matcher.window_pairs(ref, tof_matcher.decode_counter(tof_s, tof_c, tof_f),
+                                            tof_matcher.UPSTREAM_TO_DOWNSTREAM)
+    tofs.extend(deltas.tolist())
+
+def get_tof_vars_values(t0: str, t1: str, tof_var_name: str):
+    prefix = "dip/acc/NORTH/NP02/BI/XTOF/"+tof_var_name
+    return get_relevant_values(t0, t1, prefix)
+
+def get_trigger_values(t0: str, t1: str):
+    prefix = "dip/acc/NORTH/NP02/BI/TDC/GeneralTrigger"
+    return get_relevant_values(t0, t1, prefix)
+    
+def relevant_var_names(prefix: str, count=True):
+    names = [prefix+":seconds[]", prefix+":coarse[]", prefix+":frac[]"]
+    return names + [prefix+":timestampCount"] if count else names
+
+def get_relevant_values(t0: str, t1: str, prefix: str):
+    with prefetch_var_values(t0, t1, relevant_var_names(prefix)):
+        seconds_data = get_var_values(t0, t1, prefix+":seconds[]")
+        coarse_data  = get_var_values(t0, t1, prefix+":coarse[]")
+        frac_data    = get_var_values(t0, t1, prefix+":frac[]")
+        count_var    = get_var_values(t0, t1, prefix+":timestampCount")
+    return count_var, seconds_data, coarse_data, frac_data
+
+def get_var_values(t0: str, t1: str, var_name: str):
+    lines = fetch_ifbeam(var_name, IFBEAM_EVENT, t0, t1)
+    data = parse_csv_value(lines)
+    return data    
+
+def get_var_ragged(t0: str, t1: str, var_name: str):
+    # values per logged row, with the row logging times
+    lines = fetch_ifbeam(var_name, IFBEAM_EVENT, t0, t1)
+    return ifbeam_csv.parse_csv_ragged(lines)
+
+def get_slow_ragged(ds, var_name: str, trig_range=None, previous=None):
+    # rows of a slow-control variable over the window of ds; with previous
+    # ({var: (clock_ms, value)}, shared by the shards of a run) the last row
+    # logged before the shard is put in front, so that its first triggers get
+    # the value in effect and not the first row of the shard
+    rv = get_var_ragged(ds.t0, ds.t1, var_name)
+    if previous is None:
+        return rv
+    has = rv.counts > 0
+    clock = rv.clock_ms[has]
+    values = rv.values[rv.offsets[:-1][has]]
+    if var_name in previous:
+        clock = np.concatenate([previous[var_name][0], clock])
+        values = np.concatenate([previous[var_name][1], values])
+    # keep the last row before the next shard, whose triggers start at trig_range[1]
+    if trig_range is not None and trig_range[1] is not None:
+        before = np.flatnonzero(clock <= trig_range[1] // 1000000)
+        if len(before):
+            last = before[np.argmax(clock[before])]
+            previous[var_name] = (clock[last:last + 1], values[last:last + 1])
+    return ifbeam_csv.RaggedValues(values, np.arange(len(values) + 1), clock)
+
+def prefetch_var_values(t0: str, t1: str, var_names):
+    # fetch concurrently; the get_var_values calls in the with block are served from memory
+    return ifbeam_fetch.prefetch(var_names, IFBEAM_EVENT, t0, t1)
+
+def parse_csv_value(lines):
+    # all array elements of all rows, truncated to int
+    return ifbeam_csv.parse_csv_ragged(lines).as_int()
+
+# -------------------------------
+# Histograms: filled shard by shard, saved per run, merged across runs
+# -------------------------------
+def fill_parameters(t0: str, t1: str, delta_trig=DELTA_TRIG, offset=TRIG_OFFSET):
+    # what the histograms of [t0, t1] depend on besides the binning; final is
+    # False while the window is younger than the live horizon of the cache,
+    # whose chunks may still change
+    final = time.time() >= ifbeam_cache.to_epoch(t1) + ifbeam_cache.LIVE_HORIZON
+    return {"t0": t0, "t1": t1, "delta_trig": delta_trig, "offset": offset,
+            "version": HIST_VERSION, "final": final}
+
+def fill_histograms(t0: str, t1: str, run_label: str, chunk_seconds=None,
+                    export_dir=None, export_format=None, delta_trig=DELTA_TRIG, offset=TRIG_OFFSET):
+    # one BeamInfo per IFBeam shard, histogrammed and dropped before the next one;
+    # with export_dir the matched rows are also written out (see beam_export.py)
+    hists = beam_hist.beam_histograms(run_label, **fill_parameters(t0, t1, delta_trig, offset))
+    shards = ifbeam_fetch.shard_window(t0, t1, chunk_seconds)
+    first, last = shards[0][0], shards[-1][1]
+    previous = {}
+    written, trig_lo, trig_hi = [], np.iinfo(np.int64).max, np.iinfo(np.int64).min
+    for k, (start, end) in enumerate(shards):
+        # the rows of SHARD_MARGIN around the shard are read too, so the hits of
+        # triggers at its edges are there; a trigger only counts in the shard
+        # its time falls in, and slow-control values carry over from the shard before
+        s0 = t0 if k == 0 else ifbeam_cache.to_iso(max(start - SHARD_MARGIN, first), t0)
+        s1 = t1 if k == len(shards) - 1 else ifbeam_cache.to_iso(min(end + SHARD_MARGIN, last), t0)
+        trig_range = (None if k == 0 else int(round(start*1e9)),
+                      None if k == len(shards) - 1 else int(round(end*1e9)))
+        ds = lazy_beaminfo(s0, s1, run_label, trig_range=trig_range, previous=previous,
+                           delta_trig=delta_trig, offset=offset)
+        info = ds.info
+        with ifbeam_stats.stage("histogram"):
+            hists.fill(info)
+        if export_dir is not None:
+            with ifbeam_stats.stage("export"):
+                table = beam_export.beam_table(ds)
+                written += beam_export.write_table(table, export_dir, run_label,
+                                                   like=t0, fmt=export_format)
+                if len(table["trig_ns"]):
+                    trig_lo = min(trig_lo, int(table["trig_ns"].min()))
+                    trig_hi = max(trig_hi, int(table["trig_ns"].max()))
+    if written:
+        # rows of an earlier export of the label that this one has replaced
+        with ifbeam_stats.stage("export"):
+            beam_export.drop_rows(export_dir, run_label, trig_lo, trig_hi, written)
+    return hists
+
+def load_histograms(t0: str, t1: str, run_label: str, delta_trig=DELTA_TRIG, offset=TRIG_OFFSET,
+                    export_dir=None, export_format=None):
+    # saved histograms of the run if they were filled from final data of [t0, t1]
+    # with the same parameters, code version and binning, else fill and save them;
+    # with export_dir (default $BEAM_EXPORT_DIR, format $BEAM_EXPORT_FORMAT) the
+    # run is always filled again and its matched rows exported (see beam_export.py)
+    export_dir = export_dir or os.environ.get("BEAM_EXPORT_DIR") or None
+    export_format = export_format or os.environ.get("BEAM_EXPORT_FORMAT") or None
+    path = f"beam_hists_{run_label}.npz"
+    if export_dir is None and os.path.exists(path):
+        hists = beam_hist.HistSet.load(path)
+        wanted = dict(fill_parameters(t0, t1, delta_trig, offset), final=True)
+        if all(hists.meta.get(k) == v for k, v in wanted.items()) and \
+                hists.same_binning(beam_hist.beam_histograms()):
+            return hists
+    hists = fill_histograms(t0, t1, run_label, export_dir=export_dir, export_format=export_format,
+                            delta_trig=delta_trig, offset=offset)
+    hists.save(path)
+    return hists
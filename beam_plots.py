@@ -0,0 +1,78 @@
+"""Plot producers shared by IFBeam_Analysis.py and TOF_CKOV.py.
+
+Each producer takes the list of run histograms (beam_hist.HistSet, e.g. from
+beam_pipeline.load_histograms) and the run colors, and saves one figure:
+
+    import beam_plots
+    beam_plots.plot_tof_overlay(runs, ["blue", "green"])
+"""
+import matplotlib.pyplot as plt
+
+def draw_hist(ax, h, **kwargs):
+    # step histogram of a 1D beam_hist.Hist, as ax.hist would draw the raw values
+    ax.hist(h.centers(), bins=h.edges[0], weights=h.counts, histtype="step", **kwargs)
+
+def plot_tof_overlay(runs, colors):
+    plt.figure(figsize=(8,6))
+    for i, hs in enumerate(runs):
+        h = hs["tof"]
+        if hs.meta.get("entries", 0) == 0: continue
+        draw_hist(plt.gca(), h, linewidth=2,
+                  label=hs.label, color=colors[i % len(colors)])
+    plt.xlabel("TOF [ns]")
+    plt.ylabel("Counts")
+    plt.title("TOF Distribution (Overlay of Runs)")
+    plt.grid(True, linestyle="--", alpha=0.7)
+    plt.legend(fontsize=10, loc="upper right")
+    plt.savefig("tof_all_runs.png", dpi=150)
+    plt.close()
+
+def plot_ckov(runs, colors):
+    # CKOV combined figure (2x2 grid)
+    fig, axs = plt.subplots(2, 2, figsize=(14, 10), constrained_layout=True)
+    for idx, name in enumerate(["CKOV1","CKOV2"]):
+        for i, hs in enumerate(runs):
+            counts = hs["ckov1_trig" if idx==0 else "ckov2_trig"].to_hist(50)
+            press  = hs["ckov1_press" if idx==0 else "ckov2_press"].to_hist(50)
+
+            draw_hist(axs[idx,0], counts,
+                      linewidth=1.5, label=hs.label,
+                      alpha=0.8, color=colors[i % len(colors)])
+            draw_hist(axs[idx,1], press,
+                      linewidth=1.5, label=hs.label,
+                      alpha=0.8, color=colors[i % len(colors)])
+
+        axs[idx,0].set_xlabel(f"{name} Counts")
+        axs[idx,0].set_ylabel("Entries")
+        axs[idx,0].grid(True, linestyle="--", alpha=0.7)
+        axs[idx,0].set_title(f"{name} Counts")
+
+        axs[idx,1].set_xlabel(f"{name} Pressure")
+        axs[idx,1].set_ylabel("Entries")
+        axs[idx,1].grid(True, linestyle="--", alpha=0.7)
+        axs[idx,1].set_title(f"{name} Pressure")
+
+        axs[idx,0].legend(fontsize=8)
+        axs[idx,1].legend(fontsize=8)
+
+    plt.savefig("ckov_full_combined.png", dpi=150)
+    plt.close()
+
+def plot_momentum(runs, colors):
+    # Momentum Ref / Meas / Diff
+    plt.figure(figsize=(8,6))
+    for i, hs in enumerate(runs):
+        if hs.meta.get("entries", 0) == 0: continue
+        draw_hist(plt.gca(), hs["momentum_ref"], linewidth=2,
+                  label=f"{hs.label} ref",  color=colors[i % len(colors)])
+        draw_hist(plt.gca(), hs["momentum_meas"], linewidth=2,
+                  label=f"{hs.label} meas", color=colors[i % len(colors)], linestyle="--")
+        draw_hist(plt.gca(), hs["momentum_diff"], linewidth=2,
+                  label=f"{hs.label} diff", color=colors[i % len(colors)], linestyle=":")
+    plt.xlabel("Momentum [GeV/c]")
+    plt.ylabel("Counts")
+    plt.title("Momentum Reference / Measured / Difference")
+    plt.grid(True, linestyle="--", alpha=0.7)
+    plt.legend(fontsize=8)
+    plt.savefig("momentum_ref_meas_diff.png", dpi=150)
+    plt.close()
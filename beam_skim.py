@@ -0,0 +1,100 @@
+#!/usr/bin/env python3
+"""Skim files with the beam instrumentation of art/ROOT beam files.
+
+The beam plots only need TOF, timing trigger, CKOV status and reco momenta,
+but reading them through gallery means opening the whole art file and
+jitting the product headers every time.  A skim keeps just those fields
+(with run, subrun and event IDs) in a compressed .npz next to the source:
+
+    np02_..._beam.root  ->  np02_..._beam.root.beamskim.npz
+
+load_beam_events() reads the skim when it is newer than the source (and was
+made with the same tag), and otherwise reads the source with
+gallery_utils.read_beam_events() and writes the skim.  Reading a skim needs
+numpy only.  Skims of all inputs can be made ahead of the plots with:
+
+    python3 beam_skim.py -f merged_39252.root merged_39255.root
+    python3 beam_skim.py -f np02_*_beam.root --skim-dir skims/
+"""
+import json
+import os
+from argparse import ArgumentParser as ap
+
+import numpy as np
+
+SKIM_SUFFIX = ".beamskim.npz"
+SKIM_VERSION = 1
+
+
+def skim_path(source, skim_dir=None):
+    directory = skim_dir if skim_dir is not None else os.path.dirname(source)
+    return os.path.join(directory, os.path.basename(source) + SKIM_SUFFIX)
+
+
+def write_skim(beam, path, source, tag):
+    meta = {"version": SKIM_VERSION, "source": os.path.abspath(source), "tag": tag}
+    tmp = f"{path}.{os.getpid()}.tmp.npz"
+    np.savez_compressed(tmp, meta=np.array(json.dumps(meta)), **beam)
+    os.replace(tmp, path)
+
+
+def read_skim(path):
+    """(beam arrays, meta) of a skim file"""
+    with np.load(path, allow_pickle=False) as f:
+        meta = json.loads(str(f["meta"]))
+        beam = {k: f[k] for k in f.files if k != "meta"}
+    return beam, meta
+
+
+def fresh_skim(source, tag="beamevent", skim_dir=None):
+    """Path of the skim of source if it is newer than source and made with tag, else None"""
+    path = skim_path(source, skim_dir)
+    try:
+        if os.path.getmtime(path) <= os.path.getmtime(source):
+            return None
+        with np.load(path, allow_pickle=False) as f:
+            meta = json.loads(str(f["meta"]))
+    except (OSError, KeyError, ValueError):
+        return None
+    if meta.get("version") != SKIM_VERSION or meta.get("tag") != tag:
+        return None
+    return path
+
+
+def load_beam_events(source, tag="beamevent", skim_dir=None, refresh=False, jobs=1):
+    """gallery_utils.read_beam_events(source, tag), from the skim when it is up to
+    date; otherwise the source is read by jobs processes, one entry range each"""
+    path = None if refresh else fresh_skim(source, tag, skim_dir)
+    if path is not None:
+        return read_skim(path)[0]
+    # ROOT and gallery are only needed when the skim has to be made
+    from gallery_utils import read_beam_events_sharded
+    beam = read_beam_events_sharded(source, tag, jobs)
+    path = skim_path(source, skim_dir)
+    try:
+        if skim_dir is not None:
+            os.makedirs(skim_dir, exist_ok=True)
+        write_skim(beam, path, source, tag)
+    except OSError as e:
+        print(f"WARNING: could not write the skim {path}: {e}")
+    return beam
+
+
+if __name__ == "__main__":
+    parser = ap()
+    parser.add_argument("-f", type=str, nargs="+", required=True, help="art/ROOT beam files")
+    parser.add_argument("--tag", type=str, default="beamevent")
+    parser.add_argument("--skim-dir", type=str, default=None,
+                        help="where to put the skims (default: next to each source)")
+    parser.add_argument("--force", action="store_true", help="remake skims that are up to date")
+    parser.add_argument("-j", "--jobs", type=int, default=1,
+                        help="worker processes per file, each reading a range of entries")
+    args = parser.parse_args()
+
+    for fname in args.f:
+        if not args.force and fresh_skim(fname, args.tag, args.skim_dir):
+            print(f"{fname}: skim up to date")
+            continue
+        beam = load_beam_events(fname, args.tag, args.skim_dir, refresh=True, jobs=args.jobs)
+        print(f"{fname}: {int(beam['valid'].sum())}/{len(beam['valid'])} beam events"
+              f" -> {skim_path(fname, args.skim_dir)}")
@@ -0,0 +1,73 @@
+#!/usr/bin/env python3
+"""Startup benchmark of the gallery helpers (gallery_utils).
+
+Every measurement runs in a fresh python process, as a script launch or a
+pool worker would, and reports the seconds to
+
+    import    import ROOT and gallery_utils
+    provide   gallery headers, getValidHandle<T> for PRODUCT_TYPES and the
+              beam extractor (what the scripts do before the first event)
+    first     read the beam events of the first entry of --file (optional)
+
+in three modes:
+
+    jit       GALLERY_UTILS_NO_CACHE=1, everything parsed and jitted
+    build     compiled library built from scratch (an empty cache directory)
+    cached    compiled library loaded from the cache (every later start)
+
+    python3 bench_gallery_startup.py
+    python3 bench_gallery_startup.py --file merged_39252.root --repeat 5
+"""
+import json
+import os
+import subprocess
+import sys
+import tempfile
+from argparse import ArgumentParser as ap
+
+CHILD = r'''
+import json, sys, time
+start = time.perf_counter()
+import ROOT
+import gallery_utils
+t_import = time.perf_counter()
+gallery_utils.read_header('gallery/ValidHandle.h')
+gallery_utils.provide_list(gallery_utils.PRODUCT_TYPES)
+gallery_utils.provide_beam_extractor()
+t_provide = time.perf_counter()
+fname = sys.argv[1]
+if fname:
+    gallery_utils.read_beam_events(fname, first=0, last=1)
+t_first = time.perf_counter()
+print(json.dumps({'import': t_import - start, 'provide': t_provide - t_import,
+                  'first': t_first - t_provide, 'compiled': bool(gallery_utils._compiled)}))
+'''
+
+
+def run_child(env, fname):
+    out = subprocess.run([sys.executable, "-c", CHILD, fname or ""], env=env, check=True,
+                         capture_output=True, text=True, cwd=os.path.dirname(os.path.abspath(__file__)))
+    return json.loads(out.stdout.strip().splitlines()[-1])
+
+
+if __name__ == "__main__":
+    parser = ap()
+    parser.add_argument("--file", type=str, default="", help="art/ROOT beam file for the first-event time")
+    parser.add_argument("--repeat", type=int, default=3, help="runs per mode (the best is shown)")
+    args = parser.parse_args()
+
+    cache = tempfile.mkdtemp(prefix="gallery_utils_bench_")
+    base = dict(os.environ, GALLERY_UTILS_CACHE_DIR=cache)
+    base.pop("GALLERY_UTILS_NO_CACHE", None)
+    modes = [("jit", dict(base, GALLERY_UTILS_NO_CACHE="1"), args.repeat),
+             ("build", base, 1),
+             ("cached", base, args.repeat)]
+
+    print(f"{'mode':>8} {'import':>8} {'provide':>8} {'first':>8} {'total':>8}  compiled")
+    for name, env, repeat in modes:
+        runs = [run_child(env, args.file) for _ in range(repeat)]
+        best = min(runs, key=lambda r: r["import"] + r["provide"] + r["first"])
+        total = best["import"] + best["provide"] + best["first"]
+        print(f"{name:>8} {best['import']:8.2f} {best['provide']:8.2f} {best['first']:8.2f}"
+              f" {total:8.2f}  {best['compiled']}")
+    print(f"(compiled library in {cache})")
@@ -0,0 +1,112 @@
+#!/usr/bin/env python3
+"""Benchmark of the IFBeam pipeline against the local stand-in server.
+
+Times fetch, CSV parsing, TOF matching and XCET association for 1-minute,
+1-hour and 1-day windows of synthetic beam data (or recorded fixtures).
+No lab network access is needed:
+
+    python3 bench_ifbeam.py
+    python3 bench_ifbeam.py --windows 1min,1h --latency 0.05 --particles 300
+    python3 bench_ifbeam.py --fixtures fixtures/ --t0 2025-08-25T11:11:11-05:00 --windows 1min
+"""
+import os
+import time
+from argparse import ArgumentParser as ap
+
+import ifbeam_cache
+import ifbeam_csv
+import ifbeam_fetch
+import ifbeam_standin
+import ifbeam_time
+import tof_matcher
+
+WINDOWS = {"1min": 60, "1h": 3600, "1day": 86400}
+EVENT = "z,pdune"
+TRIGGER = "dip/acc/NORTH/NP02/BI/TDC/GeneralTrigger"
+TOF_COUNTERS = ["XBTF022638A", "XBTF022638B", "XBTF022670A", "XBTF022670B"]
+XCET_DEVICES = ["XCET021667", "XCET021669"]
+
+
+def counter_vars(prefix):
+    return [prefix + ":seconds[]", prefix + ":coarse[]", prefix + ":frac[]"]
+
+
+def xcet_vars(dev):
+    prefix = "dip/acc/NORTH/NP02/BI/" + dev
+    return [prefix + ":SECONDS", prefix + ":FRAC", prefix + ":COARSE"]
+
+
+def run_window(t0, seconds):
+    t1 = ifbeam_cache.to_iso(ifbeam_cache.to_epoch(t0) + seconds, t0)
+    counters = [TRIGGER] + ["dip/acc/NORTH/NP02/BI/XTOF/" + c for c in TOF_COUNTERS]
+    var_names = [v for c in counters for v in counter_vars(c)]
+    var_names += [v for d in XCET_DEVICES for v in xcet_vars(d)]
+    timing = {}
+
+    start = time.perf_counter()
+    lines = ifbeam_fetch.fetch_many(var_names, EVENT, t0, t1)
+    timing["fetch"] = time.perf_counter() - start
+    for var, res in lines.items():
+        if isinstance(res, Exception):
+            raise res
+    nbytes = sum(len(line) + 1 for res in lines.values() for line in res)
+
+    start = time.perf_counter()
+    parsed = {var: ifbeam_csv.parse_csv_ragged(res) for var, res in lines.items()}
+    timing["parse"] = time.perf_counter() - start
+    nvalues = sum(len(p.values) for p in parsed.values())
+
+    start = time.perf_counter()
+    decoded = []
+    for c in counters:
+        s, co, f = (parsed[v].as_int() for v in counter_vars(c))
+        decoded.append(ifbeam_time.decode_times(s, co, f, stride=2))
+    trig_times, tof_times = decoded[0], decoded[1:]
+    tofs, trig_idx = tof_matcher.match_tof_times(trig_times, tof_times, 60.0, return_trigger=True)
+    timing["tof_match"] = time.perf_counter() - start
+
+    start = time.perf_counter()
+    ref = trig_times.take(trig_idx)
+    n_ckov = []
+    for d in XCET_DEVICES:
+        s, f, co = (parsed[v].as_int() for v in xcet_vars(d))
+        status, _ = tof_matcher.associate_xcet(ref, ifbeam_time.decode_xcet(s, f, co))
+        n_ckov.append(int(status.sum()))
+    timing["xcet_assoc"] = time.perf_counter() - start
+
+    return timing, {"bytes": nbytes, "values": nvalues, "triggers": len(trig_times),
+                    "tofs": len(tofs), "ckov": n_ckov}
+
+
+if __name__ == "__main__":
+    parser = ap()
+    parser.add_argument("--windows", type=str, default="1min,1h,1day",
+                        help="comma separated list out of " + ",".join(WINDOWS))
+    parser.add_argument("--t0", type=str, default="2025-08-24T08:00:00-05:00")
+    parser.add_argument("--fixtures", type=str, help="serve recorded fixtures instead of synthetic data")
+    parser.add_argument("--particles", type=int, default=100, help="mean particles per spill")
+    parser.add_argument("--latency", type=float, default=0.0, help="server delay per request [s]")
+    parser.add_argument("--fail-rate", type=float, default=0.0, help="fraction of failed requests")
+    parser.add_argument("--workers", type=int, default=ifbeam_fetch.MAX_WORKERS)
+    args = parser.parse_args()
+
+    # always measure the network path, never the local cache
+    os.environ["IFBEAM_NO_CACHE"] = "1"
+    if args.fixtures:
+        source = ifbeam_standin.FixtureSource(args.fixtures)
+    else:
+        source = ifbeam_standin.SyntheticSource(particles_per_spill=args.particles)
+    server, url = ifbeam_standin.serve_in_thread(source, latency=args.latency,
+                                                 fail_rate=args.fail_rate, seed=1)
+    ifbeam_fetch.set_base_url(url)
+    ifbeam_fetch.set_max_workers(args.workers)
+
+    stages = ["fetch", "parse", "tof_match", "xcet_assoc"]
+    print(f"{'window':>7} " + " ".join(f"{s + ' [s]':>14}" for s in stages) +
+          f" {'MB':>8} {'values':>10} {'triggers':>9} {'tofs':>9}")
+    for name in args.windows.split(","):
+        timing, counts = run_window(args.t0, WINDOWS[name])
+        print(f"{name:>7} " + " ".join(f"{timing[s]:14.4f}" for s in stages) +
+              f" {counts['bytes']/1e6:8.2f} {counts['values']:10d} {counts['triggers']:9d}"
+              f" {counts['tofs']:9d}")
+    server.shutdown()
@@ -0,0 +1,121 @@
+#!/usr/bin/env python3
+"""Scaling benchmark of the TOF matching on synthetic spills (ifbeam_synth).
+
+For every event count it reports the throughput (events/s) and the peak
+memory (tracemalloc) of
+
+    get_tofs         the original nested loops (tof_matcher.match_tofs_reference)
+    check_valid_tof  the original upstream scan, once per downstream 2A/2B hit
+    match_tofs       the sort-merge replacement
+    upstream_pairs   its check_valid_tof equivalent (window_pairs)
+
+and checks that the replacements give exactly the reference output, in the
+same order.  The reference loops are quadratic, so they only run up to
+--max-reference events.
+
+    python3 bench_tof_matcher.py
+    python3 bench_tof_matcher.py --events 1e2,1e4,1e6 --noise 2000 --efficiency 0.95
+"""
+import time
+import tracemalloc
+from argparse import ArgumentParser as ap
+
+import numpy as np
+
+import ifbeam_synth
+import tof_matcher
+
+
+def reference_check_valid(tof_s, tof_c, tof_f):
+    """check_valid_tof() for every 2A then 2B hit, as get_tofs() calls it"""
+    tofs = []
+    for n in (2, 3):
+        for j in range(len(tof_c[n])):
+            sec = tof_s[n][j*2+1]
+            if sec == 0: break
+            ns = tof_c[n][j]*8 + tof_f[n][j]/512.0
+            tof_matcher.check_valid_tof_reference(sec, ns, tof_s[0], tof_c[0], tof_f[0], tofs)
+            tof_matcher.check_valid_tof_reference(sec, ns, tof_s[1], tof_c[1], tof_f[1], tofs)
+    return tofs
+
+
+def upstream_pairs(tof_s, tof_c, tof_f):
+    """reference_check_valid() with window_pairs, in the same order"""
+    times = [tof_matcher.decode_counter(tof_s[n], tof_c[n], tof_f[n]) for n in range(4)]
+    out = []
+    for n in (2, 3):
+        j_list, deltas, counter = [], [], []
+        for u in (0, 1):
+            j, _, delta = tof_matcher.window_pairs(times[n], times[u], tof_matcher.UPSTREAM_TO_DOWNSTREAM)
+            j_list.append(j)
+            deltas.append(delta)
+            counter.append(np.full(len(j), u))
+        j, delta, counter = (np.concatenate(a) for a in (j_list, deltas, counter))
+        out.append(delta[np.lexsort((counter, j))])
+    return np.concatenate(out)
+
+
+def measure(func, args, memory):
+    """(seconds, peak MB or nan, result) of func(*args)"""
+    start = time.perf_counter()
+    result = func(*args)
+    elapsed = time.perf_counter() - start
+    peak = float("nan")
+    if memory:
+        del result
+        tracemalloc.start()
+        result = func(*args)
+        peak = tracemalloc.get_traced_memory()[1]/1e6
+        tracemalloc.stop()
+    return elapsed, peak, result
+
+
+if __name__ == "__main__":
+    parser = ap()
+    parser.add_argument("--events", type=str, default="1e2,1e3,1e4,1e5,1e6,1e7",
+                        help="comma separated numbers of beam particles")
+    parser.add_argument("--max-reference", type=float, default=1e3,
+                        help="largest event count to run the nested-loop reference on")
+    parser.add_argument("--particles", type=int, default=1000, help="mean particles per spill")
+    parser.add_argument("--noise", type=float, default=20.0, help="noise rate per counter [Hz]")
+    parser.add_argument("--efficiency", type=float, default=0.98, help="efficiency of every counter")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--no-memory", action="store_true", help="skip the tracemalloc runs")
+    args = parser.parse_args()
+
+    counters = ifbeam_synth.COUNTERS
+    memory = not args.no_memory
+
+    print(f"{'events':>9} {'stage':>16} {'time [s]':>10} {'events/s':>12} {'peak MB':>9}"
+          f" {'tofs':>9} {'identical':>9}")
+    for n_events in (int(float(x)) for x in args.events.split(",")):
+        synth = ifbeam_synth.BeamSynth(seed=args.seed,
+                                       particles_per_spill=min(args.particles, n_events),
+                                       efficiency={c: args.efficiency for c in counters},
+                                       noise_rate={c: args.noise for c in counters})
+        trig, tof_s, tof_c, tof_f = synth.tof_inputs(n_particles=n_events)
+        stages = [("match_tofs", tof_matcher.match_tofs, (trig, tof_s, tof_c, tof_f)),
+                  ("upstream_pairs", upstream_pairs, (tof_s, tof_c, tof_f))]
+        if n_events <= args.max_reference:
+            # the reference walks python lists, as get_relevant_values() used to return
+            ref_args = ([a.tolist() for a in trig], [a.tolist() for a in tof_s],
+                        [a.tolist() for a in tof_c], [a.tolist() for a in tof_f])
+            stages = [("get_tofs", tof_matcher.match_tofs_reference, ref_args),
+                      ("check_valid_tof", reference_check_valid, ref_args[1:])] + stages
+
+        results = {}
+        for name, func, func_args in stages:
+            try:
+                elapsed, peak, result = measure(func, func_args, memory)
+            except MemoryError:
+                tracemalloc.stop()
+                print(f"{n_events:9d} {name:>16}  out of memory")
+                continue
+            results[name] = result
+            same = ""
+            reference = {"match_tofs": "get_tofs", "upstream_pairs": "check_valid_tof"}.get(name)
+            if reference in results:
+                same = "yes" if list(result) == results[reference] else "NO"
+            print(f"{n_events:9d} {name:>16} {elapsed:10.4f} {n_events/elapsed:12.4g}"
+                  f" {peak:9.2f} {len(result):9d} {same:>9}")
+        del results
@@ -1,62 +1,167 @@
 #!/usr/bin/env python3
+"""Dump the hits of IFBeam counters as one time-sorted CSV stream.
+
+Every hit of the selected counters (default: the four XBTF, GeneralTrigger
+and both XCET) is decoded to int64 ns since the epoch (plus the sub-ns part)
+and written with its counter and the logging clock of its CSV row:
+
+    time_ns,sub_ns,counter,clock_ms
+
+The window is read one IFBeam shard (IFBEAM_SHARD_SECONDS) at a time: the
+variables of all counters are fetched concurrently, the next shard is
+fetched while the current one is written, and only the hits that may still
+be overtaken by later rows (the last LOG_DELAY seconds) are kept in memory.
+The shards meet on whole seconds and each keeps the rows logged in its own
+slice, so a row logged on a shard edge is written once.
+
+    python3 clock_ifbeam_reader.py z,pdune 2025-08-25T11:11:11-05:00 2025-08-25T11:12:15-05:00 clock.csv
+    python3 clock_ifbeam_reader.py z,pdune <t0> <t1> clock.csv --counters XBTF022638A,GeneralTrigger
+"""
 import csv
-import requests
+import math
 import sys
+from argparse import ArgumentParser as ap
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
 import urllib3
 
+import ifbeam_cache
+import ifbeam_csv
+import ifbeam_fetch
+from ifbeam_fetch import fetch_ifbeam
+import ifbeam_time
+
 # Disable HTTPS warnings
 urllib3.disable_warnings(urllib3.exceptions.InsecureRequestWarning)
 
-def fetch_ifbeam(var, event, t0, t1):
-    """Fetch IFBeam variable as CSV"""
-    url = (
-        f"https://dbdata3vm.fnal.gov:9443/ifbeam/data/data"
-        f"?e={event}&v={var}&t0={t0}&t1={t1}&f=csv"
-    )
-    r = requests.get(url, verify=False)
-    r.raise_for_status()
-    return r.text.splitlines()
-
-def parse_clock(lines):
-    """Extract the clock values from CSV lines"""
-    clocks = []
-    for row in lines[1:]:  # skip header
-        parts = row.strip().split(",")
-        if len(parts) < 4:
-            continue
-        clocks.append(parts[3])
-    return clocks
+# counter: (variable prefix, seconds entries per hit)
+COUNTERS = {
+    "XBTF022638A": ("dip/acc/NORTH/NP02/BI/XTOF/XBTF022638A", 2),
+    "XBTF022638B": ("dip/acc/NORTH/NP02/BI/XTOF/XBTF022638B", 2),
+    "XBTF022670A": ("dip/acc/NORTH/NP02/BI/XTOF/XBTF022670A", 2),
+    "XBTF022670B": ("dip/acc/NORTH/NP02/BI/XTOF/XBTF022670B", 2),
+    "GeneralTrigger": ("dip/acc/NORTH/NP02/BI/TDC/GeneralTrigger", 2),
+    "XCET021667": ("dip/acc/NORTH/NP02/BI/XCET021667", 1),
+    "XCET021669": ("dip/acc/NORTH/NP02/BI/XCET021669", 1),
+}
+# a hit is logged at most this long after it happened [s]
+LOG_DELAY = 60.0
 
-def main():
-    if len(sys.argv) != 5:
-        print("Usage: python3 get_ifbeam_clock.py <event> <t0> <t1> <output_csv>")
-        sys.exit(1)
 
-    event, t0_str, t1_str, output_csv = sys.argv[1:]
+def counter_var_names(counter):
+    """(seconds, coarse, frac) variables of a counter"""
+    prefix, stride = COUNTERS[counter]
+    if stride == 2:
+        return [prefix + ":seconds[]", prefix + ":coarse[]", prefix + ":frac[]"]
+    return [prefix + ":SECONDS", prefix + ":COARSE", prefix + ":FRAC"]
+
 
-    # IFBeam variable names
-    seconds_var = "dip/acc/NORTH/NP02/BI/XTOF/XBTF022638A:seconds[]"
-    coarse_var  = "dip/acc/NORTH/NP02/BI/XTOF/XBTF022638A:coarse[]"
-    frac_var    = "dip/acc/NORTH/NP02/BI/XTOF/XBTF022638A:frac[]"
+def counter_hits(counter, event, t0, t1):
+    """(CounterTimes, logging clock in ms) of the hits of counter in [t0, t1]"""
+    _, stride = COUNTERS[counter]
+    seconds, coarse, frac = (ifbeam_csv.parse_csv_ragged(fetch_ifbeam(v, event, t0, t1))
+                             for v in counter_var_names(counter))
+    coarse_values, coarse_rows = coarse.as_int(return_rows=True)
+    # without the zero padding of the rows, see ifbeam_time
+    times, index = ifbeam_time.decode_times(seconds.as_int(), coarse_values, frac.as_int(),
+                                            stride=stride, return_index=True)
+    return times, coarse.clock_ms[coarse_rows[index]]
 
-    # Fetch clock values for each variable
-    seconds_clock = parse_clock(fetch_ifbeam(seconds_var, event, t0_str, t1_str))
-    coarse_clock  = parse_clock(fetch_ifbeam(coarse_var, event, t0_str, t1_str))
-    frac_clock    = parse_clock(fetch_ifbeam(frac_var, event, t0_str, t1_str))
 
-    # Write clocks to CSV
-    with open(output_csv, "w", newline="") as fout:
+def shard_hits(counters, event, t0, t1, lo_ms=-np.inf, hi_ms=np.inf):
+    """All hits of counters in [t0, t1] from the rows logged in [lo_ms, hi_ms):
+    (ns, sub_ns, counter index, clock_ms)"""
+    parts = []
+    with ifbeam_fetch.prefetch([v for c in counters for v in counter_var_names(c)], event, t0, t1):
+        for k, counter in enumerate(counters):
+            times, clock_ms = counter_hits(counter, event, t0, t1)
+            parts.append((times.ns, times.sub_ns, np.full(len(times), k, dtype=np.int8), clock_ms))
+    hits = tuple(np.concatenate(a) for a in zip(*parts))
+    own = (lo_ms <= hits[3]) & (hits[3] < hi_ms)
+    return tuple(a[own] for a in hits)
+
+
+def dump_clocks(event, t0, t1, output_csv, counters=None, shard_seconds=None):
+    """Write the time-sorted hits of counters in [t0, t1] to output_csv; returns the row count"""
+    counters = list(counters or COUNTERS)
+    # inner shard edges on whole seconds; a row logged on an edge is read by
+    # both shards and kept by the later one only
+    edges = [math.ceil(end) for _, end in ifbeam_fetch.shard_window(t0, t1, shard_seconds)[:-1]]
+    edges = [e for e in edges if e < ifbeam_cache.to_epoch(t1)]
+    bounds = [None] + edges + [None]
+    windows = []
+    for start, end in zip(bounds[:-1], bounds[1:]):
+        s0 = t0 if start is None else ifbeam_cache.to_iso(start, t0)
+        s1 = t1 if end is None else ifbeam_cache.to_iso(end, t0)
+        lo_ms = -np.inf if start is None else start*1000
+        hi_ms = np.inf if end is None else end*1000
+        windows.append((s0, s1, lo_ms, hi_ms, None if end is None else end*ifbeam_time.NS_PER_SEC))
+
+    last_ns = np.full(len(counters), np.iinfo(np.int64).min)
+    delay_ns = int(LOG_DELAY*ifbeam_time.NS_PER_SEC)
+    carry = None
+    written = 0
+    written_ns = np.iinfo(np.int64).min
+    late = 0
+    with open(output_csv, "w", newline="") as fout, ThreadPoolExecutor(1) as ahead:
         writer = csv.writer(fout)
-        writer.writerow(["seconds_clock", "coarse_clock", "frac_clock"])
-        n = max(len(seconds_clock), len(coarse_clock), len(frac_clock))
-        for i in range(n):
-            writer.writerow([
-                seconds_clock[i] if i < len(seconds_clock) else "",
-                coarse_clock[i]  if i < len(coarse_clock)  else "",
-                frac_clock[i]    if i < len(frac_clock)    else ""
-            ])
-
-    print(f"Clock values saved to {output_csv} ({n} rows).")
+        writer.writerow(["time_ns", "sub_ns", "counter", "clock_ms"])
+        # fetch shard k+1 in the background while shard k is sorted and written
+        pending = ahead.submit(shard_hits, counters, event, *windows[0][:4])
+        for k, (*_, end_ns) in enumerate(windows):
+            hits = pending.result()
+            if k + 1 < len(windows):
+                pending = ahead.submit(shard_hits, counters, event, *windows[k+1][:4])
+            ns, _, counter, _ = hits
+            late += int(np.count_nonzero(ns < written_ns))
+            for c in range(len(counters)):
+                own = ns[counter == c]
+                if len(own):
+                    last_ns[c] = max(last_ns[c], own.max())
+            if carry is not None:
+                hits = tuple(np.concatenate(a) for a in zip(carry, hits))
+            ns, sub_ns, counter, clock_ms = hits
+            order = np.lexsort((counter, sub_ns, ns))
+            # a counter's next hit is not earlier than its last one, nor than
+            # LOG_DELAY before the end of this shard
+            if k + 1 < len(windows):
+                watermark = np.maximum(last_ns, end_ns - delay_ns).min()
+                n_out = int(np.searchsorted(ns[order], watermark, side="left"))
+            else:
+                n_out = len(order)
+            out, keep = order[:n_out], order[n_out:]
+            names = np.array(counters, dtype=object)[counter[out]]
+            writer.writerows(zip(ns[out].tolist(), sub_ns[out].astype(np.float64).tolist(),
+                                 names.tolist(), clock_ms[out].tolist()))
+            written += n_out
+            if n_out:
+                written_ns = ns[out[-1]]
+            carry = (ns[keep], sub_ns[keep], counter[keep], clock_ms[keep])
+            print(f"{windows[k][0]} .. {windows[k][1]}: {written} hits written")
+    if late:
+        print(f"WARNING: {late} hits arrived more than {LOG_DELAY} s late and are out of time order")
+    return written
+
+
+def main():
+    parser = ap(description="time-sorted hit times of IFBeam counters")
+    parser.add_argument("event", type=str, help="IFBeam event, e.g. z,pdune")
+    parser.add_argument("t0", type=str)
+    parser.add_argument("t1", type=str)
+    parser.add_argument("output_csv", type=str)
+    parser.add_argument("--counters", type=str, default=",".join(COUNTERS),
+                        help="comma separated, from " + ", ".join(COUNTERS))
+    args = parser.parse_args()
+
+    counters = [c for c in args.counters.split(",") if c]
+    unknown = [c for c in counters if c not in COUNTERS]
+    if unknown:
+        print(f"Unknown counters {unknown}, use some of {list(COUNTERS)}")
+        sys.exit(1)
+
+    n = dump_clocks(args.event, args.t0, args.t1, args.output_csv, counters)
+    print(f"Clock values saved to {args.output_csv} ({n} rows).")
 
 if __name__ == "__main__":
     main()
@@ -1,14 +1,8 @@
 #run this code using the command: python3 dump_beaminst_py -f np02_*_beam.root
 from argparse import ArgumentParser as ap
-import ROOT as RT
-from gallery_utils import read_header, provide_list
+from gallery_utils import read_beam_events
 import numpy as np
 
-read_header('gallery/ValidHandle.h')
-mcprodv = 'std::vector<beam::ProtoDUNEBeamEvent>'
-classes = [mcprodv]
-provide_list(classes)
-
 if __name__ == '__main__':
   parser = ap()
   parser.add_argument('-f', type=str, required=True)
@@ -16,19 +10,16 @@ if __name__ == '__main__':
   args = parser.parse_args()
   
   
-  ev = RT.gallery.Event(RT.vector(RT.string)(1, args.f))
-  nevents = ev.numberOfEventsInFile()
-  get_prods = ev.getValidHandle[mcprodv]
+  # all entries of the file in one C++ loop
+  beam = read_beam_events(args.f, args.tag)
+  offsets = beam['momenta_offsets']
   
-  for i in range(nevents):
-    ev.goToEntry(i)
-    prods = get_prods(RT.art.InputTag(args.tag))
-    prod = prods.product()[0]
+  for i in np.flatnonzero(beam['valid']):
     momenta_str = [
-      float(f'{p:.2f}') for p in prod.GetRecoBeamMomenta()
+      float(f'{p:.2f}') for p in beam['momenta'][offsets[i]:offsets[i+1]]
     ]
-    print(f'Trigger:{prod.GetTimingTrigger()}, TOF:{prod.GetTOF():.2f}, '
-          f'High Pres. CKov:{prod.GetCKov0Status()}, '
-          f'Low Pres. CKov: {prod.GetCKov1Status()}, '
+    print(f'Trigger:{beam["trigger"][i]}, TOF:{beam["tof"][i]:.2f}, '
+          f'High Pres. CKov:{beam["ckov0"][i]}, '
+          f'Low Pres. CKov: {beam["ckov1"][i]}, '
           f'Possible Momenta:{momenta_str}')
   
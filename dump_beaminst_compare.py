@@ -1,51 +1,89 @@
 # after merging the beam info root file from different runs, run this code by using this command to get the TOF values: 
 # use this command: python3 dump_beaminst_compare.py -f merged_39252.root merged_39255.root merged_39273.root merged_39324.root --out comparison.root
+import multiprocessing
+import os
 from argparse import ArgumentParser as ap
-import ROOT as RT
-from gallery_utils import read_header, provide_list
+from concurrent.futures import ProcessPoolExecutor
+from beam_skim import fresh_skim, load_beam_events
 import numpy as np
 
-# Setup gallery and product definitions
-read_header('gallery/ValidHandle.h')
-mcprodv = 'std::vector<beam::ProtoDUNEBeamEvent>'
-classes = [mcprodv]
-provide_list(classes)
+# TOF histogram of every run: TH1F binning
+TOF_BINS, TOF_MIN, TOF_MAX = 200, 0.0, 150.0
+
+
+def warm_up(need_gallery):
+    # gallery/PyROOT jitting is not thread safe: every worker process does its
+    # own, once, before its first file (not needed when all skims are fresh)
+    if need_gallery:
+        from gallery_utils import provide_beam_extractor
+        provide_beam_extractor()
+
+
+def tof_histogram(fname, tag, skim_dir):
+    """TOF histogram of one file as arrays, as TH1F.Fill would make it:
+    (bin contents incl. under/overflow, [sumw, sumw2, sumwx, sumwx2], entries)"""
+    beam = load_beam_events(fname, tag, skim_dir)
+    tof = beam['tof'][beam['valid'] == 1]
+    tof = tof[(tof > 0) & (tof < 500)]
+    # TAxis::FindBin: bin 0 underflow, 1..TOF_BINS, TOF_BINS+1 overflow
+    bins = np.clip(np.floor(TOF_BINS*(tof - TOF_MIN)/(TOF_MAX - TOF_MIN)), -1, TOF_BINS).astype(np.int64) + 1
+    counts = np.bincount(bins, minlength=TOF_BINS + 2).astype(np.float64)
+    # the statistics only count fills inside the axis range
+    inside = tof[(bins > 0) & (bins <= TOF_BINS)]
+    stats = np.array([len(inside), len(inside), inside.sum(), (inside**2).sum()])
+    return counts, stats, len(tof)
+
+
+def run_histograms(files, tag, skim_dir, jobs):
+    """{run number: (counts, stats, entries)}, files of the same run added up"""
+    runs = [fname.split('_')[-1].replace('.root','') for fname in files]  # e.g., 39252
+    jobs = max(1, min(jobs, len(files)))
+    if jobs == 1:
+        results = [tof_histogram(fname, tag, skim_dir) for fname in files]
+    else:
+        need_gallery = any(fresh_skim(fname, tag, skim_dir) is None for fname in files)
+        # spawn, not fork: the workers must not inherit a half-initialized ROOT
+        with ProcessPoolExecutor(jobs, mp_context=multiprocessing.get_context('spawn'),
+                                 initializer=warm_up, initargs=(need_gallery,)) as pool:
+            results = list(pool.map(tof_histogram, files, [tag]*len(files), [skim_dir]*len(files)))
+    merged = {}
+    for run_number, (counts, stats, entries) in zip(runs, results):
+        if run_number in merged:
+            c, st, n = merged[run_number]
+            counts, stats, entries = c + counts, st + stats, n + entries
+        merged[run_number] = (counts, stats, entries)
+    return merged
+
 
 if __name__ == '__main__':
+    import ROOT as RT
     parser = ap()
     parser.add_argument('-f', type=str, nargs='+', required=True,
                         help='List of input ROOT files')
     parser.add_argument('--tag', type=str, default='beamevent')
     parser.add_argument('--out', type=str, default='output.root',
                         help='Output ROOT file with histograms')
+    parser.add_argument('--skim-dir', type=str, default=None,
+                        help='Directory of the beam skims (default: next to the inputs)')
+    parser.add_argument('-j', '--jobs', type=int, default=os.cpu_count() or 1,
+                        help='Worker processes, one file at a time each')
     args = parser.parse_args()
 
     colors = [RT.kRed, RT.kBlue, RT.kGreen+2, RT.kMagenta]  # up to 4 files
     hists = []
 
-    # Loop over all input files
-    for ifile, fname in enumerate(args.f):
-        ev = RT.gallery.Event(RT.vector(RT.string)(1, fname))
-        nevents = ev.numberOfEventsInFile()
-        get_prods = ev.getValidHandle[mcprodv]
+    # Histogram the input files in parallel processes, then merge per run
+    runs = run_histograms(args.f, args.tag, args.skim_dir, args.jobs)
 
-        # Create histogram per file
-                # Create histogram per file
-        run_number = fname.split('_')[-1].replace('.root','')  # e.g., 39252
+    for ifile, (run_number, (counts, stats, entries)) in enumerate(runs.items()):
         h_tof = RT.TH1F(f"h_tof_{run_number}",
                         f"TOF Distribution ProtoDUNE VD Runs;TOF [ns];Events",
-                        200, 0, 150)
+                        TOF_BINS, TOF_MIN, TOF_MAX)
         h_tof.SetDirectory(0)   # prevent it being tied to input file
-
-
-        for i in range(nevents):
-            ev.goToEntry(i)
-            prods = get_prods(RT.art.InputTag(args.tag))
-            prod = prods.product()[0]
-
-            tof = prod.GetTOF()
-            if 0 < tof < 500:
-                h_tof.Fill(tof)
+        for b, c in enumerate(counts):
+            h_tof.SetBinContent(b, c)
+        h_tof.PutStats(np.ascontiguousarray(stats, dtype=np.float64))
+        h_tof.SetEntries(entries)
 
         h_tof.SetLineColor(colors[ifile % len(colors)])
         h_tof.SetLineWidth(2)
@@ -1,27 +1,24 @@
 #run this code by using the command: python3 dump_beamins_plot.py -f np02_*_beam.root
 from argparse import ArgumentParser as ap
 import ROOT as RT
-from gallery_utils import read_header, provide_list
+from beam_skim import load_beam_events
 import numpy as np
 
-# Setup gallery and product definitions
-read_header('gallery/ValidHandle.h')
-mcprodv = 'std::vector<beam::ProtoDUNEBeamEvent>'
-classes = [mcprodv]
-provide_list(classes)
-
 if __name__ == '__main__':
     parser = ap()
     parser.add_argument('-f', type=str, required=True)
     parser.add_argument('--tag', type=str, default='beamevent')
     parser.add_argument('--out', type=str, default='output.root',
                         help='Output ROOT file with histograms')
+    parser.add_argument('--skim-dir', type=str, default=None,
+                        help='Directory of the beam skims (default: next to the inputs)')
+    parser.add_argument('-j', '--jobs', type=int, default=1,
+                        help='Worker processes reading disjoint entry ranges of the file')
     args = parser.parse_args()
     
-    # Input file
-    ev = RT.gallery.Event(RT.vector(RT.string)(1, args.f))
-    nevents = ev.numberOfEventsInFile()
-    get_prods = ev.getValidHandle[mcprodv]
+    # Input file: from its skim if up to date, else all entries in C++ loops,
+    # one entry range per worker process
+    beam = load_beam_events(args.f, args.tag, args.skim_dir, jobs=args.jobs)
     
     # Define histograms
     # Updated main title includes ProtoDUNE VD Run No: 39324
@@ -31,32 +28,27 @@ if __name__ == '__main__':
     h_ckov1 = RT.TH1I("h_ckov1", "Low Pressure Ckov Status;Status;Events", 5, 0, 5)
     h_momenta = RT.TH1F("h_momenta", "Reco Beam Momenta;Momentum [GeV/c];Events", 100, 0, 10)
 
-    for i in range(nevents):
-        ev.goToEntry(i)
-        prods = get_prods(RT.art.InputTag(args.tag))
-        prod = prods.product()[0]
-
-        tof = prod.GetTOF()
-        trig = prod.GetTimingTrigger()
-        ckov0 = prod.GetCKov0Status()
-        ckov1 = prod.GetCKov1Status()
-        momenta = prod.GetRecoBeamMomenta()
-
-        # Fill histograms only if 0 < TOF < 500 ns
-        if 0 < tof < 500:
-            h_tof.Fill(tof)
-            h_trigger.Fill(trig)
-            h_ckov0.Fill(ckov0)
-            h_ckov1.Fill(ckov1)
-            for p in momenta:
-                h_momenta.Fill(p)
+    # Fill histograms only if 0 < TOF < 500 ns
+    tof = beam['tof']
+    offsets = beam['momenta_offsets']
+    sel = (beam['valid'] == 1) & (tof > 0) & (tof < 500)
+    selected_momenta = beam['momenta'][np.repeat(sel, np.diff(offsets))]
+    for h, values in [(h_tof, tof[sel]),
+                      (h_trigger, beam['trigger'][sel]),
+                      (h_ckov0, beam['ckov0'][sel]),
+                      (h_ckov1, beam['ckov1'][sel]),
+                      (h_momenta, selected_momenta)]:
+        values = np.ascontiguousarray(values, dtype=np.float64)
+        if len(values):
+            h.FillN(len(values), values, np.ones(len(values)))
 
-            # (Optional) still print for checking
-            momenta_str = [float(f'{p:.2f}') for p in momenta]
-            print(f'Trigger:{trig}, TOF:{tof:.2f}, '
-                  f'High Pres. CKov:{ckov0}, '
-                  f'Low Pres. CKov:{ckov1}, '
-                  f'Possible Momenta:{momenta_str}')
+    # (Optional) still print for checking
+    for i in np.flatnonzero(sel):
+        momenta_str = [float(f'{p:.2f}') for p in beam['momenta'][offsets[i]:offsets[i+1]]]
+        print(f'Trigger:{beam["trigger"][i]}, TOF:{tof[i]:.2f}, '
+              f'High Pres. CKov:{beam["ckov0"][i]}, '
+              f'Low Pres. CKov:{beam["ckov1"][i]}, '
+              f'Possible Momenta:{momenta_str}')
 
     # Save histograms to file
     fout = RT.TFile(args.out, "RECREATE")
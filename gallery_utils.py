@@ -1,6 +1,53 @@
+"""Helpers to read art/ROOT files with gallery from PyROOT.
+
+Cling has to parse the gallery headers and instantiate getValidHandle<T> for
+every product type before the first event can be read, which takes seconds
+at every start (and in every worker process).  The first time, the
+instantiations for PRODUCT_TYPES and the beam extractor are compiled into a
+shared library with ACLiC, kept in $GALLERY_UTILS_CACHE_DIR (default
+~/.cache/gallery_utils) under a key of the ROOT and art/LArSoft/DUNE
+versions; later starts only load it.  When the library cannot be built or
+loaded, or with GALLERY_UTILS_NO_CACHE=1, everything is jitted as before (a
+failed build is not retried for the same key; delete its directory to retry).
+bench_gallery_startup.py compares the two.
+"""
+import fcntl
+import hashlib
+import json
+import multiprocessing
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
 import ROOT as RT
+
+# product types of the beam and detsim scripts, precompiled
+PRODUCT_TYPES = ['std::vector<beam::ProtoDUNEBeamEvent>',
+                 'std::vector<raw::RawDigit>',
+                 'std::vector<recob::Wire>',
+                 'std::vector<recob::Hit>']
+PRODUCT_HEADERS = ['dunecore/DuneObj/ProtoDUNEBeamEvent.h',
+                   'lardataobj/RawData/RawDigit.h',
+                   'lardataobj/RecoBase/Wire.h',
+                   'lardataobj/RecoBase/Hit.h']
+GALLERY_HEADERS = ['canvas/Utilities/InputTag.h', 'gallery/Event.h',
+                   'gallery/Handle.h', 'gallery/ValidHandle.h']
+# versions the compiled library depends on (UPS/spack setups export these)
+VERSION_VARIABLES = ['GALLERY_VERSION', 'CANVAS_VERSION', 'CANVAS_ROOT_IO_VERSION',
+                     'LARDATAOBJ_VERSION', 'DUNECORE_VERSION', 'DUNESW_VERSION',
+                     'ROOT_INCLUDE_PATH']
+CACHE_DIR = os.environ.get('GALLERY_UTILS_CACHE_DIR',
+                           os.path.join(os.path.expanduser('~'), '.cache', 'gallery_utils'))
+NO_CACHE = os.environ.get('GALLERY_UTILS_NO_CACHE', '') not in ('', '0')
+
+_compiled = None        # None: not tried yet, else True/False
+_jitted = set()
+
+
 def read_header(h):
   #Make the ROOT C++ jit compiler read the specified header.
+  if h in GALLERY_HEADERS and load_compiled():
+    return  # already in the dictionary of the compiled library
   RT.gROOT.ProcessLine('#include "%s"' % h)
 
 
@@ -8,9 +55,191 @@ def provide_get_valid_handle(klass):
   """Make the ROOT C++ jit compiler instantiate the
      Event::getValidHandle member template for template
      parameter klass."""
+  if klass in PRODUCT_TYPES and load_compiled():
+    return
   RT.gROOT.ProcessLine('template gallery::ValidHandle<%(name)s> gallery::Event::getValidHandle<%(name)s>(art::InputTag const&) const;' % {'name' : klass})
 
 
 def provide_list(classes):
   for c in classes:
     provide_get_valid_handle(c)
+
+
+# C++ loop over all entries of a file, copying the ProtoDUNEBeamEvent fields
+# into contiguous arrays, so python crosses into C++ once per file instead of
+# several times per event
+BEAM_EXTRACTOR = r'''
+#include "canvas/Utilities/InputTag.h"
+#include "gallery/Event.h"
+#include "gallery/Handle.h"
+
+namespace pdvd {
+// Entries first .. first+n-1 go to index i = 0 .. n-1 of the arrays.
+// valid[i] = 0 for entries without a beam event; their values stay 0.
+// Entry i has the reco momenta momenta[offsets[i]:offsets[i+1]].
+long extract_beam_events(gallery::Event& ev, const std::string& tag, long first, long n,
+                         int* run, int* subrun, int* event,
+                         double* tof, int* trigger, int* ckov0, int* ckov1,
+                         int* valid, long* offsets, std::vector<double>& momenta)
+{
+  const art::InputTag input_tag(tag);
+  gallery::Handle<std::vector<beam::ProtoDUNEBeamEvent>> prods;
+  offsets[0] = 0;
+  long i = 0;
+  for (; i < n; ++i) {
+    ev.goToEntry(first + i);
+    offsets[i + 1] = offsets[i];
+    const art::EventAuxiliary& aux = ev.eventAuxiliary();
+    run[i] = aux.run();
+    subrun[i] = aux.subRun();
+    event[i] = aux.event();
+    if (!ev.getByLabel(input_tag, prods) || prods->empty()) continue;
+    const beam::ProtoDUNEBeamEvent& prod = prods->front();
+    valid[i] = 1;
+    tof[i] = prod.GetTOF();
+    trigger[i] = prod.GetTimingTrigger();
+    ckov0[i] = prod.GetCKov0Status();
+    ckov1[i] = prod.GetCKov1Status();
+    const std::vector<double>& p = prod.GetRecoBeamMomenta();
+    momenta.insert(momenta.end(), p.begin(), p.end());
+    offsets[i + 1] += p.size();
+  }
+  return i;
+}
+}
+'''
+
+
+def helper_source():
+  """C++ source of the compiled library: headers, instantiations, extractor"""
+  lines = ['#include "%s"' % h for h in GALLERY_HEADERS + PRODUCT_HEADERS]
+  for klass in PRODUCT_TYPES:
+    lines.append('template gallery::ValidHandle<%(name)s> gallery::Event::getValidHandle<%(name)s>(art::InputTag const&) const;' % {'name' : klass})
+    lines.append('template bool gallery::Event::getByLabel<%(name)s>(art::InputTag const&, gallery::Handle<%(name)s>&) const;' % {'name' : klass})
+  return '\n'.join(lines) + '\n' + BEAM_EXTRACTOR
+
+
+def environment_key():
+  """Hash of the ROOT and product versions and of the helper source"""
+  env = {'root': RT.gROOT.GetVersion(), 'source': helper_source()}
+  env.update({v: os.environ.get(v, '') for v in VERSION_VARIABLES})
+  return hashlib.sha1(json.dumps(env, sort_keys=True).encode()).hexdigest()[:16]
+
+
+def load_compiled():
+  """Load (building it the first time) the compiled helper library of this
+  environment; False if that is not possible and the jit has to be used"""
+  global _compiled
+  if _compiled is not None:
+    return _compiled
+  _compiled = False
+  if NO_CACHE:
+    return False
+  try:
+    build_dir = os.path.join(CACHE_DIR, environment_key())
+    os.makedirs(build_dir, exist_ok=True)
+    src = os.path.join(build_dir, 'gallery_helpers.C')
+    lib = os.path.join(build_dir, 'gallery_helpers_C.so')
+    # one process builds, the others (e.g. pool workers) wait and load
+    with open(os.path.join(build_dir, 'lock'), 'w') as lock:
+      fcntl.flock(lock, fcntl.LOCK_EX)
+      if not os.path.exists(lib):
+        if os.path.exists(os.path.join(build_dir, 'failed')):
+          return False
+        with open(src, 'w') as fout:
+          fout.write(helper_source())
+        if not RT.gSystem.CompileMacro(src, 'kO', '', build_dir):
+          open(os.path.join(build_dir, 'failed'), 'w').close()
+          print('WARNING: could not compile the gallery helpers, using the jit')
+          return False
+      elif RT.gSystem.Load(lib) < 0:
+        return False
+  except OSError as e:
+    print(f'WARNING: gallery helper cache not usable ({e}), using the jit')
+    return False
+  _compiled = True
+  return True
+
+
+def provide_beam_extractor():
+  """Make pdvd::extract_beam_events available, once per process: from the
+  compiled library, or declared to the jit."""
+  if load_compiled() or 'extractor' in _jitted:
+    return
+  if not RT.gInterpreter.Declare(BEAM_EXTRACTOR):
+    raise RuntimeError('could not compile the ProtoDUNEBeamEvent extractor')
+  _jitted.add('extractor')
+
+
+def count_entries(fname):
+  return int(RT.gallery.Event(RT.vector(RT.string)(1, fname)).numberOfEventsInFile())
+
+
+def read_beam_events(fname, tag='beamevent', first=0, last=None):
+  """Beam instrumentation of the entries [first, last) of fname (default: all)
+  as numpy arrays, in one C++ loop.
+
+  Returns a dict with run, subrun, event, tof, trigger, ckov0, ckov1 and
+  valid (one entry per event; valid is 0 where the event has no beam
+  product) and the reco momenta
+  as momenta + momenta_offsets (event i: momenta[offsets[i]:offsets[i+1]]).
+  """
+  provide_beam_extractor()
+  ev = RT.gallery.Event(RT.vector(RT.string)(1, fname))
+  total = ev.numberOfEventsInFile()
+  last = total if last is None else min(last, total)
+  n = max(last - first, 0)
+  out = {'run': np.zeros(n, dtype=np.int32),
+         'subrun': np.zeros(n, dtype=np.int32),
+         'event': np.zeros(n, dtype=np.int32),
+         'tof': np.zeros(n, dtype=np.float64),
+         'trigger': np.zeros(n, dtype=np.int32),
+         'ckov0': np.zeros(n, dtype=np.int32),
+         'ckov1': np.zeros(n, dtype=np.int32),
+         'valid': np.zeros(n, dtype=np.int32),
+         'momenta_offsets': np.zeros(n + 1, dtype=np.int64)}
+  momenta = RT.std.vector('double')()
+  RT.pdvd.extract_beam_events(ev, tag, first, n, out['run'], out['subrun'], out['event'],
+                              out['tof'], out['trigger'], out['ckov0'], out['ckov1'],
+                              out['valid'], out['momenta_offsets'], momenta)
+  out['momenta'] = np.array(momenta, dtype=np.float64)
+  return out
+
+
+def entry_ranges(n, shards):
+  """[(first, last)] splitting entries 0..n-1 into at most shards contiguous ranges"""
+  edges = np.linspace(0, n, max(min(shards, n), 1) + 1).round().astype(np.int64)
+  return [(int(a), int(b)) for a, b in zip(edges[:-1], edges[1:])]
+
+
+def concat_beam_events(parts):
+  """One read_beam_events() dict from the dicts of consecutive entry ranges, in order"""
+  out = {k: np.concatenate([p[k] for p in parts])
+         for k in parts[0] if k != 'momenta_offsets'}
+  offsets = [np.zeros(1, dtype=np.int64)]
+  for p in parts:
+    offsets.append(p['momenta_offsets'][1:] + offsets[-1][-1])
+  out['momenta_offsets'] = np.concatenate(offsets)
+  return out
+
+
+def _read_range(args):
+  return read_beam_events(*args)
+
+
+def read_beam_events_sharded(fname, tag='beamevent', jobs=1):
+  """read_beam_events(fname, tag) with the entries split over jobs worker
+  processes, each opening the file and reading its own contiguous range.
+  The ranges are put back together in entry order, so the result is the
+  same as the one-process read."""
+  if jobs <= 1:
+    return read_beam_events(fname, tag)
+  ranges = entry_ranges(count_entries(fname), jobs)
+  if len(ranges) <= 1:
+    return read_beam_events(fname, tag)
+  # separate processes (spawned, not forked): the gallery/cling jit is not
+  # thread safe, and every worker declares the extractor once
+  with ProcessPoolExecutor(len(ranges), mp_context=multiprocessing.get_context('spawn'),
+                           initializer=provide_beam_extractor) as pool:
+    parts = list(pool.map(_read_range, [(fname, tag, a, b) for a, b in ranges]))
+  return concat_beam_events(parts)
@@ -0,0 +1,268 @@
+"""On-disk cache for IFBeam CSV queries.
+
+Data are stored per (event, variable) in fixed time chunks (one hour by
+default), so a later query over an overlapping or wider t0/t1 window only
+goes to the database for the chunks it does not have yet.
+
+Chunks whose end is older than the live-data horizon at fetch time are
+stored as final and never refetched.  More recent chunks are provisional and
+are refetched once they are older than PROVISIONAL_TTL.  The total size of
+the cache is kept below max_bytes by dropping the least recently used chunks;
+the directory walk for that runs in one thread at a time and at most every
+EVICT_INTERVAL seconds.  A chunk that disappears between its lookup and its
+read (evicted by another thread or process) is fetched again.
+
+The cache lives in $IFBEAM_CACHE_DIR (default ~/.cache/ifbeam) and can be
+switched off with IFBEAM_NO_CACHE=1.
+"""
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+from urllib.parse import quote
+
+CHUNK_SECONDS = 3600
+LIVE_HORIZON = 3600
+PROVISIONAL_TTL = 300
+MAX_BYTES = 2 * 1024**3
+MAX_WORKERS = 4
+EVICT_INTERVAL = 60
+
+
+def to_epoch(t):
+    """Convert an IFBeam time (ISO 8601 string or epoch seconds) to epoch seconds"""
+    if isinstance(t, (int, float)):
+        return float(t)
+    t = str(t).strip()
+    try:
+        return float(t)
+    except ValueError:
+        pass
+    dt = datetime.fromisoformat(t.replace("Z", "+00:00"))
+    if dt.tzinfo is None:
+        dt = dt.replace(tzinfo=timezone.utc)
+    return dt.timestamp()
+
+
+def to_iso(ts, like=None):
+    """Format epoch seconds as ISO 8601, using the UTC offset of `like` if given"""
+    tz = timezone.utc
+    if isinstance(like, str):
+        try:
+            ref = datetime.fromisoformat(like.replace("Z", "+00:00"))
+            if ref.tzinfo is not None:
+                tz = ref.tzinfo
+        except ValueError:
+            pass
+    return datetime.fromtimestamp(ts, tz).isoformat()
+
+
+def row_clock_ms(row):
+    """Logging time (ms since epoch) of an IFBeam CSV row, or None"""
+    parts = row.split(",", 4)
+    if len(parts) < 4:
+        return None
+    try:
+        return int(float(parts[3]))
+    except ValueError:
+        return None
+
+
+class IFBeamCache:
+    def __init__(self, root, chunk_seconds=CHUNK_SECONDS, live_horizon=LIVE_HORIZON,
+                 provisional_ttl=PROVISIONAL_TTL, max_bytes=MAX_BYTES, max_workers=MAX_WORKERS,
+                 evict_interval=EVICT_INTERVAL):
+        self.root = os.path.expanduser(root)
+        self.chunk_seconds = int(chunk_seconds)
+        self.live_horizon = live_horizon
+        self.provisional_ttl = provisional_ttl
+        self.max_bytes = max_bytes
+        self.max_workers = max_workers
+        self.evict_interval = evict_interval
+        self._evict_lock = threading.Lock()
+        self._last_evict = None
+
+    # ---------------------------------------------------------------
+    # Chunk bookkeeping
+    # ---------------------------------------------------------------
+    def _dir(self, var, event):
+        return os.path.join(self.root, quote(event, safe=""), quote(var, safe=""))
+
+    def _path(self, var, event, start, final):
+        suffix = ".final.csv" if final else ".csv"
+        return os.path.join(self._dir(var, event), f"{start}{suffix}")
+
+    def chunk_starts(self, t0, t1):
+        """Start times of the chunks covering [t0, t1]"""
+        first = int(to_epoch(t0)) // self.chunk_seconds * self.chunk_seconds
+        last = int(to_epoch(t1)) // self.chunk_seconds * self.chunk_seconds
+        return list(range(first, last + 1, self.chunk_seconds))
+
+    def _lookup(self, var, event, start, now):
+        """Path of a usable cached chunk, or None if it has to be (re)fetched"""
+        path = self._path(var, event, start, final=True)
+        if os.path.exists(path):
+            return path
+        path = self._path(var, event, start, final=False)
+        try:
+            if now - os.path.getmtime(path) < self.provisional_ttl:
+                return path
+        except FileNotFoundError:
+            pass
+        return None
+
+    def _read(self, path):
+        """Lines of a cached chunk, or None if it was removed in the meantime"""
+        try:
+            with open(path) as fin:
+                lines = fin.read().splitlines()
+            os.utime(path, (time.time(), os.path.getmtime(path)))
+        except FileNotFoundError:
+            return None
+        return lines
+
+    def _write(self, var, event, start, lines, final):
+        path = self._path(var, event, start, final)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(tmp, "w") as fout:
+            fout.writelines(line + "\n" for line in lines)
+        os.replace(tmp, path)
+        if final:
+            stale = self._path(var, event, start, final=False)
+            if os.path.exists(stale):
+                os.remove(stale)
+
+    # ---------------------------------------------------------------
+    # Fetching
+    # ---------------------------------------------------------------
+    def _fetch_chunk(self, var, event, start, like, fetcher, now):
+        end = start + self.chunk_seconds
+        lines = fetcher(var, event, to_iso(start, like), to_iso(end, like))
+        header = lines[:1]
+        rows = []
+        for row in lines[1:]:
+            clock = row_clock_ms(row)
+            if clock is not None and start*1000 <= clock < end*1000:
+                rows.append(row)
+        chunk = header + rows
+        self._write(var, event, start, chunk, final=(now >= end + self.live_horizon))
+        return chunk
+
+    def fetch(self, var, event, t0, t1, fetcher):
+        """Return the CSV lines for var in [t0, t1], using fetcher(var, event, t0, t1)
+        only for the chunks that are missing or stale"""
+        now = time.time()
+        t0_ms = int(to_epoch(t0) * 1000)
+        t1_ms = int(to_epoch(t1) * 1000)
+
+        starts = self.chunk_starts(t0, t1)
+        paths = [self._lookup(var, event, start, now) for start in starts]
+        missing = [start for start, path in zip(starts, paths) if path is None]
+
+        # missing chunks are fetched in parallel
+        fetched = {}
+        if len(missing) == 1:
+            fetched[missing[0]] = self._fetch_chunk(var, event, missing[0], t0, fetcher, now)
+        elif missing:
+            with ThreadPoolExecutor(max_workers=min(self.max_workers, len(missing))) as pool:
+                chunks = pool.map(lambda start: self._fetch_chunk(var, event, start, t0, fetcher, now),
+                                  missing)
+                fetched = dict(zip(missing, chunks))
+
+        header = []
+        rows = []
+        for start, path in zip(starts, paths):
+            chunk = fetched[start] if path is None else self._read(path)
+            if chunk is None:
+                # evicted since the lookup: a miss after all
+                chunk = fetched[start] = self._fetch_chunk(var, event, start, t0, fetcher, now)
+            if chunk and not header:
+                header = chunk[:1]
+            for row in chunk[1:]:
+                clock = row_clock_ms(row)
+                if clock is not None and t0_ms <= clock <= t1_ms:
+                    rows.append(row)
+
+        if fetched:
+            self.evict()
+        return header + rows
+
+    def evict(self, force=False):
+        """Drop least recently used chunks until the cache fits in max_bytes.
+
+        Skipped while another thread is evicting, and if the last eviction is
+        less than evict_interval seconds ago (unless force).
+        """
+        if not self._evict_lock.acquire(blocking=False):
+            return
+        try:
+            now = time.monotonic()
+            if not force and self._last_evict is not None and \
+                    now - self._last_evict < self.evict_interval:
+                return
+            self._last_evict = now
+            self._evict()
+        finally:
+            self._evict_lock.release()
+
+    def _evict(self):
+        files = []
+        total = 0
+        for dirpath, _, names in os.walk(self.root):
+            for name in names:
+                if not name.endswith(".csv"):
+                    continue
+                path = os.path.join(dirpath, name)
+                try:
+                    st = os.stat(path)
+                except FileNotFoundError:
+                    continue
+                files.append((st.st_atime, st.st_size, path))
+                total += st.st_size
+        files.sort()
+        for _, size, path in files:
+            if total <= self.max_bytes:
+                break
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+            total -= size
+
+    def clear(self):
+        """Remove every cached chunk"""
+        for dirpath, _, names in os.walk(self.root, topdown=False):
+            for name in names:
+                if name.endswith(".csv"):
+                    os.remove(os.path.join(dirpath, name))
+
+
+_caches = {}
+_caches_lock = threading.Lock()
+
+
+def get_cache(server=""):
+    """Process-wide cache for one server, or None if disabled with IFBEAM_NO_CACHE.
+
+    Every server (e.g. the real database and a local stand-in) gets its own
+    subdirectory, so their data never mix.
+    """
+    if os.environ.get("IFBEAM_NO_CACHE", "") not in ("", "0"):
+        return None
+    with _caches_lock:
+        cache = _caches.get(server)
+        if cache is None:
+            root = os.environ.get("IFBEAM_CACHE_DIR", "~/.cache/ifbeam")
+            cache = IFBeamCache(os.path.join(root, quote(server, safe="")) if server else root)
+            _caches[server] = cache
+    return cache
+
+
+def cached_fetch(var, event, t0, t1, fetcher, server=""):
+    """fetcher(var, event, t0, t1) through the process-wide cache of server"""
+    cache = get_cache(server)
+    if cache is None:
+        return fetcher(var, event, t0, t1)
+    return cache.fetch(var, event, t0, t1, fetcher)
@@ -0,0 +1,127 @@
+"""Ragged (CSR) parsing of IFBeam CSV responses.
+
+Each CSV row is  event(2 fields),variable,clock,units,v0,v1,...  where clock
+is the logging time in ms since the epoch and v0... the (array) value logged
+at that time.  parse_csv_ragged() keeps the row structure instead of
+flattening it:
+
+    values   float64, all row values one after the other
+    offsets  int64, row i is values[offsets[i]:offsets[i+1]]
+    clock_ms int64, logging time of each row
+
+The numbers of all rows are converted in one numpy call; only rows with
+malformed numbers fall back to per-value parsing.  Slow-control variables
+(momentum, pressures, counts) can be aligned to trigger times with asof().
+"""
+import numpy as np
+
+import ifbeam_stats
+
+
+class RaggedValues:
+    __slots__ = ("values", "offsets", "clock_ms")
+
+    def __init__(self, values, offsets, clock_ms):
+        self.values = values
+        self.offsets = offsets
+        self.clock_ms = clock_ms
+
+    def __len__(self):
+        return len(self.clock_ms)
+
+    @property
+    def counts(self):
+        return np.diff(self.offsets)
+
+    def row(self, i):
+        return self.values[self.offsets[i]:self.offsets[i+1]]
+
+    def as_int(self, return_rows=False):
+        """Values truncated to int64, as parse_csv_value always returned them.
+
+        A value that is not a finite int64 (nan, inf) ends its row, as the
+        per-value parsing of parse_csv_value did; with return_rows, also
+        returns the row of every value kept.
+        """
+        values = self.values
+        bad = ~(np.abs(values) < 2.0**63)       # also true for nan
+        if not bad.any():
+            ints = np.trunc(values).astype(np.int64)
+            return (ints, self.row_of_value()) if return_rows else ints
+        rows = self.row_of_value()
+        pos = np.arange(len(values))
+        first_bad = np.full(len(self), len(values), dtype=np.int64)
+        np.minimum.at(first_bad, rows[bad], pos[bad])
+        keep = pos < first_bad[rows]
+        ints = np.trunc(values[keep]).astype(np.int64)
+        return (ints, rows[keep]) if return_rows else ints
+
+    def element(self, k=0, fill=np.nan):
+        """k-th value of every row (fill for rows that are too short)"""
+        out = np.full(len(self), fill, dtype=np.float64)
+        has = self.counts > k
+        out[has] = self.values[self.offsets[:-1][has] + k]
+        return out
+
+    def row_of_value(self):
+        """Row index of every entry of values"""
+        return np.repeat(np.arange(len(self)), self.counts)
+
+    def asof(self, times_ms, k=0, fill=0.0):
+        """k-th value in effect at each of times_ms (as-of join on the row clocks).
+
+        Each time gets the last row logged at or before it; times before the
+        first row get the first row, as nothing earlier was fetched.  fill is
+        used when there are no rows with a k-th value at all.
+        """
+        times_ms = np.asarray(times_ms, dtype=np.int64)
+        has = self.counts > k
+        clock = self.clock_ms[has]
+        vals = self.values[self.offsets[:-1][has] + k]
+        if len(clock) == 0:
+            return np.full(len(times_ms), fill, dtype=np.float64)
+        order = np.argsort(clock, kind="stable")
+        clock, vals = clock[order], vals[order]
+        idx = np.searchsorted(clock, times_ms, side="right") - 1
+        return vals[np.clip(idx, 0, len(vals) - 1)]
+
+
+def _parse_values_slow(text):
+    """Per-value parsing of one row, keeping the values before a bad one"""
+    values = []
+    for x in text.split(","):
+        try:
+            values.append(float(x))
+        except ValueError:
+            break
+    return values
+
+
+@ifbeam_stats.timed("parse_csv")
+def parse_csv_ragged(lines):
+    """Parse IFBeam CSV lines (header first) into RaggedValues"""
+    clocks = []
+    texts = []
+    for row in lines[1:]:  # skip header
+        parts = row.strip().split(",", 5)
+        if len(parts) < 4:
+            continue  # skip malformed lines
+        try:
+            clocks.append(int(float(parts[3])))
+        except ValueError:
+            clocks.append(0)
+        texts.append(parts[5] if len(parts) > 5 else "")
+
+    counts = np.array([t.count(",") + 1 if t else 0 for t in texts], dtype=np.int64)
+    try:
+        joined = ",".join(t for t in texts if t)
+        values = np.array(joined.split(",") if joined else [], dtype=np.float64)
+    except ValueError:
+        rows = [_parse_values_slow(t) if t else [] for t in texts]
+        counts = np.array([len(r) for r in rows], dtype=np.int64)
+        values = np.array([v for r in rows for v in r], dtype=np.float64)
+
+    offsets = np.zeros(len(counts) + 1, dtype=np.int64)
+    np.cumsum(counts, out=offsets[1:])
+    ifbeam_stats.count("parse_csv", rows=len(counts), values=len(values))
+    return RaggedValues(values, offsets, np.array(clocks, dtype=np.int64))
@@ -0,0 +1,240 @@
+"""Fetch layer for the IFBeam database.
+
+All requests share one pooled HTTPS session, and independent variables can be
+fetched concurrently with prefetch().  Prefetched CSVs are kept in memory until
+the matching fetch_ifbeam() call picks them up, so code written as a sequence
+of get_var_values() calls gets the concurrency without being rewritten.  The
+ones still there at the end of the with block are dropped, so a call that
+never happened (e.g. after an error on a sibling variable) cannot serve an
+old response to a later request for the same window:
+
+    with prefetch([prefix + ":seconds[]", prefix + ":coarse[]"], event, t0, t1):
+        seconds = get_var_values(t0, t1, prefix + ":seconds[]")   # no network
+        coarse  = get_var_values(t0, t1, prefix + ":coarse[]")    # no network
+
+The number of concurrent requests is capped by IFBEAM_MAX_WORKERS (default 8).
+
+Windows longer than IFBEAM_SHARD_SECONDS (default one hour) are split into
+shards that are fetched in parallel and stitched back together in time order.
+Every shard asks for SHARD_MARGIN seconds more on each side and keeps only the
+rows logged inside its own slice, so no row is lost or duplicated at a shard
+boundary; coincidence matching runs on the stitched arrays and is therefore
+not affected by the sharding.  Failed requests are retried up to
+IFBEAM_RETRIES times with exponential backoff.
+"""
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urlsplit
+
+import requests
+import urllib3
+
+import ifbeam_cache
+import ifbeam_stats
+
+# set IFBEAM_URL to use another server, e.g. the local stand-in of ifbeam_standin.py
+IFBEAM_URL = os.environ.get("IFBEAM_URL", "https://dbdata3vm.fnal.gov:9443/ifbeam/data/data")
+MAX_WORKERS = int(os.environ.get("IFBEAM_MAX_WORKERS", "8"))
+SHARD_SECONDS = float(os.environ.get("IFBEAM_SHARD_SECONDS", "3600"))
+SHARD_MARGIN = 1.0
+RETRIES = int(os.environ.get("IFBEAM_RETRIES", "3"))
+BACKOFF = 0.5
+TIMEOUT = (30, 600)
+
+# Disable HTTPS warnings
+urllib3.disable_warnings(urllib3.exceptions.InsecureRequestWarning)
+
+_session = None
+_session_lock = threading.Lock()
+_http_slots = threading.BoundedSemaphore(max(MAX_WORKERS, 1))
+_prefetched = {}
+_prefetched_lock = threading.Lock()
+
+
+def get_session():
+    """Process-wide requests session with a connection pool sized for MAX_WORKERS"""
+    global _session
+    with _session_lock:
+        if _session is None:
+            session = requests.Session()
+            adapter = requests.adapters.HTTPAdapter(pool_connections=1,
+                                                    pool_maxsize=max(MAX_WORKERS, 1))
+            session.mount("https://", adapter)
+            session.mount("http://", adapter)
+            session.verify = False
+            _session = session
+    return _session
+
+
+def set_base_url(url):
+    """Send all following requests to url (the .../ifbeam/data/data endpoint)"""
+    global IFBEAM_URL
+    IFBEAM_URL = url
+
+
+def set_max_workers(n):
+    """Change the concurrency cap; the session pool is resized on next use"""
+    global MAX_WORKERS, _session, _http_slots
+    with _session_lock:
+        MAX_WORKERS = max(int(n), 1)
+        _session = None
+        _http_slots = threading.BoundedSemaphore(MAX_WORKERS)
+
+
+def _retryable(e):
+    if isinstance(e, requests.HTTPError):
+        return e.response is not None and e.response.status_code >= 500
+    return isinstance(e, (requests.ConnectionError, requests.Timeout))
+
+
+def fetch_window(var, event, t0, t1):
+    """One database request for var in [t0, t1], retried with exponential backoff"""
+    params = {"e": event, "v": var, "t0": t0, "t1": t1, "f": "csv"}
+    for attempt in range(RETRIES + 1):
+        try:
+            # bound the number of open requests, also across nested thread pools
+            with _http_slots:
+                start = time.perf_counter()
+                r = get_session().get(IFBEAM_URL, params=params, timeout=TIMEOUT)
+                r.raise_for_status()
+                lines = r.text.splitlines()
+            if ifbeam_stats.ENABLED:
+                seconds = time.perf_counter() - start
+                ifbeam_stats.count_var(var, requests=1, seconds=seconds,
+                                       bytes=len(r.content), rows=max(len(lines) - 1, 0))
+                ifbeam_stats.count("download", calls=1, seconds=seconds, bytes=len(r.content))
+            return lines
+        except requests.RequestException as e:
+            if attempt == RETRIES or not _retryable(e):
+                raise
+            print(f"WARNING: IFBeam request for {var} failed ({e}), retrying")
+            time.sleep(BACKOFF * 2**attempt)
+
+
+def shard_window(t0, t1, shard_seconds=None):
+    """Split [t0, t1] into consecutive (start, end) slices in epoch seconds"""
+    shard_seconds = shard_seconds or SHARD_SECONDS
+    a = ifbeam_cache.to_epoch(t0)
+    b = ifbeam_cache.to_epoch(t1)
+    edges = [a]
+    while edges[-1] + shard_seconds < b:
+        edges.append(edges[-1] + shard_seconds)
+    edges.append(b)
+    return list(zip(edges[:-1], edges[1:]))
+
+
+def fetch_ifbeam_remote(var, event, t0, t1):
+    """Fetch a single IFBeam variable as CSV from the database, in parallel shards"""
+    shards = shard_window(t0, t1)
+    if len(shards) <= 1:
+        return fetch_window(var, event, t0, t1)
+
+    last = len(shards) - 1
+
+    def task(k):
+        # margin on the inner edges only, the outer ones are the requested t0/t1
+        start, end = shards[k]
+        s0 = ifbeam_cache.to_iso(start - SHARD_MARGIN, t0) if k > 0 else t0
+        s1 = ifbeam_cache.to_iso(end + SHARD_MARGIN, t0) if k < last else t1
+        return fetch_window(var, event, s0, s1)
+
+    with ThreadPoolExecutor(max_workers=min(MAX_WORKERS, len(shards))) as pool:
+        results = list(pool.map(task, range(len(shards))))
+
+    # stitch: every shard keeps the rows logged in its own slice; the first and
+    # last shard also keep whatever the server returns outside [t0, t1]
+    header = []
+    rows = []
+    for k, ((start, end), lines) in enumerate(zip(shards, results)):
+        if lines and not header:
+            header = lines[:1]
+        lo = start*1000 if k > 0 else -float("inf")
+        hi = end*1000 if k < last else float("inf")
+        for row in lines[1:]:
+            clock = ifbeam_cache.row_clock_ms(row)
+            if clock is None or lo <= clock < hi:
+                rows.append(row)
+    return header + rows
+
+
+@ifbeam_stats.timed("fetch")
+def fetch_ifbeam(var, event, t0, t1):
+    """Fetch a single IFBeam variable as CSV (prefetched, cached or remote)"""
+    with _prefetched_lock:
+        lines = _prefetched.pop((var, event, t0, t1), None)
+    if lines is not None:
+        return lines
+    server = urlsplit(IFBEAM_URL).netloc
+    return ifbeam_cache.cached_fetch(var, event, t0, t1, fetch_ifbeam_remote, server)
+
+
+def fetch_many(var_names, event, t0, t1, max_workers=None, live=False):
+    """Fetch several variables concurrently.  Returns {var: lines or exception}
+
+    With live, every variable is asked from the server, bypassing the prefetch
+    memo and the cache, for windows whose data may still be arriving.
+    """
+    fetch = fetch_ifbeam_remote if live else fetch_ifbeam
+    var_names = list(dict.fromkeys(var_names))
+    workers = min(max_workers or MAX_WORKERS, len(var_names))
+    if workers <= 1:
+        results = {}
+        for var in var_names:
+            try:
+                results[var] = fetch(var, event, t0, t1)
+            except Exception as e:
+                results[var] = e
+        return results
+
+    def task(var):
+        try:
+            return fetch(var, event, t0, t1)
+        except Exception as e:
+            return e
+
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        return dict(zip(var_names, pool.map(task, var_names)))
+
+
+class PrefetchScope:
+    """Variables stored by one prefetch() call; leaving its with block drops
+    those that no fetch_ifbeam() call has picked up"""
+
+    def __init__(self, entries):
+        self.entries = entries      # (key, lines) stored by this scope
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        with _prefetched_lock:
+            for key, lines in self.entries:
+                # only this scope's own response, not one stored again since
+                if _prefetched.get(key) is lines:
+                    del _prefetched[key]
+        return False
+
+
+@ifbeam_stats.timed("prefetch")
+def prefetch(var_names, event, t0, t1, max_workers=None):
+    """Fetch var_names concurrently and hold them for the next fetch_ifbeam() calls
+    inside the with block of the returned PrefetchScope.
+
+    Failed fetches are not stored, so the error shows up again at the normal
+    (sequential) call site, where the existing error handling deals with it.
+    Variables an enclosing scope already holds are left to that scope.
+    """
+    with _prefetched_lock:
+        todo = [v for v in var_names if (v, event, t0, t1) not in _prefetched]
+    if not todo:
+        return PrefetchScope([])
+    results = fetch_many(todo, event, t0, t1, max_workers)
+    entries = []
+    with _prefetched_lock:
+        for var, lines in results.items():
+            if not isinstance(lines, Exception):
+                _prefetched[(var, event, t0, t1)] = lines
+                entries.append(((var, event, t0, t1), lines))
+    return PrefetchScope(entries)
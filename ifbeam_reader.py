@@ -1,13 +1,9 @@
-import os
-import math
-from pathlib import Path
-import csv
-import requests
-import sys
-import urllib3
-
-import numpy as np
-import uproot
+import ifbeam_csv
+import ifbeam_fetch
+from ifbeam_fetch import fetch_ifbeam
+import ifbeam_time
+import tof_matcher
+from beam_pipeline import get_counter_times, relevant_var_names, tof_var_names
 
 
 def BeamInfo_from_ifbeam(t0: int, t1: int):
@@ -29,105 +25,34 @@ def BeamInfo_from_ifbeam(t0: int, t1: int):
     return beam_infos
 
 
-def get_tofs(t0: str, t1: str, delta_trig: float):
+def get_tofs(t0: str, t1: str, delta_trig: float, offset: float = 0.):
 
-    # get general trigger values
-    trig_n, trig_s, trig_c, trig_f = get_trigger_values(t0, t1)
+    # fetch all trigger and tof counters concurrently (timestampCount is not needed)
+    with prefetch_var_values(t0, t1, tof_var_names(count=False)):
 
-    # get tof variable values    
-    tof_s = []
-    tof_c = []
-    tof_f = []    
+        # get general trigger values, decoded once to int64 ns
+        trig_times = get_counter_times(t0, t1, "dip/acc/NORTH/NP02/BI/TDC/GeneralTrigger", offset)
 
-    tof_name =['XBTF022638A','XBTF022638B','XBTF022670A','XBTF022670B']
-    
-    for i in range(len(tof_name)):
-        ni,si,ci,fi = get_tof_vars_values(t0, t1, tof_name[i])
-        tof_s.append(si)
-        tof_c.append(ci)
-        tof_f.append(fi)
-
-    # find valid tofs        
-#    fDownstreamToGenTrig = 50.
-    fDownstreamToGenTrig = delta_trig 
-
-    tofs = []
-
-    for i in range(len(trig_c)):
-        trig_sec = trig_s[i*2+1] 
-        trig_ns  = trig_c[i]*8 + trig_f[i]/512.
-
-        if trig_sec == 0:
-            break
-
-        # First check 2A
-        for j in range(len(tof_c[2])):
-
-            tof2A_sec = tof_s[2][j*2+1]
-            tof2A_ns  = tof_c[2][j]*8 + tof_f[2][j]/512.             
-
-            if tof2A_sec == 0:
-                break
-            
-            delta_2A = 1e9*(trig_sec-tof2A_sec) + trig_ns - tof2A_ns
-#            print (i,j,trig_sec, trig_ns, tof2A_sec, tof2A_ns, delta_2A)
-            if  delta_2A < 0.: 
-                break
-            elif delta_2A > fDownstreamToGenTrig:
-                continue
-            
-            print("Found match 2A to Gen")
-
-            #check 1A-2A
-            check_valid_tof(tof2A_sec, tof2A_ns, tof_s[0],tof_c[0],tof_f[0],tofs)
-            #check 1B-2A
-            check_valid_tof(tof2A_sec, tof2A_ns, tof_s[1],tof_c[1],tof_f[1],tofs)            
-
-        # Then check 2B
-        for j in range(len(tof_c[3])):
-
-            tof2B_sec = tof_s[3][j*2+1]
-            tof2B_ns  = tof_c[3][j]*8 + tof_f[3][j]/512.             
-
-#            print (j,tof2B_sec)
-            if tof2B_sec == 0:
-                break
-            
-            delta_2B = 1e9*(trig_sec-tof2B_sec) + trig_ns - tof2A_ns
-#            print (i,j,trig_sec, trig_ns, tof2B_sec, tof2B_ns, delta_2B)
-            if  delta_2B < 0.: 
-                break
-            elif delta_2B > fDownstreamToGenTrig:
-                continue
-            
-            print("Found match 2B to Gen")
-
-            #check 1A-2B
-            check_valid_tof(tof2B_sec, tof2B_ns, tof_s[0],tof_c[0],tof_f[0],tofs)
-            #check 1B-2B
-            check_valid_tof(tof2B_sec, tof2B_ns, tof_s[1],tof_c[1],tof_f[1],tofs)            
-                                
-    return tofs
+        # get tof variable values    
+        tof_name =['XBTF022638A','XBTF022638B','XBTF022670A','XBTF022670B']
+        tof_times = []
+        for i in range(len(tof_name)):
+            tof_times.append(get_counter_times(t0, t1, "dip/acc/NORTH/NP02/BI/XTOF/"+tof_name[i]))
+
+    # find valid tofs: 2A/2B within delta_trig before the trigger, then
+    # 1A/1B within 500 ns before the downstream hit (the loops this replaced
+    # took the 2B delta against the last 2A hit and lost those matches)
+    tofs = tof_matcher.match_tof_times(trig_times, tof_times, delta_trig)
+    print("Found", len(tofs), "matches")
+
+    return tofs.tolist()
 
 def check_valid_tof(tof_ref_sec, tof_ref_ns, tof_s, tof_c, tof_f, tofs: []):
 
-    fUpstreamToDownstream =  500.
-    
-    for k in range(len(tof_c)):
-        tof_sec = tof_s[k*2+1]
-        tof_ns  = tof_c[k]*8 + tof_f[k]/512.
-
-        if tof_sec == 0:
-            break
-        
-        delta = 1e9*(tof_ref_sec-tof_sec) + tof_ref_ns - tof_ns
-        if  delta < 0.: 
-            break
-        elif delta > fUpstreamToDownstream:
-            continue
-        elif delta>0 and delta < fUpstreamToDownstream:
-            print("Found match")                                    
-            tofs.append(delta)
+    ref = ifbeam_time.from_sec_ns(tof_ref_sec, tof_ref_ns)
+    tof = tof_matcher.decode_counter(tof_s, tof_c, tof_f)
+    _, _, deltas = tof_matcher.window_pairs(ref, tof, tof_matcher.UPSTREAM_TO_DOWNSTREAM)
+    tofs.extend(deltas.tolist())
 
 def get_tof_vars_values(t0: str, t1: str, tof_var_name: str):
 
@@ -141,10 +66,11 @@ def get_trigger_values(t0: str, t1: str):
     
 def get_relevant_values(t0: str, t1: str, prefix: str):
     
-    seconds_data = get_var_values(t0, t1, prefix+":seconds[]")
-    coarse_data  = get_var_values(t0, t1, prefix+":coarse[]")
-    frac_data    = get_var_values(t0, t1, prefix+":frac[]")
-    count_var    = get_var_values(t0, t1, prefix+":timestampCount")
+    with prefetch_var_values(t0, t1, relevant_var_names(prefix)):
+        seconds_data = get_var_values(t0, t1, prefix+":seconds[]")
+        coarse_data  = get_var_values(t0, t1, prefix+":coarse[]")
+        frac_data    = get_var_values(t0, t1, prefix+":frac[]")
+        count_var    = get_var_values(t0, t1, prefix+":timestampCount")
 
     return count_var, seconds_data, coarse_data, frac_data
     
@@ -160,6 +86,20 @@ def get_var_values(t0: str, t1: str, var_name: str):
 
     return data    
 
+def get_var_ragged(t0: str, t1: str, var_name: str):
+    """Values of var_name per logged row, with the row logging times"""
+
+    event  = "z,pdune"
+    lines = fetch_ifbeam(var_name, event, t0, t1)
+    return ifbeam_csv.parse_csv_ragged(lines)
+
+def prefetch_var_values(t0: str, t1: str, var_names):
+    """Fetch several variables concurrently, the get_var_values calls for
+    them in the with block are served from memory"""
+
+    event  = "z,pdune"
+    return ifbeam_fetch.prefetch(var_names, event, t0, t1)
+
 def compute_t(seconds, coarse, frac):
     """Compute T0 in seconds"""
     return 1e9*seconds + 8*coarse + frac/512.0
@@ -167,32 +107,7 @@ def compute_t(seconds, coarse, frac):
 def compute_tof(t1: int, t2: int):
     return t2-t1
 
-def fetch_ifbeam(var, event, t0, t1):
-    """Fetch a single IFBeam variable as CSV"""
-    url = (
-        "https://dbdata3vm.fnal.gov:9443/ifbeam/data/data"
-        f"?e={event}&v={var}&t0={t0}&t1={t1}&f=csv"
-    )
-
-    # Disable HTTPS warnings
-    urllib3.disable_warnings(urllib3.exceptions.InsecureRequestWarning)
-
-    r = requests.get(url, verify=False)
-    r.raise_for_status()
-    return r.text.splitlines()
-
 def parse_csv_value(lines):
     """Extract numeric values from CSV lines, skip header"""
-    values = []
     print ("number of lines: ",len(lines))
-    for row in lines[1:]:  # skip header
-        parts = row.strip().split(",")
-        if len(parts) < 4:
-            continue  # skip malformed lines
-        try:
-            for i in range(5,int(len(parts))):
-                val = int(float(parts[i]))
-                values.append(val)
-        except ValueError:
-            continue  # skip non-integer rows
-    return values
+    return ifbeam_csv.parse_csv_ragged(lines).as_int()
@@ -0,0 +1,270 @@
+#!/usr/bin/env python3
+"""Local stand-in for the IFBeam data server.
+
+Serves the ?e=&v=&t0=&t1=&f=csv endpoint from recorded fixtures or from
+synthetic beam data, so the IFBeam code can be profiled and checked away from
+the lab network.  Latency and failures can be injected.
+
+Record fixtures from the real database (one CSV file per variable):
+
+    python3 ifbeam_standin.py --record fixtures/ 2025-08-25T11:11:11-05:00 2025-08-25T11:20:00-05:00
+
+Serve them, or synthetic data, and point the analysis scripts at it:
+
+    python3 ifbeam_standin.py --fixtures fixtures/ --port 8123
+    python3 ifbeam_standin.py --synthetic --port 8123 --latency 0.2 --fail-rate 0.05
+    export IFBEAM_URL=http://127.0.0.1:8123/ifbeam/data/data
+"""
+import os
+import random
+import threading
+import time
+from argparse import ArgumentParser as ap
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, quote, urlsplit
+
+import numpy as np
+
+import ifbeam_cache
+import ifbeam_synth
+
+ENDPOINT = "/ifbeam/data/data"
+HEADER = "Event,Variable,Clock,Units,Values"
+
+TDC_PREFIX = "dip/acc/NORTH/NP02/BI/TDC/"
+XTOF_PREFIX = "dip/acc/NORTH/NP02/BI/XTOF/"
+XCET_PREFIX = "dip/acc/NORTH/NP02/BI/XCET/"
+BI_PREFIX = "dip/acc/NORTH/NP02/BI/"
+MOMENTUM_PREFIX = "dip/acc/NORTH/NP02/POW/CALC/MOMENTUM:"
+
+
+# -------------------------------
+# Data sources
+# -------------------------------
+class FixtureSource:
+    """Rows recorded from the real server, one <quoted variable>.csv per variable"""
+
+    def __init__(self, directory):
+        self.directory = directory
+        self._rows = {}
+
+    def _load(self, var):
+        rows = self._rows.get(var)
+        if rows is None:
+            path = os.path.join(self.directory, quote(var, safe="") + ".csv")
+            rows = []
+            if os.path.exists(path):
+                with open(path) as fin:
+                    lines = fin.read().splitlines()
+                rows = [(ifbeam_cache.row_clock_ms(r), r) for r in lines[1:]]
+                rows = sorted((c, r) for c, r in rows if c is not None)
+            self._rows[var] = rows
+        return rows
+
+    def rows(self, event, var, t0_ms, t1_ms):
+        return [r for c, r in self._load(var) if t0_ms <= c <= t1_ms]
+
+
+class SyntheticSource:
+    """Deterministic synthetic beam from ifbeam_synth.BeamSynth.
+
+    Spill k starts at k*spill_period (epoch seconds) and is logged once, at
+    its end, as one row per variable holding all of its hits.  The hits are
+    drawn from a generator seeded with (seed, k), so every variable of a spill
+    describes the same particles, whatever window is asked for.  Like the real
+    rows, the arrays of every counter row end in `padding` zero hits
+    (seconds == 0).  Extra keyword arguments (efficiency, noise_rate,
+    species, ...) go to BeamSynth.
+    """
+
+    def __init__(self, seed=0, spill_period=20.0, spill_length=4.8, particles_per_spill=100,
+                 slow_period=10.0, padding=0, **synth_args):
+        self.synth = ifbeam_synth.BeamSynth(seed=seed, spill_period=spill_period,
+                                            spill_length=spill_length,
+                                            particles_per_spill=particles_per_spill, **synth_args)
+        self.seed = seed
+        self.spill_period = spill_period
+        self.spill_length = spill_length
+        self.particles_per_spill = particles_per_spill
+        self.slow_period = slow_period
+        self.padding = padding
+
+    def spill(self, k):
+        """{counter: (sec, ns in sec)} hit times for spill k"""
+        return self.synth.spill_hits(k)[0]
+
+    def counter_values(self, counter, field, hits):
+        stride = 1 if field in ("SECONDS", "COARSE", "FRAC") else 2
+        sec, coarse, frac = self.synth.encode(*hits, stride=stride)
+        if field == "timestampCount":
+            return [len(coarse)]
+        if self.padding:
+            sec = np.concatenate([sec, np.zeros(stride*self.padding, dtype=np.int64)])
+            coarse = np.concatenate([coarse, np.zeros(self.padding, dtype=np.int64)])
+            frac = np.concatenate([frac, np.zeros(self.padding, dtype=np.int64)])
+        if field in ("seconds[]", "SECONDS"):
+            return sec
+        if field in ("coarse[]", "COARSE"):
+            return coarse
+        if field in ("frac[]", "FRAC"):
+            return frac
+        return None
+
+    def slow_value(self, var, t):
+        """Slow-control value of var at epoch second t"""
+        field = var.rsplit(":", 1)[-1]
+        k = int(t // self.slow_period)
+        rng = np.random.default_rng((self.seed, k, len(var)))
+        if field == "momentum_ref":
+            return 1.0
+        if field == "momentum_meas":
+            return round(1.0 + rng.normal(0, 0.02), 4)
+        if field == "pressure":
+            return round(1.5 + rng.normal(0, 0.01), 4)
+        if field in ("counts", "countsTrig"):
+            return int(rng.poisson(self.particles_per_spill*0.3))
+        return 0
+
+    def rows(self, event, var, t0_ms, t1_ms):
+        name, field = var.rsplit(":", 1) if ":" in var else (var, "")
+        counter = name.rsplit("/", 1)[-1]
+        out = []
+        if name.startswith((TDC_PREFIX, XTOF_PREFIX)) or \
+                (name.startswith(BI_PREFIX + "XCET") and field in ("SECONDS", "COARSE", "FRAC")):
+            first = int(np.floor((t0_ms/1000 - self.spill_length)/self.spill_period))
+            last = int(np.floor(t1_ms/1000/self.spill_period))
+            for k in range(max(first, 0), last + 1):
+                clock = int((k*self.spill_period + self.spill_length)*1000)
+                if not t0_ms <= clock <= t1_ms:
+                    continue
+                times = self.spill(k).get(counter)
+                if times is None:
+                    continue
+                values = self.counter_values(counter, field, times)
+                if values is None:
+                    continue
+                out.append(f"{event},{var},{clock},," + ",".join(str(int(v)) for v in values))
+        else:
+            t = np.ceil(t0_ms/1000/self.slow_period)*self.slow_period
+            while t*1000 <= t1_ms:
+                out.append(f"{event},{var},{int(t*1000)},,{self.slow_value(var, t)}")
+                t += self.slow_period
+        return out
+
+
+# -------------------------------
+# Server
+# -------------------------------
+class StandinHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        url = urlsplit(self.path)
+        if url.path != ENDPOINT:
+            self.send_error(404)
+            return
+        server = self.server
+        if server.latency:
+            time.sleep(server.latency)
+        if server.fail_rate and server.rng.random() < server.fail_rate:
+            self.send_error(503, "injected failure")
+            return
+        q = {k: v[0] for k, v in parse_qs(url.query).items()}
+        try:
+            t0_ms = int(ifbeam_cache.to_epoch(q["t0"])*1000)
+            t1_ms = int(ifbeam_cache.to_epoch(q["t1"])*1000)
+            rows = server.source.rows(q.get("e", ""), q["v"], t0_ms, t1_ms)
+        except (KeyError, ValueError) as e:
+            self.send_error(400, str(e))
+            return
+        body = ("\n".join([HEADER] + rows) + "\n").encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "text/csv")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        if self.server.verbose:
+            super().log_message(format, *args)
+
+
+def make_server(source, host="127.0.0.1", port=0, latency=0.0, fail_rate=0.0, seed=None,
+                verbose=False):
+    """HTTP server answering IFBeam requests from source (port 0 = any free port)"""
+    server = ThreadingHTTPServer((host, port), StandinHandler)
+    server.daemon_threads = True
+    server.source = source
+    server.latency = latency
+    server.fail_rate = fail_rate
+    server.rng = random.Random(seed)
+    server.verbose = verbose
+    return server
+
+
+def serve_in_thread(source, **kwargs):
+    """Start a stand-in server in a background thread; returns (server, endpoint URL)"""
+    server = make_server(source, **kwargs)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    host, port = server.server_address[:2]
+    return server, f"http://{host}:{port}{ENDPOINT}"
+
+
+# -------------------------------
+# Recording fixtures
+# -------------------------------
+def record(var_names, event, t0, t1, directory):
+    """Fetch var_names for [t0, t1] from the configured server into fixture files"""
+    import ifbeam_fetch
+
+    os.makedirs(directory, exist_ok=True)
+    results = ifbeam_fetch.fetch_many(var_names, event, t0, t1)
+    for var, lines in results.items():
+        if isinstance(lines, Exception):
+            print(f"WARNING: could not record {var}: {lines}")
+            continue
+        path = os.path.join(directory, quote(var, safe="") + ".csv")
+        with open(path, "w") as fout:
+            fout.writelines(line + "\n" for line in lines)
+        print(f"{var}: {max(len(lines) - 1, 0)} rows -> {path}")
+
+
+def all_var_names():
+    names = []
+    for counter in ["TDC/GeneralTrigger", "XTOF/XBTF022638A", "XTOF/XBTF022638B",
+                    "XTOF/XBTF022670A", "XTOF/XBTF022670B"]:
+        for field in ["seconds[]", "coarse[]", "frac[]", "timestampCount"]:
+            names.append(f"{BI_PREFIX}{counter}:{field}")
+    for dev in ["XCET021667", "XCET021669"]:
+        names += [f"{XCET_PREFIX}{dev}:{f}" for f in ["counts", "countsTrig", "pressure"]]
+        names += [f"{BI_PREFIX}{dev}:{f}" for f in ["SECONDS", "FRAC", "COARSE"]]
+    names += [MOMENTUM_PREFIX + "momentum_ref", MOMENTUM_PREFIX + "momentum_meas"]
+    return names
+
+
+if __name__ == "__main__":
+    parser = ap()
+    parser.add_argument("--fixtures", type=str, help="serve recorded fixtures from this directory")
+    parser.add_argument("--synthetic", action="store_true", help="serve synthetic beam data")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--padding", type=int, default=0,
+                        help="zero hits at the end of every synthetic counter row")
+    parser.add_argument("--port", type=int, default=8123)
+    parser.add_argument("--latency", type=float, default=0.0, help="added delay per request [s]")
+    parser.add_argument("--fail-rate", type=float, default=0.0,
+                        help="fraction of requests answered with HTTP 503")
+    parser.add_argument("--record", nargs=3, metavar=("DIR", "T0", "T1"),
+                        help="record all BeamInfo variables into fixture files and exit")
+    parser.add_argument("--event", type=str, default="z,pdune")
+    args = parser.parse_args()
+
+    if args.record:
+        directory, t0, t1 = args.record
+        record(all_var_names(), args.event, t0, t1, directory)
+    else:
+        if args.fixtures:
+            source = FixtureSource(args.fixtures)
+        else:
+            source = SyntheticSource(seed=args.seed, padding=args.padding)
+        server = make_server(source, port=args.port, latency=args.latency,
+                             fail_rate=args.fail_rate, seed=args.seed, verbose=True)
+        print(f"IFBeam stand-in on http://127.0.0.1:{args.port}{ENDPOINT}")
+        server.serve_forever()
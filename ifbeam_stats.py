@@ -0,0 +1,156 @@
+"""Per-stage timing and volume counters for the IFBeam pipeline.
+
+Off by default.  Set IFBEAM_STATS=1 to collect them: every stage records its
+calls and wall time plus counters such as bytes, rows, candidate pairs and
+matches, and every variable its requests, download time, bytes and rows.
+When disabled, stage() returns a shared no-op context and count() returns at
+once, so the hooks can stay in production code.
+
+    with ifbeam_stats.stage("get_tofs"):
+        ...
+
+    @ifbeam_stats.timed("parse_csv")
+    def parse_csv_ragged(lines): ...
+
+    ifbeam_stats.count("window_pairs", candidates=n, pairs=m)
+
+finish() writes the report of the run as JSON (to ifbeam_stats.json, or to
+the path given in IFBEAM_STATS instead of 1) and, with
+IFBEAM_STATS_SUMMARY=1, prints it as one line.  Stages may nest (get_tofs
+includes its fetches) and run in several threads (fetch), so their times do
+not add up to the total.
+"""
+import functools
+import json
+import os
+import threading
+import time
+from contextlib import nullcontext
+
+_setting = os.environ.get("IFBEAM_STATS", "")
+ENABLED = _setting not in ("", "0")
+REPORT_PATH = _setting if _setting not in ("", "0", "1") else "ifbeam_stats.json"
+SUMMARY = os.environ.get("IFBEAM_STATS_SUMMARY", "") not in ("", "0")
+
+# stages timed inside the fetch threads, their seconds overlap
+THREAD_STAGES = ("fetch", "download")
+
+_NULL = nullcontext()
+_lock = threading.Lock()
+_stages = {}
+_variables = {}
+_start = time.time()
+
+
+def enable(on=True):
+    """Switch collection on or off from code"""
+    global ENABLED
+    ENABLED = on
+
+
+def reset():
+    global _start
+    with _lock:
+        _stages.clear()
+        _variables.clear()
+        _start = time.time()
+
+
+def _add(table, name, counters):
+    with _lock:
+        entry = table.setdefault(name, {})
+        for key, value in counters.items():
+            entry[key] = entry.get(key, 0) + value
+
+
+def count(stage_name, **counters):
+    """Add counters (bytes=..., rows=..., ...) to a stage"""
+    if ENABLED:
+        _add(_stages, stage_name, counters)
+
+
+def count_var(var, **counters):
+    """Add counters to an IFBeam variable"""
+    if ENABLED:
+        _add(_variables, var, counters)
+
+
+class _Stage:
+    __slots__ = ("name", "t")
+
+    def __init__(self, name):
+        self.name = name
+
+    def __enter__(self):
+        self.t = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        _add(_stages, self.name, {"calls": 1, "seconds": time.perf_counter() - self.t})
+        return False
+
+
+def stage(name):
+    """Context manager timing one call of a stage"""
+    return _Stage(name) if ENABLED else _NULL
+
+
+def timed(name):
+    """Decorator: every call of the function is one call of stage name"""
+    def wrap(func):
+        @functools.wraps(func)
+        def timed_func(*args, **kwargs):
+            if not ENABLED:
+                return func(*args, **kwargs)
+            with _Stage(name):
+                return func(*args, **kwargs)
+        return timed_func
+    return wrap
+
+
+def report():
+    """{"wall_seconds", "stages": {name: counters}, "variables": {var: counters}}"""
+    with _lock:
+        return {"wall_seconds": time.time() - _start,
+                "stages": {k: dict(v) for k, v in _stages.items()},
+                "variables": {k: dict(v) for k, v in _variables.items()}}
+
+
+def _si(x):
+    for unit in ("", "k", "M", "G"):
+        if abs(x) < 1000:
+            return f"{x:.3g}{unit}"
+        x /= 1000
+    return f"{x:.3g}T"
+
+
+def summary(rep=None, top=6):
+    """The report as one line: total, download volume, then the slowest stages"""
+    rep = rep or report()
+    variables = rep["variables"].values()
+    # request time is summed over the fetch threads, so it is shown with the volume
+    parts = [f"{rep['wall_seconds']:.1f} s",
+             f"{sum(v.get('requests', 0) for v in variables)} requests"
+             f" ({sum(v.get('seconds', 0) for v in variables):.1f} s in threads)",
+             f"{_si(sum(v.get('bytes', 0) for v in variables))}B",
+             f"{_si(sum(v.get('rows', 0) for v in variables))} rows"]
+    stages = sorted(((k, v) for k, v in rep["stages"].items() if k not in THREAD_STAGES),
+                    key=lambda kv: -kv[1].get("seconds", 0))
+    for name, s in stages[:top]:
+        extra = "".join(f" {_si(s[k])} {k}" for k in ("candidates", "matches") if k in s)
+        parts.append(f"{name} {s.get('seconds', 0):.2f} s{extra}")
+    return "ifbeam stats: " + " | ".join(parts)
+
+
+def finish(path=None, **meta):
+    """Write the JSON report (and print the summary line); no-op when disabled"""
+    if not ENABLED:
+        return None
+    rep = report()
+    rep.update(meta)
+    path = path or REPORT_PATH
+    with open(path, "w") as fout:
+        json.dump(rep, fout, indent=1, sort_keys=True)
+    if SUMMARY:
+        print(summary(rep))
+    return rep
@@ -0,0 +1,150 @@
+"""Synthetic beam-instrumentation streams for tests and benchmarks.
+
+BeamSynth produces GeneralTrigger, XBTF022638A/B (upstream), XBTF022670A/B
+(downstream) and XCET021667/9 hits for a simple model of the NP02 beam:
+
+  * spills of spill_length seconds every spill_period seconds, with a Poisson
+    number of particles (mean particles_per_spill) spread uniformly in time
+  * particles drawn from `species` {name: (mass [GeV], fraction)}; the TOF at
+    `momentum` is baseline_ns * sqrt(1 + (m/p)^2) plus Gaussian jitter
+  * per-counter efficiencies and uniform noise hits (rate in Hz during spills)
+  * GeneralTrigger trig_delay ns after the downstream hit, XCET hits within
+    +-xcet_spread ns of the trigger for species above the Cherenkov threshold
+
+Hits are encoded exactly like the IFBeam counters that get_tofs() consumes:
+seconds (two entries per hit for TDC/XTOF, the second being the time, one per
+hit for XCET), coarse in 8 ns ticks and frac in 1/512 of a ns.
+
+    synth = BeamSynth(seed=1, particles_per_spill=500)
+    trig, tof_s, tof_c, tof_f = synth.tof_inputs(n_particles=10000)
+    tofs = tof_matcher.match_tofs(trig, tof_s, tof_c, tof_f)
+"""
+import numpy as np
+
+UPSTREAM = ["XBTF022638A", "XBTF022638B"]
+DOWNSTREAM = ["XBTF022670A", "XBTF022670B"]
+TRIGGER = "GeneralTrigger"
+XCET = ["XCET021667", "XCET021669"]
+COUNTERS = [TRIGGER] + UPSTREAM + DOWNSTREAM + XCET
+
+DEFAULT_SPECIES = {
+    "e":  (0.000511, 0.40),
+    "mu": (0.1057, 0.05),
+    "pi": (0.1396, 0.40),
+    "K":  (0.4937, 0.03),
+    "p":  (0.9383, 0.12),
+}
+# species seen by each Cherenkov counter (high and low pressure)
+DEFAULT_CKOV = {"XCET021667": ("e", "mu", "pi"), "XCET021669": ("e",)}
+
+
+class BeamSynth:
+    def __init__(self, seed=0, spill_period=30.0, spill_length=4.8, particles_per_spill=300,
+                 momentum=1.0, species=None, baseline_ns=60.0, jitter_ns=0.3,
+                 trig_delay=(10.0, 40.0), xcet_spread=100.0, efficiency=None, noise_rate=None,
+                 ckov=None, t_start=1756040400):
+        self.seed = seed
+        self.spill_period = spill_period
+        self.spill_length = spill_length
+        self.particles_per_spill = particles_per_spill
+        self.momentum = momentum
+        self.species = species or DEFAULT_SPECIES
+        self.baseline_ns = baseline_ns
+        self.jitter_ns = jitter_ns
+        self.trig_delay = trig_delay
+        self.xcet_spread = xcet_spread
+        self.efficiency = {c: 1.0 for c in COUNTERS}
+        self.efficiency.update(efficiency or {})
+        self.noise_rate = {c: 0.0 for c in COUNTERS}
+        self.noise_rate.update(noise_rate or {})
+        self.ckov = ckov or DEFAULT_CKOV
+        # hits() starts at the first spill at or after t_start (epoch seconds)
+        self.first_spill = int(np.ceil(t_start/spill_period))
+
+    def tof_of(self, mass):
+        return self.baseline_ns*np.sqrt(1.0 + (mass/self.momentum)**2)
+
+    # ---------------------------------------------------------------
+    # Hit generation
+    # ---------------------------------------------------------------
+    def spill_hits(self, k):
+        """Hit times of every counter in spill k (absolute index, starting at
+        k*spill_period s since the epoch), as {counter: (sec int64, ns float64)}
+        sorted by time, plus the true species index of every particle"""
+        rng = np.random.default_rng((self.seed, k))
+        n = rng.poisson(self.particles_per_spill)
+        length_ns = self.spill_length*1e9
+        down = np.sort(rng.uniform(0.0, length_ns, n))
+
+        names = list(self.species)
+        masses = np.array([self.species[s][0] for s in names])
+        fractions = np.array([self.species[s][1] for s in names])
+        kind = rng.choice(len(names), n, p=fractions/fractions.sum())
+        tof = self.tof_of(masses[kind])
+        trig = down + rng.uniform(*self.trig_delay, n)
+
+        hits = {
+            TRIGGER: trig,
+            DOWNSTREAM[0]: down + rng.normal(0.0, self.jitter_ns, n),
+            DOWNSTREAM[1]: down + rng.normal(0.0, self.jitter_ns, n),
+            UPSTREAM[0]: down - tof + rng.normal(0.0, self.jitter_ns, n),
+            UPSTREAM[1]: down - tof + rng.normal(0.0, self.jitter_ns, n),
+        }
+        for dev in XCET:
+            seen = np.isin(kind, [names.index(s) for s in self.ckov.get(dev, ()) if s in names])
+            hits[dev] = trig[seen] + rng.uniform(-self.xcet_spread, self.xcet_spread, seen.sum())
+
+        base_sec, base_ns = divmod(k*int(round(self.spill_period*1e9)), 1000000000)
+        out = {}
+        for counter in COUNTERS:
+            t = hits[counter]
+            eff = self.efficiency[counter]
+            if eff < 1.0:
+                t = t[rng.random(len(t)) < eff]
+            n_noise = rng.poisson(self.noise_rate[counter]*self.spill_length)
+            if n_noise:
+                t = np.concatenate([t, rng.uniform(0.0, length_ns, n_noise)])
+            t = np.sort(t) + base_ns
+            whole = np.floor(t/1e9)
+            out[counter] = (base_sec + whole.astype(np.int64), t - whole*1e9)
+        return out, kind
+
+    def hits(self, n_particles=None, n_spills=None, counters=COUNTERS):
+        """Concatenated hits of consecutive spills, enough for n_particles or n_spills"""
+        if n_spills is None:
+            n_spills = max(int(np.ceil(n_particles/self.particles_per_spill)), 1)
+        parts = []
+        for k in range(n_spills):
+            spill = self.spill_hits(self.first_spill + k)[0]
+            parts.append({c: spill[c] for c in counters})
+        return {c: (np.concatenate([p[c][0] for p in parts]),
+                    np.concatenate([p[c][1] for p in parts])) for c in counters}
+
+    # ---------------------------------------------------------------
+    # IFBeam encoding
+    # ---------------------------------------------------------------
+    @staticmethod
+    def encode(sec, ns, stride=2):
+        """(seconds, coarse, frac) arrays as logged by IFBeam"""
+        coarse = np.floor(ns/8.0).astype(np.int64)
+        frac = np.round((ns - coarse*8.0)*512.0).astype(np.int64)
+        frac = np.minimum(frac, 8*512 - 1)
+        if stride == 2:
+            seconds = np.column_stack([np.zeros_like(sec), sec]).ravel()
+        else:
+            seconds = sec
+        return seconds, coarse, frac
+
+    def counter_values(self, hits, counter):
+        stride = 1 if counter in XCET else 2
+        return self.encode(*hits[counter], stride=stride)
+
+    def tof_inputs(self, n_particles=None, n_spills=None):
+        """(trig, tof_s, tof_c, tof_f) as built in get_tofs(), for tof_matcher.match_tofs"""
+        hits = self.hits(n_particles, n_spills, [TRIGGER] + UPSTREAM + DOWNSTREAM)
+        trig = self.counter_values(hits, TRIGGER)
+        enc = []
+        for c in UPSTREAM + DOWNSTREAM:
+            enc.append(self.counter_values(hits, c))
+            del hits[c]
+        return trig, [e[0] for e in enc], [e[1] for e in enc], [e[2] for e in enc]
@@ -0,0 +1,114 @@
+"""Timestamp decoding for the IFBeam counters.
+
+The TDC counters store a hit time as seconds + coarse*8 ns + frac/512 ns.
+Written as one float64 in ns, a 2025 timestamp (~1.7e18 ns) cannot resolve
+single ns, so here every hit is decoded once into
+
+    ns      int64, integer ns since the epoch
+    sub_ns  float32, sub-ns remainder in [0, 1) (frac has 1/512 ns steps)
+
+and time differences are taken as (ns_a - ns_b) + (sub_a - sub_b), which is
+exact.  Decoding is one vectorized pass per counter, and the decoded arrays
+can be shared by the TOF, trigger and XCET matching code.
+
+IFBeam logs a counter as one row per readout with its arrays zero-padded, so
+the hits of a window, concatenated row after row, have seconds == 0 entries
+between them.  Such an entry is padding and not a hit: decode_times() drops
+it and keeps the hits that follow.  Every reader (TOF matching, monitor,
+clock dump) goes through decode_times(), so they all see the same hits,
+whatever the window or shard boundaries.
+"""
+import numpy as np
+
+NS_PER_SEC = 1000000000
+
+
+class CounterTimes:
+    """Decoded hit times of one counter, in hit order"""
+
+    __slots__ = ("ns", "sub_ns")
+
+    def __init__(self, ns, sub_ns):
+        self.ns = ns
+        self.sub_ns = sub_ns
+
+    def __len__(self):
+        return len(self.ns)
+
+    @property
+    def seconds(self):
+        return self.ns // NS_PER_SEC
+
+    def as_float(self):
+        """Times as float64 ns (loses single-ns precision, for plotting only)"""
+        return self.ns.astype(np.float64) + self.sub_ns
+
+    def delta(self, i, other, j):
+        """time(self[i]) - time(other[j]) in ns, as float64"""
+        return (self.ns[i] - other.ns[j]).astype(np.float64) + \
+            (self.sub_ns[i].astype(np.float64) - other.sub_ns[j])
+
+    def take(self, idx):
+        return CounterTimes(self.ns[idx], self.sub_ns[idx])
+
+    def shifted(self, delta_ns):
+        """Times moved by delta_ns (a float, e.g. 8*offset for a coarse-tick offset)"""
+        whole = np.floor(delta_ns)
+        sub = self.sub_ns.astype(np.float64) + (delta_ns - whole)
+        carry = np.floor(sub)
+        return CounterTimes(self.ns + int(whole) + carry.astype(np.int64), (sub - carry).astype(np.float32))
+
+
+def decode_times(seconds, coarse, frac, offset=0.0, stride=1, return_index=False):
+    """Decode seconds/coarse/frac arrays into CounterTimes.
+
+    stride is the number of seconds entries per hit; the time in seconds is
+    the last one (the XTOF and GeneralTrigger seconds[] arrays have two entries
+    per hit, the XCET SECONDS variable one).  offset is added to coarse, in
+    coarse ticks.  Entries with seconds == 0 (row padding) are dropped; with
+    return_index, also returns the position of every decoded hit in the input.
+    """
+    seconds = np.asarray(seconds, dtype=np.int64)
+    coarse = np.asarray(coarse, dtype=np.int64)
+    frac = np.asarray(frac, dtype=np.int64)
+    n = min(len(coarse), len(frac), len(seconds) // stride)
+    sec = seconds[stride-1:stride*n:stride]
+    index = np.flatnonzero(sec != 0)
+    if len(index) < n:
+        sec, coarse, frac = sec[index], coarse[index], frac[index]
+    else:
+        coarse, frac = coarse[:n], frac[:n]
+
+    if offset:
+        # offset may be fractional: do the within-second part in float
+        ns_in_sec = (coarse + offset)*8 + frac/512.0
+        whole = np.floor(ns_in_sec)
+        ns = sec*NS_PER_SEC + whole.astype(np.int64)
+        sub_ns = (ns_in_sec - whole).astype(np.float32)
+    else:
+        whole, rest = np.divmod(frac, 512)
+        ns = sec*NS_PER_SEC + coarse*8 + whole
+        sub_ns = (rest / 512.0).astype(np.float32)
+    if return_index:
+        return CounterTimes(ns, sub_ns), index
+    return CounterTimes(ns, sub_ns)
+
+
+def from_sec_ns(sec, ns_in_sec):
+    """CounterTimes from seconds and float ns inside the second"""
+    sec = np.atleast_1d(np.asarray(sec, dtype=np.int64))
+    ns_in_sec = np.atleast_1d(np.asarray(ns_in_sec, dtype=np.float64))
+    whole = np.floor(ns_in_sec)
+    return CounterTimes(sec*NS_PER_SEC + whole.astype(np.int64),
+                        (ns_in_sec - whole).astype(np.float32))
+
+
+def decode_counter(relevant_values, offset=0.0):
+    """Decode the (count, seconds, coarse, frac) tuple of get_relevant_values()"""
+    _, seconds, coarse, frac = relevant_values
+    return decode_times(seconds, coarse, frac, offset=offset, stride=2)
+
+
+def decode_xcet(seconds, frac, coarse):
+    """Decode the XCET SECONDS/FRAC/COARSE values, in get_xcet_values() order"""
+    return decode_times(seconds, coarse, frac, stride=1)
@@ -0,0 +1,57 @@
+#!/usr/bin/env python3
+"""delta_trig / trigger offset scan for get_tofs().
+
+Fetches and decodes the trigger and XBTF counters once and gives, for every
+(delta_trig, offset) of the grid, the number of matched trigger-downstream
+pairs, the number of TOFs and the TOF histogram (60-90 ns), as get_tofs()
+would for that pair of values:
+
+    python3 scan_tof_calibration.py 2025-08-25T11:11:11-05:00 2025-08-25T11:20:00-05:00
+    python3 scan_tof_calibration.py T0 T1 --delta-trig 10:100:50 --offset -5:5:20 --output scan.npz
+
+The grid is saved as an .npz and the TOF counts are drawn as a heat map.
+"""
+from argparse import ArgumentParser as ap
+
+import numpy as np
+import matplotlib.pyplot as plt
+
+from beam_pipeline import get_tof_scan
+
+
+def grid(text):
+    """lo:hi:n as np.linspace(lo, hi, n), or a comma separated list"""
+    if ":" in text:
+        lo, hi, n = text.split(":")
+        return np.linspace(float(lo), float(hi), int(n))
+    return np.array([float(x) for x in text.split(",")])
+
+
+def plot_scan(scan, path):
+    plt.figure(figsize=(10,6))
+    plt.pcolormesh(scan["offset"], scan["delta_trig"], scan["n_tofs"], shading="nearest", cmap="plasma")
+    plt.colorbar(label="TOFs")
+    plt.xlabel("Trigger offset [coarse ticks]")
+    plt.ylabel("delta_trig [ns]")
+    plt.title("TOF matches vs delta_trig and offset")
+    plt.savefig(path, dpi=150)
+    plt.close()
+
+
+if __name__ == "__main__":
+    parser = ap()
+    parser.add_argument("t0", type=str)
+    parser.add_argument("t1", type=str)
+    parser.add_argument("--delta-trig", type=grid, default=grid("10:100:50"), help="lo:hi:n or a,b,c [ns]")
+    parser.add_argument("--offset", type=grid, default=grid("-5:5:20"), help="lo:hi:n or a,b,c [coarse ticks]")
+    parser.add_argument("--output", type=str, default="tof_scan.npz")
+    args = parser.parse_args()
+
+    scan = get_tof_scan(args.t0, args.t1, args.delta_trig, args.offset)
+    np.savez_compressed(args.output, **scan)
+    plot_scan(scan, args.output.rsplit(".", 1)[0] + ".png")
+
+    a, o = np.unravel_index(np.argmax(scan["n_tofs"]), scan["n_tofs"].shape)
+    print(f"{len(args.delta_trig)}x{len(args.offset)} grid saved to {args.output};"
+          f" most TOFs ({scan['n_tofs'][a, o]}) at delta_trig={scan['delta_trig'][a]:g}"
+          f" offset={scan['offset'][o]:g}")
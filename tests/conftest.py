@@ -0,0 +1,28 @@
+import os
+import sys
+
+import pytest
+
+# the modules live at the top of the repository, next to the scripts
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+@pytest.fixture
+def standin(monkeypatch):
+    """start(source) serves source in-process and points ifbeam_fetch at it, without the disk cache"""
+    import ifbeam_fetch
+    import ifbeam_standin
+    monkeypatch.setenv("IFBEAM_NO_CACHE", "1")
+    servers = []
+    old_url = ifbeam_fetch.IFBEAM_URL
+
+    def start(source):
+        server, url = ifbeam_standin.serve_in_thread(source)
+        servers.append(server)
+        ifbeam_fetch.set_base_url(url)
+        return url
+
+    yield start
+    ifbeam_fetch.set_base_url(old_url)
+    for server in servers:
+        server.shutdown()
@@ -0,0 +1,61 @@
+"""Exports of overlapping windows of the same label."""
+import numpy as np
+import pytest
+
+import beam_export
+import beam_pipeline
+import ifbeam_standin
+
+FORMATS = ["npy"] + (["arrow", "parquet"] if beam_export.pa is not None else [])
+
+
+@pytest.fixture
+def synthetic(standin):
+    standin(ifbeam_standin.SyntheticSource(particles_per_spill=30, seed=5))
+
+
+def export(root, t0, t1, fmt, label="r"):
+    beam_pipeline.fill_histograms(t0, t1, label, chunk_seconds=600,
+                                  export_dir=str(root), export_format=fmt)
+    return beam_export.read_columns(str(root), ["trig_ns", "tof"], labels=[label])
+
+
+@pytest.mark.parametrize("fmt", FORMATS)
+def test_reexport_replaces_rows(synthetic, tmp_path, fmt):
+    whole = export(tmp_path / "fresh", "2025-08-24T08:20:00-05:00", "2025-08-24T08:50:00-05:00", fmt)
+
+    # the second export starts earlier, so its shards and part names differ
+    root = tmp_path / "again"
+    export(root, "2025-08-24T08:25:00-05:00", "2025-08-24T08:50:00-05:00", fmt)
+    again = export(root, "2025-08-24T08:20:00-05:00", "2025-08-24T08:50:00-05:00", fmt)
+    assert len(again["trig_ns"]) == len(whole["trig_ns"]) > 0
+    order = np.lexsort((again["tof"], again["trig_ns"]))
+    ref = np.lexsort((whole["tof"], whole["trig_ns"]))
+    assert np.array_equal(again["trig_ns"][order], whole["trig_ns"][ref])
+    assert np.array_equal(again["tof"][order], whole["tof"][ref])
+
+
+@pytest.mark.parametrize("fmt", FORMATS)
+def test_reexport_keeps_rows_outside(synthetic, tmp_path, fmt):
+    # a shorter export inside an older one only replaces its own time range
+    whole = export(tmp_path / "fresh", "2025-08-24T08:00:00-05:00", "2025-08-24T08:30:00-05:00", fmt)
+    root = tmp_path / "again"
+    export(root, "2025-08-24T08:00:00-05:00", "2025-08-24T08:30:00-05:00", fmt)
+    again = export(root, "2025-08-24T08:10:00-05:00", "2025-08-24T08:15:00-05:00", fmt)
+    assert len(again["trig_ns"]) == len(whole["trig_ns"]) > 0
+    assert np.array_equal(np.sort(again["trig_ns"]), np.sort(whole["trig_ns"]))
+
+
+def test_load_histograms_exports_with_env(synthetic, tmp_path, monkeypatch):
+    # the analysis scripts export through load_histograms when BEAM_EXPORT_DIR is set
+    monkeypatch.chdir(tmp_path)
+    t0, t1 = "2025-08-24T08:00:00-05:00", "2025-08-24T08:10:00-05:00"
+    hists = beam_pipeline.load_histograms(t0, t1, "r")
+    assert not (tmp_path / "beam_tables").exists()
+    monkeypatch.setenv("BEAM_EXPORT_DIR", str(tmp_path / "beam_tables"))
+    monkeypatch.setenv("BEAM_EXPORT_FORMAT", "npy")
+    for _ in range(2):
+        # saved histograms are up to date, the run is filled again for its rows
+        assert beam_pipeline.load_histograms(t0, t1, "r").meta["entries"] == hists.meta["entries"] > 0
+        cols = beam_export.read_columns(str(tmp_path / "beam_tables"), ["trig_ns"], labels=["r"])
+        assert len(cols["trig_ns"]) == hists.meta["entries"]
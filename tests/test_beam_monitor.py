@@ -0,0 +1,24 @@
+"""Live monitor histograms against the batch pipeline on zero-padded rows."""
+import numpy as np
+
+import beam_monitor
+import beam_pipeline
+import ifbeam_cache
+import ifbeam_standin
+
+T0 = "2025-08-24T08:00:00-05:00"
+T1 = "2025-08-24T08:10:10-05:00"
+
+
+def test_monitor_equals_batch(standin):
+    standin(ifbeam_standin.SyntheticSource(seed=5, particles_per_spill=40, padding=3))
+    monitor = beam_monitor.BeamMonitor(T0)
+    start, end = ifbeam_cache.to_epoch(T0), ifbeam_cache.to_epoch(T1)
+    # polls at uneven times; the last one settles every trigger up to T1
+    for now in list(np.arange(start + 25.0, end, 47.0)) + [end + monitor.lag + monitor.settle]:
+        monitor.poll(now)
+    batch = beam_pipeline.fill_histograms(T0, T1, "r")
+    assert batch.meta["entries"] > 0
+    assert monitor.hists.meta["entries"] == batch.meta["entries"]
+    for name in batch.hists:
+        assert np.array_equal(monitor.hists[name].counts, batch[name].counts), name
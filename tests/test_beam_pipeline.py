@@ -0,0 +1,76 @@
+"""Shard-by-shard histograms against one pass over the whole window."""
+import numpy as np
+import pytest
+
+import beam_pipeline
+import ifbeam_standin
+
+T0 = "2025-08-24T08:00:00-05:00"
+T1 = "2025-08-24T08:40:00-05:00"
+
+
+class LateTriggerSource(ifbeam_standin.SyntheticSource):
+    """Synthetic beam whose GeneralTrigger rows are logged `delay` s after the
+    other counters of the spill, so some spills straddle a shard edge"""
+
+    def __init__(self, delay=30.0, **kwargs):
+        super().__init__(**kwargs)
+        self.delay_ms = int(delay*1000)
+
+    def rows(self, event, var, t0_ms, t1_ms):
+        if not var.startswith(ifbeam_standin.TDC_PREFIX):
+            return super().rows(event, var, t0_ms, t1_ms)
+        out = []
+        for row in super().rows(event, var, t0_ms - self.delay_ms, t1_ms - self.delay_ms):
+            # event,var,clock,units,values; the event itself has a comma
+            event_part, rest = row.split(f",{var},", 1)
+            clock, rest = rest.split(",", 1)
+            out.append(f"{event_part},{var},{int(clock) + self.delay_ms},{rest}")
+        return out
+
+
+@pytest.fixture(params=[(0.0, 0), (30.0, 0), (30.0, 3)], ids=["on-time", "late", "late-padded"])
+def late_standin(request, standin):
+    # delay 0: only the slow-control values differ at shard edges;
+    # padding: zero hits at the end of every counter row, as in the real rows
+    delay, padding = request.param
+    standin(LateTriggerSource(delay=delay, padding=padding, particles_per_spill=40,
+                              slow_period=30.0, seed=3))
+
+
+def test_shards_equal_whole_window(late_standin):
+    whole = beam_pipeline.fill_histograms(T0, T1, "r", chunk_seconds=3600)
+    sharded = beam_pipeline.fill_histograms(T0, T1, "r", chunk_seconds=575)
+    assert whole.meta["entries"] > 0
+    assert sharded.meta["entries"] == whole.meta["entries"]
+    for name in whole.hists:
+        a, b = whole[name], sharded[name]
+        assert np.array_equal(a.counts, b.counts), name
+        assert np.array_equal(getattr(a, "bins", None), getattr(b, "bins", None)), name
+
+
+def test_load_histograms_refills_when_stale(late_standin, tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    fills = []
+    fill = beam_pipeline.fill_histograms
+    monkeypatch.setattr(beam_pipeline, "fill_histograms",
+                        lambda *args, **kwargs: fills.append(kwargs) or fill(*args, **kwargs))
+    t1 = "2025-08-24T08:05:00-05:00"
+
+    # filled while the window was still live: filled again next time
+    with monkeypatch.context() as m:
+        m.setattr(beam_pipeline.ifbeam_cache, "LIVE_HORIZON", 1e12)
+        assert beam_pipeline.load_histograms(T0, t1, "r").meta["final"] is False
+    assert beam_pipeline.load_histograms(T0, t1, "r").meta["final"] is True
+    assert len(fills) == 2
+    beam_pipeline.load_histograms(T0, t1, "r")
+    assert len(fills) == 2
+
+    beam_pipeline.load_histograms(T0, t1, "r", delta_trig=40.0)
+    assert len(fills) == 3 and fills[-1]["delta_trig"] == 40.0
+    monkeypatch.setattr(beam_pipeline, "HIST_VERSION", beam_pipeline.HIST_VERSION + 1)
+    beam_pipeline.load_histograms(T0, t1, "r", delta_trig=40.0)
+    assert len(fills) == 4
+    monkeypatch.setattr(beam_pipeline.beam_hist, "TOF_EDGES", np.linspace(60, 90, 31))
+    assert beam_pipeline.load_histograms(T0, t1, "r", delta_trig=40.0)["tof"].counts.shape == (30,)
+    assert len(fills) == 5
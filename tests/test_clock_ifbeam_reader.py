@@ -0,0 +1,46 @@
+"""Sharded clock dumps against one pass over the same window."""
+import pytest
+
+import clock_ifbeam_reader
+import ifbeam_cache
+import ifbeam_standin
+
+T1 = "2025-08-24T08:03:05-05:00"
+
+
+@pytest.fixture
+def synthetic(standin):
+    # spills are logged on whole seconds (k*20 + 5 s), so with a t0 at :05 and
+    # 20 s shards the rows fall right on the shard edges
+    standin(ifbeam_standin.SyntheticSource(particles_per_spill=20, spill_length=5.0, seed=7))
+
+
+def read_rows(path):
+    with open(path) as fin:
+        return fin.read().splitlines()
+
+
+@pytest.mark.parametrize("t0", ["2025-08-24T08:00:05-05:00", "2025-08-24T08:00:05.500000-05:00"],
+                         ids=["whole", "fractional"])
+def test_shards_equal_one_pass(synthetic, tmp_path, monkeypatch, t0):
+    windows = []
+    shard_hits = clock_ifbeam_reader.shard_hits
+
+    def recording(counters, event, s0, s1, *args):
+        windows.append((s0, s1))
+        return shard_hits(counters, event, s0, s1, *args)
+
+    whole = tmp_path / "whole.csv"
+    n = clock_ifbeam_reader.dump_clocks("z,pdune", t0, T1, str(whole), shard_seconds=3600)
+    monkeypatch.setattr(clock_ifbeam_reader, "shard_hits", recording)
+    sharded = tmp_path / "sharded.csv"
+    assert clock_ifbeam_reader.dump_clocks("z,pdune", t0, T1, str(sharded), shard_seconds=20) == n > 0
+
+    assert len(windows) > 2
+    # the requests only take t0/t1 as given and whole seconds in between
+    assert windows[0][0] == t0 and windows[-1][1] == T1
+    for (_, s1), (s0, _) in zip(windows[:-1], windows[1:]):
+        assert s1 == s0 and ifbeam_cache.to_epoch(s1) % 1 == 0
+    rows = read_rows(sharded)
+    assert rows == read_rows(whole)
+    assert len(set(rows)) == len(rows)
@@ -0,0 +1,99 @@
+"""Chunk reuse, final/provisional chunks and eviction of the IFBeam cache."""
+import os
+import time
+
+import ifbeam_cache
+
+HOUR = 3600
+T0 = 1756040400                 # 2025-08-24T13:00:00Z, a chunk boundary
+EVENT = "z,pdune"
+VAR = "dip/acc/NORTH/NP02/BI/XCET/XCET021667:pressure"
+
+
+class Server:
+    """fetcher for IFBeamCache.fetch: one row every 10 minutes, requests recorded"""
+
+    def __init__(self):
+        self.requests = []
+        self.on_request = None
+
+    def __call__(self, var, event, t0, t1):
+        a, b = ifbeam_cache.to_epoch(t0), ifbeam_cache.to_epoch(t1)
+        self.requests.append((var, a, b))
+        if self.on_request is not None:
+            self.on_request(var, a, b)
+        first = int(-(-a // 600))*600
+        rows = [f"{event},{var},{t*1000},,{t % 7}" for t in range(first, int(b) + 1, 600)]
+        return ["Event,Variable,Clock,Units,Values"] + rows
+
+
+def clocks(lines):
+    return [ifbeam_cache.row_clock_ms(r)//1000 for r in lines[1:]]
+
+
+def test_chunks_are_reused(tmp_path):
+    cache = ifbeam_cache.IFBeamCache(tmp_path)
+    server = Server()
+    lines = cache.fetch(VAR, EVENT, T0 + 600, T0 + HOUR + 1200, server)
+    assert clocks(lines) == list(range(T0 + 600, T0 + HOUR + 1201, 600))
+    assert [r[1] for r in server.requests] == [T0, T0 + HOUR]
+
+    # a wider window only asks for the chunk it does not have yet
+    server.requests.clear()
+    lines = cache.fetch(VAR, EVENT, T0, T0 + 2*HOUR + 600, server)
+    assert clocks(lines) == list(range(T0, T0 + 2*HOUR + 601, 600))
+    assert [r[1] for r in server.requests] == [T0 + 2*HOUR]
+
+
+def test_final_and_provisional_chunks(tmp_path):
+    now = time.time()
+    live = int(now) // HOUR * HOUR
+    cache = ifbeam_cache.IFBeamCache(tmp_path, provisional_ttl=300)
+    server = Server()
+    cache.fetch(VAR, EVENT, T0, T0 + 600, server)
+    cache.fetch(VAR, EVENT, live, live + 600, server)
+    assert os.path.exists(cache._path(VAR, EVENT, T0, final=True))
+    provisional = cache._path(VAR, EVENT, live, final=False)
+    assert os.path.exists(provisional)
+
+    server.requests.clear()
+    cache.fetch(VAR, EVENT, T0, T0 + 600, server)
+    cache.fetch(VAR, EVENT, live, live + 600, server)
+    assert server.requests == []
+
+    # an expired provisional chunk is fetched again, a final one never
+    os.utime(provisional, (now - 400, now - 400))
+    cache.fetch(VAR, EVENT, T0, T0 + 600, server)
+    cache.fetch(VAR, EVENT, live, live + 600, server)
+    assert [r[1] for r in server.requests] == [live]
+
+
+def test_eviction_drops_least_recently_used(tmp_path):
+    server = Server()
+    cache = ifbeam_cache.IFBeamCache(tmp_path, evict_interval=3600)
+    for k in range(4):
+        cache.fetch(VAR, EVENT, T0 + k*HOUR, T0 + k*HOUR + 600, server)
+    paths = [cache._path(VAR, EVENT, T0 + k*HOUR, final=True) for k in range(4)]
+    for k, path in enumerate(paths):
+        os.utime(path, (1000 + k, 1000 + k))
+    os.utime(paths[0], (2000, 2000))                  # chunk 0 was read last
+    size = os.path.getsize(paths[1])
+    cache.max_bytes = 2*size
+    cache.evict()                                     # within evict_interval: nothing happens
+    assert all(os.path.exists(p) for p in paths)
+    cache.evict(force=True)
+    assert [os.path.exists(p) for p in paths] == [True, False, False, True]
+
+
+def test_chunk_evicted_after_lookup_is_fetched_again(tmp_path):
+    cache = ifbeam_cache.IFBeamCache(tmp_path)
+    server = Server()
+    cache.fetch(VAR, EVENT, T0, T0 + 600, server)
+    first = cache._path(VAR, EVENT, T0, final=True)
+
+    # while the missing second chunk is fetched, another worker evicts the first one
+    server.on_request = lambda var, a, b: os.path.exists(first) and os.remove(first)
+    server.requests.clear()
+    lines = cache.fetch(VAR, EVENT, T0, T0 + HOUR + 600, server)
+    assert clocks(lines) == list(range(T0, T0 + HOUR + 601, 600))
+    assert sorted(r[1] for r in server.requests) == [T0, T0 + HOUR]
@@ -0,0 +1,52 @@
+"""parse_csv_ragged().as_int() against the per-value parser it replaced."""
+import warnings
+
+import numpy as np
+import pytest
+
+import ifbeam_csv
+
+HEADER = "Event,Variable,Clock,Units,Values"
+
+
+def parse_csv_value_reference(lines):
+    # parse_csv_value of the analysis scripts before the ragged parser; a
+    # value int() cannot take ends its row (inf raised OverflowError there)
+    values = []
+    for row in lines[1:]:  # skip header
+        parts = row.strip().split(",")
+        if len(parts) < 4:
+            continue
+        try:
+            for i in range(5, len(parts)):
+                val = int(float(parts[i]))
+                values.append(val)
+        except (ValueError, OverflowError):
+            continue
+    return values
+
+
+ROWS = {
+    "clean": ["1,2,3", "-4.7,5.9", "7"],
+    "nan": ["1,nan,3", "4,5", "NaN"],
+    "inf": ["1,2,inf", "-inf,5", "6"],
+    "garbage": ["1,x,3", "4,5", "", "6,7,"],
+    "mixed": ["1.5,nan,x", "2,inf,3,nan", "9"],
+}
+
+
+def csv_lines(values):
+    return [HEADER] + [f"z,pdune,v,{1000*(k+1)},," + v for k, v in enumerate(values)] + ["short,row"]
+
+
+@pytest.mark.parametrize("case", list(ROWS))
+def test_as_int_equals_reference(case):
+    lines = csv_lines(ROWS[case])
+    with warnings.catch_warnings():
+        warnings.simplefilter("error")
+        rv = ifbeam_csv.parse_csv_ragged(lines)
+        ints, rows = rv.as_int(return_rows=True)
+    assert ints.tolist() == parse_csv_value_reference(lines)
+    assert ints.dtype == np.int64
+    # the rows of the values kept are in order and point into the parsed rows
+    assert np.all(np.diff(rows) >= 0) and (len(rows) == 0 or rows.max() < len(rv))
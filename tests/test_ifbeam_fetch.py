@@ -0,0 +1,46 @@
+"""Prefetched responses only live as long as their prefetch scope."""
+import beam_pipeline
+import ifbeam_fetch
+import ifbeam_standin
+
+T0 = "2025-08-24T08:00:00-05:00"
+T1 = "2025-08-24T08:05:00-05:00"
+
+
+class BrokenSource(ifbeam_standin.SyntheticSource):
+    """Synthetic beam that answers HTTP 400 for the variables in broken"""
+
+    def __init__(self, **kwargs):
+        super().__init__(**kwargs)
+        self.broken = set()
+        self.requests = []
+
+    def rows(self, event, var, t0_ms, t1_ms):
+        self.requests.append(var)
+        if var in self.broken:
+            raise KeyError(var)
+        return super().rows(event, var, t0_ms, t1_ms)
+
+
+def test_failed_sibling_leaves_no_prefetched_rows(standin):
+    source = BrokenSource(seed=2, particles_per_spill=20)
+    standin(source)
+    seconds, frac, coarse = beam_pipeline.xcet_var_names("XCET021667")
+    source.broken.add(seconds)
+    assert beam_pipeline.get_xcet_values(T0, T1, "XCET021667")[3] is False
+    assert not ifbeam_fetch._prefetched
+
+    # the same window again is fetched afresh, not served the earlier FRAC/COARSE
+    source.broken.clear()
+    source.requests.clear()
+    values = beam_pipeline.get_xcet_values(T0, T1, "XCET021667")
+    assert values[3] is True and len(values[0]) > 0
+    assert sorted(source.requests) == sorted([seconds, frac, coarse])
+    assert not ifbeam_fetch._prefetched
+
+
+def test_lazy_dataset_drops_unused_prefetched_rows(standin):
+    standin(ifbeam_standin.SyntheticSource(seed=2, particles_per_spill=20))
+    ds = beam_pipeline.lazy_beaminfo(T0, T1)
+    assert len(ds["ckov1_status"]) > 0
+    assert not ifbeam_fetch._prefetched
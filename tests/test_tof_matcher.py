@@ -0,0 +1,165 @@
+"""match_tofs() against the nested-loop reference on synthetic streams."""
+import numpy as np
+import pytest
+
+import tof_matcher
+from ifbeam_synth import BeamSynth
+
+DELTA_TRIGS = [20.0, 60.0, 150.0]
+OFFSETS = [0.0, 3.0, -2.0, 0.25, 1.5]
+
+
+def synth_inputs(seed, n_spills=2):
+    # noise hits on every counter give near misses and several candidates per hit
+    synth = BeamSynth(seed=seed, particles_per_spill=15, spill_length=2e-5,
+                      noise_rate={c: 1e6 for c in ("GeneralTrigger", "XBTF022638A", "XBTF022638B",
+                                                   "XBTF022670A", "XBTF022670B")})
+    return synth.tof_inputs(n_spills=n_spills)
+
+
+def shuffle_hits(seconds, coarse, frac, rng):
+    # reorder whole hits: seconds has two entries per hit
+    order = rng.permutation(len(coarse))
+    pairs = np.asarray(seconds).reshape(-1, 2)[order].ravel()
+    return pairs, np.asarray(coarse)[order], np.asarray(frac)[order]
+
+
+def pad_rows(seconds, coarse, frac, row_length=7, padding=2):
+    # zero hits after every row_length hits, as in the zero-padded IFBeam rows
+    at = np.arange(row_length, len(coarse) + 1, row_length)
+    return (np.insert(seconds, np.repeat(2*at, 2*padding), 0),
+            np.insert(coarse, np.repeat(at, padding), 0),
+            np.insert(frac, np.repeat(at, padding), 0))
+
+
+def hits(*coarse, sec=100):
+    # one seconds/coarse/frac triple per counter, frac = 0
+    return [0, sec]*len(coarse), list(coarse), [0]*len(coarse)
+
+
+def ifbeam_reader_baseline(trig, tof_s, tof_c, tof_f, delta_trig):
+    # get_tofs()/check_valid_tof() of ifbeam_reader.py before the matcher,
+    # without the prints: the 2B delta uses tof2A_ns and every loop breaks
+    # at the first hit after its reference
+    trig_s, trig_c, trig_f = trig
+    fDownstreamToGenTrig = delta_trig
+    tofs = []
+    for i in range(len(trig_c)):
+        trig_sec = trig_s[i*2+1]
+        trig_ns  = trig_c[i]*8 + trig_f[i]/512.
+        if trig_sec == 0:
+            break
+        for j in range(len(tof_c[2])):
+            tof2A_sec = tof_s[2][j*2+1]
+            tof2A_ns  = tof_c[2][j]*8 + tof_f[2][j]/512.
+            if tof2A_sec == 0:
+                break
+            delta_2A = 1e9*(trig_sec-tof2A_sec) + trig_ns - tof2A_ns
+            if  delta_2A < 0.:
+                break
+            elif delta_2A > fDownstreamToGenTrig:
+                continue
+            check_valid_tof_baseline(tof2A_sec, tof2A_ns, tof_s[0],tof_c[0],tof_f[0],tofs)
+            check_valid_tof_baseline(tof2A_sec, tof2A_ns, tof_s[1],tof_c[1],tof_f[1],tofs)
+        for j in range(len(tof_c[3])):
+            tof2B_sec = tof_s[3][j*2+1]
+            tof2B_ns  = tof_c[3][j]*8 + tof_f[3][j]/512.
+            if tof2B_sec == 0:
+                break
+            delta_2B = 1e9*(trig_sec-tof2B_sec) + trig_ns - tof2A_ns
+            if  delta_2B < 0.:
+                break
+            elif delta_2B > fDownstreamToGenTrig:
+                continue
+            check_valid_tof_baseline(tof2B_sec, tof2B_ns, tof_s[0],tof_c[0],tof_f[0],tofs)
+            check_valid_tof_baseline(tof2B_sec, tof2B_ns, tof_s[1],tof_c[1],tof_f[1],tofs)
+    return tofs
+
+
+def check_valid_tof_baseline(tof_ref_sec, tof_ref_ns, tof_s, tof_c, tof_f, tofs: []):
+    fUpstreamToDownstream =  500.
+    for k in range(len(tof_c)):
+        tof_sec = tof_s[k*2+1]
+        tof_ns  = tof_c[k]*8 + tof_f[k]/512.
+        if tof_sec == 0:
+            break
+        delta = 1e9*(tof_ref_sec-tof_sec) + tof_ref_ns - tof_ns
+        if  delta < 0.:
+            break
+        elif delta > fUpstreamToDownstream:
+            continue
+        elif delta>0 and delta < fUpstreamToDownstream:
+            tofs.append(delta)
+
+
+def check_same(trig, tof_s, tof_c, tof_f, delta_trig, offset):
+    ref = tof_matcher.match_tofs_reference(trig, tof_s, tof_c, tof_f, delta_trig, offset)
+    new = tof_matcher.match_tofs(trig, tof_s, tof_c, tof_f, delta_trig, offset)
+    assert new.tolist() == ref
+
+
+@pytest.mark.parametrize("offset", OFFSETS)
+@pytest.mark.parametrize("delta_trig", DELTA_TRIGS)
+def test_sorted(delta_trig, offset):
+    trig, tof_s, tof_c, tof_f = synth_inputs(1)
+    assert len(tof_matcher.match_tofs(trig, tof_s, tof_c, tof_f, delta_trig, offset)) > 0
+    check_same(trig, tof_s, tof_c, tof_f, delta_trig, offset)
+
+
+@pytest.mark.parametrize("offset", OFFSETS)
+@pytest.mark.parametrize("delta_trig", DELTA_TRIGS)
+def test_shuffled(delta_trig, offset):
+    rng = np.random.default_rng(2)
+    trig, tof_s, tof_c, tof_f = synth_inputs(2)
+    trig = shuffle_hits(*trig, rng)
+    for n in range(4):
+        tof_s[n], tof_c[n], tof_f[n] = shuffle_hits(tof_s[n], tof_c[n], tof_f[n], rng)
+    check_same(trig, tof_s, tof_c, tof_f, delta_trig, offset)
+
+
+@pytest.mark.parametrize("counter", [None, 0, 1, 2, 3])
+def test_zero_padding_is_skipped(counter):
+    # the hits after a padded row still count; the reference loops stopped at the padding
+    trig, tof_s, tof_c, tof_f = synth_inputs(3)
+    padded = [list(trig), list(tof_s), list(tof_c), list(tof_f)]
+    if counter is None:
+        padded[0] = pad_rows(*trig)
+    else:
+        padded[1][counter], padded[2][counter], padded[3][counter] = \
+            pad_rows(tof_s[counter], tof_c[counter], tof_f[counter])
+    for delta_trig in DELTA_TRIGS:
+        ref = tof_matcher.match_tofs_reference(trig, tof_s, tof_c, tof_f, delta_trig, 0.5)
+        assert tof_matcher.match_tofs(*padded, delta_trig, 0.5).tolist() == ref
+        assert len(tof_matcher.match_tofs_reference(*padded, delta_trig, 0.5)) < len(ref)
+
+
+def test_ifbeam_reader_baseline_2B_bug():
+    # trigger at 1000 ns, 2A 32 ns and 2B 40 ns before it, 1A 168/160 ns before those;
+    # the second 2A hit comes after the trigger
+    trig = hits(125)
+    tof_s, tof_c, tof_f = zip(hits(100), hits(10, sec=50), hits(121, 150), hits(120))
+    tof_s, tof_c, tof_f = list(tof_s), list(tof_c), list(tof_f)
+    expected = [168.0, 160.0]
+    assert tof_matcher.match_tofs(trig, tof_s, tof_c, tof_f, 60.0).tolist() == expected
+    assert tof_matcher.match_tofs_reference(trig, tof_s, tof_c, tof_f, 60.0) == expected
+    # the old ifbeam_reader loops took the 2B delta against the last 2A hit (1200 ns), so
+    # the 2B coincidence was lost, and without any 2A hit they failed altogether
+    assert ifbeam_reader_baseline(trig, tof_s, tof_c, tof_f, 60.0) == [168.0]
+    tof_s[2], tof_c[2], tof_f[2] = [], [], []
+    assert tof_matcher.match_tofs(trig, tof_s, tof_c, tof_f, 60.0).tolist() == [160.0]
+    with pytest.raises(UnboundLocalError):
+        ifbeam_reader_baseline(trig, tof_s, tof_c, tof_f, 60.0)
+
+
+def test_scan_equals_direct_matches():
+    trig, tof_s, tof_c, tof_f = synth_inputs(4)
+    trig_times = tof_matcher.decode_counter(*trig)
+    tof_times = [tof_matcher.decode_counter(tof_s[n], tof_c[n], tof_f[n]) for n in range(4)]
+    edges = np.linspace(0, 500, 51)
+    scan = tof_matcher.scan_tof_times(trig_times, tof_times, DELTA_TRIGS, OFFSETS, edges)
+    for a, delta_trig in enumerate(DELTA_TRIGS):
+        for b, offset in enumerate(OFFSETS):
+            direct = tof_matcher.match_tof_times(tof_matcher.decode_counter(*trig, offset=offset),
+                                                 tof_times, delta_trig)
+            assert scan["n_tofs"][a, b] == len(direct)
+            assert scan["hist"][a, b].tolist() == np.histogram(direct, edges)[0].tolist()
@@ -0,0 +1,308 @@
+"""Sort-merge TOF coincidence matching for the IFBeam counters.
+
+The counters come from get_relevant_values(): seconds[] holds two entries per
+hit (the second one is the time in seconds), coarse[] and frac[] one entry per
+hit.  Entries with seconds == 0 are the zero padding of a logged row and are
+skipped (see ifbeam_time).
+
+match_tofs() gives the same TOF values, in the same order, as the nested loops
+in get_tofs()/check_valid_tof() (kept here as match_tofs_reference()), but
+finds the candidates with a binary search over sorted timestamps, so the cost
+is O((N+M) log M) instead of O(N_trig x N_down x N_up).  Times are decoded
+once per counter with ifbeam_time.  The loops stop at the first seconds == 0
+instead, and so lost every hit logged after a padded row; on streams without
+padding the two agree.
+"""
+import numpy as np
+
+import ifbeam_stats
+import ifbeam_time
+
+DOWNSTREAM_TO_GEN_TRIG = 60.0
+UPSTREAM_TO_DOWNSTREAM = 500.0
+XCET_TO_TRIG = 500.0
+
+
+def decode_counter(seconds, coarse, frac, offset=0.0):
+    """Decode one XTOF/GeneralTrigger counter, without its padding entries"""
+    return ifbeam_time.decode_times(seconds, coarse, frac, offset=offset, stride=2)
+
+
+def _expand(starts, counts):
+    """Flatten the ranges [starts[i], starts[i]+counts[i]) into (owner, index) arrays"""
+    counts = np.asarray(counts, dtype=np.int64)
+    owner = np.repeat(np.arange(len(counts)), counts)
+    # index = starts[owner] + (position - first position of owner), in place
+    index = np.arange(len(owner), dtype=np.int64)
+    index += (np.asarray(starts, dtype=np.int64) - (np.cumsum(counts) - counts))[owner]
+    return owner, index
+
+
+def window_pairs(ref, other, window):
+    """All (i, j) with 0 < delta < window, delta = time(ref[i]) - time(other[j]).
+
+    ref and other are ifbeam_time.CounterTimes.  Returns (i, j, delta) sorted
+    by i then j.
+    """
+    empty = np.zeros(0, dtype=np.int64)
+    if len(ref) == 0 or len(other) == 0:
+        return empty, empty, np.zeros(0)
+
+    # hits are normally logged in time order; then no sort is needed and the
+    # pairs come out sorted by i then j already
+    in_order = bool(np.all(other.ns[1:] >= other.ns[:-1]))
+    order = None if in_order else np.argsort(other.ns, kind="stable")
+    sorted_ns = other.ns if in_order else other.ns[order]
+
+    # search on the integer ns; the sub-ns part is < 1 so a 2 ns margin keeps every candidate
+    lo = np.searchsorted(sorted_ns, ref.ns - int(np.ceil(window)) - 2, side="left")
+    hi = np.searchsorted(sorted_ns, ref.ns + 2, side="right")
+    i, j = _expand(lo, hi - lo)
+    del lo, hi
+    if not in_order:
+        j = order[j]
+
+    delta = ref.delta(i, other, j)
+    keep = (delta > 0) & (delta < window)
+    i, j, delta = i[keep], j[keep], delta[keep]
+    ifbeam_stats.count("window_pairs", candidates=len(keep), pairs=len(i))
+    if in_order:
+        return i, j, delta
+    idx = np.lexsort((j, i))
+    return i[idx], j[idx], delta[idx]
+
+
+def match_tofs(trig, tof_s, tof_c, tof_f, delta_trig=DOWNSTREAM_TO_GEN_TRIG, offset=0.0,
+               upstream_window=UPSTREAM_TO_DOWNSTREAM):
+    """TOF values for the trigger counter and the four XBTF counters.
+
+    trig is (seconds, coarse, frac) of GeneralTrigger, tof_s/tof_c/tof_f the
+    lists for [1A, 1B, 2A, 2B] as built in get_tofs().  Returns a float64
+    array with the TOFs in get_tofs() order: per trigger, the 2A matches then
+    the 2B matches, and for each of those the 1A then the 1B coincidences.
+    """
+    trig_times = decode_counter(*trig, offset=offset)
+    tof_times = [decode_counter(tof_s[n], tof_c[n], tof_f[n]) for n in range(4)]
+    return match_tof_times(trig_times, tof_times, delta_trig, upstream_window)
+
+
+@ifbeam_stats.timed("match_tofs")
+def match_tof_times(trig_times, tof_times, delta_trig=DOWNSTREAM_TO_GEN_TRIG,
+                    upstream_window=UPSTREAM_TO_DOWNSTREAM, return_trigger=False):
+    """match_tofs() on already decoded CounterTimes ([1A, 1B, 2A, 2B] for tof_times).
+
+    With return_trigger, also returns the index in trig_times of the trigger
+    each TOF belongs to.
+    """
+    # one block per downstream counter (2A, then 2B), each in (trigger, downstream
+    # hit, 1A before 1B, upstream hit) order; the blocks are merged by trigger below
+    owners, values = [], []
+    for n in (2, 3):
+        trig_i, down_j, _ = window_pairs(trig_times, tof_times[n], delta_trig)
+
+        # upstream-to-downstream pairs, computed once per downstream hit
+        j_list, deltas, counter = [], [], []
+        for u in (0, 1):
+            j, _, delta = window_pairs(tof_times[n], tof_times[u], upstream_window)
+            j_list.append(j)
+            deltas.append(delta)
+            counter.append(np.full(len(j), u, dtype=np.int8))
+        up_j = np.concatenate(j_list)
+        up_delta = np.concatenate(deltas)
+        # stable sort on the downstream hit keeps 1A before 1B and k ascending
+        idx = np.lexsort((np.concatenate(counter), up_j))
+        up_j, up_delta = up_j[idx], up_delta[idx]
+        del j_list, deltas, counter, idx
+
+        # emit, per matched (trigger, downstream hit), its upstream coincidences
+        lo = np.searchsorted(up_j, down_j, side="left")
+        hi = np.searchsorted(up_j, down_j, side="right")
+        owner, pos = _expand(lo, hi - lo)
+        owners.append(trig_i[owner])
+        values.append(up_delta[pos])
+        del trig_i, down_j, up_j, up_delta, lo, hi, owner, pos
+
+    owner = np.concatenate(owners)
+    vals = np.concatenate(values)
+    del owners, values
+    order = np.argsort(owner, kind="stable")
+    ifbeam_stats.count("match_tofs", matches=len(vals))
+    if return_trigger:
+        return vals[order], owner[order]
+    return vals[order]
+
+
+# -------------------------------
+# delta_trig / offset calibration scan
+# -------------------------------
+@ifbeam_stats.timed("scan_tof_times")
+def scan_tof_times(trig_times, tof_times, delta_trigs, offsets, tof_edges=None,
+                   upstream_window=UPSTREAM_TO_DOWNSTREAM):
+    """match_tof_times() for a whole grid of delta_trig and trigger offset values.
+
+    trig_times are decoded without offset; an offset o (coarse ticks) moves
+    every trigger by 8*o ns.  The trigger-downstream pairs are found once for
+    the widest window, with the triggers moved by the largest offset, and
+    sorted by their delta; the grid point (dt, o) keeps the pairs with
+    8*(o_max - o) < delta < dt + 8*(o_max - o), a contiguous range of the
+    sorted table.  Counts and TOF histograms per grid point then come from
+    prefix sums and binary searches on that table.
+
+    Returns a dict with n_pairs and n_tofs [len(delta_trigs), len(offsets)],
+    hist [len(delta_trigs), len(offsets), len(tof_edges)-1] and the grid axes.
+    """
+    delta_trigs = np.asarray(delta_trigs, dtype=np.float64)
+    offsets = np.asarray(offsets, dtype=np.float64)
+    tof_edges = np.linspace(60, 90, 61) if tof_edges is None else np.asarray(tof_edges, dtype=np.float64)
+    o_max = offsets.max()
+    window = delta_trigs.max() + 8.0*(o_max - offsets.min())
+    ref = trig_times.shifted(8.0*o_max)
+
+    # per downstream hit (2A then 2B): its upstream TOFs and their bins
+    pair_delta, pair_n, pair_j = [], [], []
+    up_tofs = []
+    for d, n in enumerate((2, 3)):
+        _, j, delta = window_pairs(ref, tof_times[n], window)
+        pair_delta.append(delta)
+        pair_n.append(np.full(len(j), d))
+        pair_j.append(j)
+        up_j, up_delta = [], []
+        for u in (0, 1):
+            jj, _, dd = window_pairs(tof_times[n], tof_times[u], upstream_window)
+            up_j.append(jj)
+            up_delta.append(dd)
+        up_tofs.append((np.concatenate(up_j), np.concatenate(up_delta)))
+    pair_delta = np.concatenate(pair_delta)
+    pair_n = np.concatenate(pair_n)
+    pair_j = np.concatenate(pair_j)
+    order = np.argsort(pair_delta, kind="stable")
+    pair_delta, pair_n, pair_j = pair_delta[order], pair_n[order], pair_j[order]
+
+    # TOF entries of every pair, tagged with the rank of the pair in the sorted table
+    nbins = len(tof_edges) - 1
+    n_up = np.zeros(len(pair_delta), dtype=np.int64)
+    keys = []
+    for d in (0, 1):
+        up_j, up_delta = up_tofs[d]
+        idx = np.argsort(up_j, kind="stable")
+        up_j, up_delta = up_j[idx], up_delta[idx]
+        sel = np.flatnonzero(pair_n == d)
+        lo = np.searchsorted(up_j, pair_j[sel], side="left")
+        hi = np.searchsorted(up_j, pair_j[sel], side="right")
+        n_up[sel] = hi - lo
+        owner, pos = _expand(lo, hi - lo)
+        tof = up_delta[pos]
+        b = np.searchsorted(tof_edges, tof, side="right") - 1
+        b[tof == tof_edges[-1]] = nbins - 1          # last bin includes its right edge
+        inside = (b >= 0) & (b < nbins)
+        keys.append(b[inside]*(len(pair_delta) + 1) + sel[owner[inside]])
+    keys = np.sort(np.concatenate(keys))
+    cum_up = np.concatenate([[0], np.cumsum(n_up)])
+
+    # pair range [lo, hi) of every grid point
+    shift = 8.0*(o_max - offsets)                                    # [n_off]
+    lo = np.searchsorted(pair_delta, shift, side="right")            # delta > shift
+    hi = np.searchsorted(pair_delta, delta_trigs[:, None] + shift[None, :], side="left")
+    hi = np.maximum(hi, lo[None, :])
+    lo = np.broadcast_to(lo[None, :], hi.shape)
+
+    base = np.arange(nbins)*(len(pair_delta) + 1)
+    hist = np.searchsorted(keys, base + hi[..., None], side="left") - \
+        np.searchsorted(keys, base + lo[..., None], side="left")
+    return {"delta_trig": delta_trigs, "offset": offsets, "tof_edges": tof_edges,
+            "n_pairs": hi - lo, "n_tofs": cum_up[hi] - cum_up[lo], "hist": hist}
+
+
+# -------------------------------
+# XCET (Cherenkov) association
+# -------------------------------
+@ifbeam_stats.timed("nearest_within")
+def nearest_within(ref, other, window):
+    """For every ref time, the nearest other time with |delta| < window.
+
+    ref and other are CounterTimes.  Returns (index, delta): index into other
+    (-1 if nothing is inside the window) and delta = time(ref) - time(other)
+    (-1.0 if no match).  One binary search per ref over sorted other times.
+    """
+    n = len(ref)
+    index = np.full(n, -1, dtype=np.int64)
+    delta = np.full(n, -1.0)
+    if n == 0 or len(other) == 0:
+        return index, delta
+
+    order = np.argsort(other.ns, kind="stable")
+    sorted_ns = other.ns[order]
+    pos = np.searchsorted(sorted_ns, ref.ns)
+    best = np.full(n, np.inf)
+    # the nearest hit is one of the neighbours of the insertion point; two on
+    # each side cover hits sharing the same integer ns
+    for shift in (-2, -1, 0, 1):
+        cand = pos + shift
+        ok = (cand >= 0) & (cand < len(sorted_ns))
+        r = np.flatnonzero(ok)
+        j = order[cand[ok]]
+        d = ref.delta(r, other, j)
+        better = (np.abs(d) < window) & (np.abs(d) < best[r])
+        r, j, d = r[better], j[better], d[better]
+        best[r] = np.abs(d)
+        index[r] = j
+        delta[r] = d
+    if ifbeam_stats.ENABLED:
+        ifbeam_stats.count("nearest_within", candidates=4*n, matches=int(np.count_nonzero(index >= 0)))
+    return index, delta
+
+
+def associate_xcet(ref, xcet, fetched=True, window=XCET_TO_TRIG):
+    """Cherenkov status and delta for every reference (trigger) time.
+
+    status is 1 if an XCET hit is within window ns, 0 if not and -1 if the
+    XCET timestamps could not be fetched; delta is trigger - XCET time in ns,
+    -1.0 without a match.
+    """
+    if not fetched:
+        return np.full(len(ref), -1, dtype=np.int8), np.full(len(ref), -1.0)
+    index, delta = nearest_within(ref, xcet, window)
+    return (index >= 0).astype(np.int8), delta
+
+
+# -------------------------------
+# Reference implementation
+# -------------------------------
+def match_tofs_reference(trig, tof_s, tof_c, tof_f, delta_trig=DOWNSTREAM_TO_GEN_TRIG, offset=0.0):
+    """The original nested-loop matching from get_tofs(), for cross-checks
+    (it stops at the first seconds == 0, see the module docstring)"""
+    trig_s, trig_c, trig_f = trig
+    fDownstreamToGenTrig = delta_trig
+    tofs = []
+    for i in range(len(trig_c)):
+        trig_sec = trig_s[i*2+1]
+        trig_ns  = (trig_c[i]+offset)*8 + trig_f[i]/512.0
+        if trig_sec == 0: break
+        for j in range(len(tof_c[2])):
+            tof2A_sec = tof_s[2][j*2+1]
+            tof2A_ns  = tof_c[2][j]*8 + tof_f[2][j]/512.0
+            if tof2A_sec == 0: break
+            delta_2A = 1e9*(trig_sec-tof2A_sec) + trig_ns - tof2A_ns
+            if 0 < delta_2A < fDownstreamToGenTrig:
+                check_valid_tof_reference(tof2A_sec,tof2A_ns,tof_s[0],tof_c[0],tof_f[0],tofs)
+                check_valid_tof_reference(tof2A_sec,tof2A_ns,tof_s[1],tof_c[1],tof_f[1],tofs)
+        for j in range(len(tof_c[3])):
+            tof2B_sec = tof_s[3][j*2+1]
+            tof2B_ns  = tof_c[3][j]*8 + tof_f[3][j]/512.0
+            if tof2B_sec == 0: break
+            delta_2B = 1e9*(trig_sec-tof2B_sec) + trig_ns - tof2B_ns
+            if 0 < delta_2B < fDownstreamToGenTrig:
+                check_valid_tof_reference(tof2B_sec,tof2B_ns,tof_s[0],tof_c[0],tof_f[0],tofs)
+                check_valid_tof_reference(tof2B_sec,tof2B_ns,tof_s[1],tof_c[1],tof_f[1],tofs)
+    return tofs
+
+
+def check_valid_tof_reference(tof_ref_sec, tof_ref_ns, tof_s, tof_c, tof_f, tofs: []):
+    fUpstreamToDownstream = UPSTREAM_TO_DOWNSTREAM
+    for k in range(len(tof_c)):
+        tof_sec = tof_s[k*2+1]
+        tof_ns  = tof_c[k]*8 + tof_f[k]/512.0
+        if tof_sec == 0: break
+        delta = 1e9*(tof_ref_sec-tof_sec) + tof_ref_ns - tof_ns
+        if 0 < delta < fUpstreamToDownstream:
+            tofs.append(delta)